@@ -27,6 +27,8 @@ from src.error_handler import ErrorHandler
 
 # 导入命令模块
 from src.command import mai_base, mai_alias, mai_guess, mai_score, mai_search, mai_table
+from src.libraries.render import renderer
+from src.libraries.render_cache import render_cache
 
 
 @register("astrbot_plugin_maimaidx", "AbyssSeeker", "MaimaiDX 插件 - 舞萌DX查询工具", "1.0.0", "https://github.com/AbyssSeeker/astrbot_plugin_maimaidx")
@@ -42,10 +44,17 @@ class MaimaiDXPlugin(Star):
         
         # 初始化组件
         self.config_manager = ConfigManager(context)
-        self.data_manager = DataManager(self.plugin_root)
+        self.data_manager = DataManager(
+            self.plugin_root, 
+            auto_update_tables=self.config_manager.is_auto_update_tables_enabled()
+        )
         self.output_manager = OutputManager(self.plugin_root)
         self.error_handler = ErrorHandler()
         
+        # 启用绘图结果磁盘缓存
+        if (disk_mb := self.config_manager.get_render_cache_disk_mb()) > 0:
+            render_cache.enable_disk(self.plugin_root / 'cache' / 'render', disk_mb * 1024 * 1024)
+        
         # 启动数据初始化任务
         asyncio.create_task(self._initialize_plugin())
         
@@ -88,6 +97,7 @@ class MaimaiDXPlugin(Star):
   /maimai minfo [用户名] [曲名/ID] - 查询游玩数据
   /maimai ginfo [难度] [曲名/ID]   - 查询曲目统计
   /maimai score [难度] [ID] [分数]   - 分数线计算
+  /maimai whatif [用户名] [难度+ID] [成绩] ... - 假设成绩的Rating变化
   /maimai today [用户ID]          - 今日舞萌运势
 
 🔍 搜索命令：
@@ -105,8 +115,8 @@ class MaimaiDXPlugin(Star):
 
 🛠️ 管理命令：
   /maimai update_alias            - 更新别名库
-  /maimai update_rating_table     - 更新定数表
-  /maimai update_plate_table      - 更新完成表
+  /maimai update_rating_table [force] - 更新定数表
+  /maimai update_plate_table [force]  - 更新完成表
   /maimai init                    - 重新初始化曲库数据
 
 💡 提示：基于Yuri-YuzuChaN的maimaiDX，由AbyssSeeker移植
@@ -136,8 +146,7 @@ class MaimaiDXPlugin(Star):
             if isinstance(result, str):
                 yield event.plain_result(result)
             else:
-                # 假设返回的是图片路径
-                yield event.image_result(str(result))
+                yield await self.output_manager.image_result(event, result)
                 
         except Exception as e:
             error_msg = self.error_handler.handle_error(event, e, "获取今日运势失败")
@@ -181,8 +190,7 @@ class MaimaiDXPlugin(Star):
             if isinstance(result, str):
                 yield event.plain_result(result)
             else:
-                # 假设返回的是图片
-                await self.output_manager.send_image_result(event, result, f"b50_{username_or_error}.png")
+                yield await self.output_manager.image_result(event, result, 'table')
                 
         except Exception as e:
             error_msg = self.error_handler.handle_error(event, e, "查询B50失败")
@@ -212,8 +220,7 @@ class MaimaiDXPlugin(Star):
             if isinstance(result, str):
                 yield event.plain_result(result)
             else:
-                # 假设返回的是图片
-                await self.output_manager.send_image_result(event, result, f"minfo_{username_or_error}_{song}.png")
+                yield await self.output_manager.image_result(event, result)
                 
         except Exception as e:
             error_msg = self.error_handler.handle_error(event, e, "查询游玩记录失败")
@@ -243,8 +250,7 @@ class MaimaiDXPlugin(Star):
             if isinstance(result, str):
                 yield event.plain_result(result)
             else:
-                # 假设返回的是图片
-                await self.output_manager.send_image_result(event, result, f"ginfo_{difficulty_or_error}_{song}.png")
+                yield await self.output_manager.image_result(event, result)
                 
         except Exception as e:
             error_msg = self.error_handler.handle_error(event, e, "查询曲目信息失败")
@@ -271,6 +277,33 @@ class MaimaiDXPlugin(Star):
             error_msg = self.error_handler.handle_error(event, e, "计算分数线失败")
             yield event.plain_result(error_msg)
     
+    @maimai_group.command("whatif")
+    async def maimai_whatif(self, event: AstrMessageEvent, username: str, *args):
+        """计算假设成绩带来的Rating变化"""
+        self._prepare_command(event)
+        
+        try:
+            # 确保数据准备就绪
+            if not await self.data_manager.ensure_data_ready():
+                yield event.plain_result("❌ 数据未准备就绪，请稍后重试")
+                return
+            
+            # 验证用户名
+            is_valid, username_or_error = self.error_handler.validate_username(username)
+            if not is_valid:
+                yield event.plain_result(f"❌ {username_or_error}")
+                return
+            
+            # 调用原始函数
+            result = await mai_score.whatif_cli(username_or_error, ' '.join(args))
+            
+            # 发送结果
+            yield event.plain_result(result)
+                
+        except Exception as e:
+            error_msg = self.error_handler.handle_error(event, e, "Rating模拟失败")
+            yield event.plain_result(error_msg)
+    
     # ==================== 搜索相关命令 ====================
     
     @maimai_group.command("search")
@@ -478,8 +511,8 @@ class MaimaiDXPlugin(Star):
     
     @maimai_group.command("update_rating_table")
     @filter.permission_type(PermissionType.ADMIN)
-    async def maimai_update_rating_table(self, event: AstrMessageEvent):
-        """更新定数表"""
+    async def maimai_update_rating_table(self, event: AstrMessageEvent, mode: str = ""):
+        """更新定数表，默认只重新绘制有变化的定数表，`force` 强制全部重新绘制"""
         self._prepare_command(event)
         
         try:
@@ -489,7 +522,7 @@ class MaimaiDXPlugin(Star):
                 return
             
             # 调用原始函数
-            await mai_table.update_rating_table_cli()
+            await mai_table.update_rating_table_cli(force=mode.strip().lower() == 'force')
             
             yield event.plain_result("✅ 定数表更新完成")
                 
@@ -499,8 +532,8 @@ class MaimaiDXPlugin(Star):
     
     @maimai_group.command("update_plate_table")
     @filter.permission_type(PermissionType.ADMIN)
-    async def maimai_update_plate_table(self, event: AstrMessageEvent):
-        """更新完成表"""
+    async def maimai_update_plate_table(self, event: AstrMessageEvent, mode: str = ""):
+        """更新完成表，默认只重新绘制有变化的完成表，`force` 强制全部重新绘制"""
         self._prepare_command(event)
         
         try:
@@ -510,7 +543,7 @@ class MaimaiDXPlugin(Star):
                 return
             
             # 调用原始函数
-            await mai_table.update_plate_table_cli()
+            await mai_table.update_plate_table_cli(force=mode.strip().lower() == 'force')
             
             yield event.plain_result("✅ 完成表更新完成")
                 
@@ -565,6 +598,8 @@ class MaimaiDXPlugin(Star):
         try:
             # 清理临时文件
             self.output_manager.cleanup_temp_files()
+            # 关闭绘图线程池并取消排队中的任务
+            renderer.shutdown()
             logger.info("MaimaiDX 插件已卸载")
         except Exception as e:
             logger.error(f"MaimaiDX 插件卸载时出错: {e}") 
\ No newline at end of file
@@ -20,12 +20,6 @@ public_addr = 'https://www.yuzuchan.moe/vote'
 import uuid
 UUID = uuid.uuid1()
 
-# echartsjs
-SNAPSHOT_JS = (
-    "echarts.getInstanceByDom(document.querySelector('div[_echarts_instance_]'))."
-    "getDataURL({type: 'PNG', pixelRatio: 2, excludeComponents: ['toolbox']})"
-)
-
 # 文件路径 - 使用path_manager中的定义
 Root: Path = PLUGIN_ROOT
 static: Path = STATIC_DIR
@@ -38,13 +32,15 @@ music_file: Path = MUSIC_FILE                        # 曲目暂存文件
 chart_file: Path = CHART_FILE                        # 谱面数据暂存文件
 guess_file: Path = GUESS_FILE                        # 猜歌开关群文件
 group_alias_file: Path = GROUP_ALIAS_FILE            # 别名推送开关群文件
-pie_html_file: Path = PIE_HTML_FILE                  # 饼图html文件
 
 # 静态资源路径 - 使用path_manager中的定义
 maimaidir: Path = MAIMAI_DIR
 coverdir: Path = COVER_DIR
 ratingdir: Path = RATING_DIR
 platedir: Path = PLATE_DIR
+sprite_pack_file: Path = SPRITE_PACK_FILE
+cover_archive_file: Path = COVER_ARCHIVE_FILE
+recorddir: Path = RECORD_DIR
 
 # 字体路径 - 使用path_manager中的定义
 SIYUAN: Path = SIYUAN_FONT
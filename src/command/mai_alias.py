@@ -15,7 +15,7 @@ from ..libraries.maimaidx_model import Alias, PushAliasStatus
 from ..libraries.maimaidx_music import alias, mai, update_local_alias
 from ..libraries.maimaidx_music_info import draw_music_info
 
-from ..output_manager import OutputManager
+from ..output_manager import OutputManager, spool
 from ..error_handler import ErrorHandler
 
 # 初始化输出管理器和错误处理器
@@ -155,7 +155,7 @@ async def alias_status_handler(event, page: int = 1):
         result.append(f'第「{page}」页，共「{len(status) // SONGS_PER_PAGE + 1}」页')
         img = text_to_image('\n'.join(result))
         if isinstance(img, Image.Image):
-            return output_manager.send_image(event, img, f"alias_status_{page}.png", f"别名投票状态第{page}页")
+            return output_manager.send_image(event, img, f"alias_status_{page}.png", f"别名投票状态第{page}页", kind='text')
         else:
             return output_manager.send_text(event, str(img))
     except (ServerError, ValueError) as e:
@@ -286,9 +286,8 @@ async def alias_status_cli(page: int = 1):
                 )
         result.append(f'第「{page}」页，共「{len(status) // SONGS_PER_PAGE + 1}」页')
         img = text_to_image('\n'.join(result))
-        img_path = Path(f"alias_status_{page}.png")
         if isinstance(img, Image.Image):
-            img.save(img_path)
+            img_path = await spool.save_async(img, f"alias_status_{page}", kind='text')
             print(f"别名投票状态图片已保存到: {img_path}")
         else:
             print(img)
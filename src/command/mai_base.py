@@ -1,14 +1,19 @@
 import random
+import time
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 from pathlib import Path
 from ..libraries.config import Root, SHANGGUMONO, BOTNAME, log
-from ..libraries.image import image_to_base64, music_picture, text_to_image, tricolor_gradient, rounded_corners
+from ..libraries.image import (
+    draw_wrapped_text, get_font, image_to_base64, text_to_image, tricolor_gradient, rounded_cover
+)
 from ..libraries.maimaidx_api_data import maiApi
 from ..libraries.maimaidx_error import *
 from ..libraries.maimaidx_music import mai
 from ..libraries.maimaidx_music_info import draw_music_info
 from ..libraries.maimaidx_player_score import rating_ranking_data
+from ..libraries.render_cache import render_cache
 from ..libraries.tool import qqhash
+from ..output_manager import spool
 import PIL.Image
 
 # CLI 版全局变量
@@ -40,8 +45,7 @@ def draw_today_fortune_image(user_id, rp, wm_list, wm_value, music, ds):
         pass
     # 推荐曲绘
     try:
-        cover = Image.open(music_picture(music.id)).resize((340, 340))
-        cover = rounded_corners(cover, 36, (True, True, True, True))
+        cover = rounded_cover(music.id, (340, 340), 36)
         bg.paste(cover, (60, 100), cover)
     except Exception:
         pass
@@ -55,41 +59,10 @@ def draw_today_fortune_image(user_id, rp, wm_list, wm_value, music, ds):
     draw = ImageDraw.Draw(bg)
     
     # 字体
-    font_title = ImageFont.truetype(str(SHANGGUMONO), 48)
-    font_sub = ImageFont.truetype(str(SHANGGUMONO), 32)
-    font_text = ImageFont.truetype(str(SHANGGUMONO), 26)
-    font_small = ImageFont.truetype(str(SHANGGUMONO), 24)
-    
-    # 辅助函数：自动换行
-    def draw_wrapped_text(text, x, y, font, fill, max_width, line_height=None):
-        """绘制自动换行的文字"""
-        if line_height is None:
-            line_height = font.size + 4
-        
-        lines = []
-        current_line = ""
-        
-        for char in text:
-            test_line = current_line + char
-            if draw.textlength(test_line, font=font) <= max_width:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line)
-                    current_line = char
-                else:
-                    # 单个字符就超长了，强制添加
-                    lines.append(char)
-                    current_line = ""
-        
-        if current_line:
-            lines.append(current_line)
-        
-        # 绘制每一行
-        for i, line in enumerate(lines):
-            draw.text((x, y + i * line_height), line, font=font, fill=fill)
-        
-        return len(lines) * line_height
+    font_title = get_font(SHANGGUMONO, 48)
+    font_sub = get_font(SHANGGUMONO, 32)
+    font_text = get_font(SHANGGUMONO, 26)
+    font_small = get_font(SHANGGUMONO, 24)
     
     # 主标题阴影
     title_x, title_y = 440, 40
@@ -112,12 +85,12 @@ def draw_today_fortune_image(user_id, rp, wm_list, wm_value, music, ds):
     
     # 宜
     yi_text = f"宜：{'、'.join(y) if y else '无'}"
-    yi_height = draw_wrapped_text(yi_text, 440, current_y, font_text, (34,139,34), max_text_width)
+    yi_height = draw_wrapped_text(draw, (440, current_y), yi_text, font_text, (34,139,34), max_text_width)
     current_y += yi_height + 10
     
     # 忌
     ji_text = f"忌：{'、'.join(n) if n else '无'}"
-    ji_height = draw_wrapped_text(ji_text, 440, current_y, font_text, (220,20,60), max_text_width)
+    ji_height = draw_wrapped_text(draw, (440, current_y), ji_text, font_text, (220,20,60), max_text_width)
     current_y += ji_height + 15
     
     # 推荐曲目（自动换行）
@@ -126,7 +99,7 @@ def draw_today_fortune_image(user_id, rp, wm_list, wm_value, music, ds):
     
     # 曲目标题（自动换行）
     song_text = f"ID.{music.id} - {music.title}"
-    song_height = draw_wrapped_text(song_text, 440, current_y, font_text, (60,60,60), max_text_width)
+    song_height = draw_wrapped_text(draw, (440, current_y), song_text, font_text, (60,60,60), max_text_width)
     current_y += song_height + 10
     
     # 难度
@@ -136,27 +109,7 @@ def draw_today_fortune_image(user_id, rp, wm_list, wm_value, music, ds):
     # 提醒（自动换行）- 固定底部居中
     remind = f"{BOTNAME} Bot提醒：打机时不要大力拍打或滑动哦"
     remind_y = height - 60  # 距离底部60像素
-    def draw_centered_wrapped_text(text, y, font, fill, max_width):
-        lines = []
-        current_line = ""
-        for char in text:
-            test_line = current_line + char
-            if draw.textlength(test_line, font=font) <= max_width:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line)
-                    current_line = char
-                else:
-                    lines.append(char)
-                    current_line = ""
-        if current_line:
-            lines.append(current_line)
-        for i, line in enumerate(lines):
-            x = width // 2 - draw.textlength(line, font=font) // 2
-            draw.text((x, y + i * (font.size + 4)), line, font=font, fill=fill)
-        return len(lines) * (font.size + 4)
-    draw_centered_wrapped_text(remind, remind_y, font_small, (120,120,120), width-100)
+    draw_wrapped_text(draw, (width // 2, remind_y), remind, font_small, (120,120,120), width-100, align='center')
     
     # 签名（确保不超出右边界）
     signature = "Adapted by AbyssSeeker"
@@ -170,8 +123,7 @@ def draw_today_fortune_image(user_id, rp, wm_list, wm_value, music, ds):
 
 def maimaidxhelp_cli():
     help_img = Image.open((Root / 'maimaidxhelp.png'))
-    out_path = Path("help_image.png")
-    help_img.save(out_path)
+    out_path = spool.save(help_img, 'help_image')
     print(f"帮助图片已保存到: {out_path}")
 
 def maimaidxrepo_cli():
@@ -194,11 +146,11 @@ async def mai_today_cli(user_id=None):
     music = mai.total_list[h % len(mai.total_list)]
     ds = '/'.join([str(_) for _ in music.ds])
     # 渲染大图
-    img = draw_today_fortune_image(user_id, rp, wm_list, wm_value, music, ds)
-    img_path = Path(f"today_fortune_{user_id}.png")
-    img.save(img_path)
-    print(f"今日舞萌大图已保存到: {img_path}")
-    return img_path
+    img = await render_cache.render(
+        'today', (user_id, time.strftime('%Y-%m-%d')), 
+        draw_today_fortune_image, user_id, rp, wm_list, wm_value, music, ds, kind='card'
+    )
+    return img
 
 async def mai_what_cli(user_id, point=None):
     music = mai.total_list.random()
@@ -230,9 +182,8 @@ async def mai_what_cli(user_id, point=None):
             pass
     # 绘制并保存图片
     img = await draw_music_info(music, user_id, user)
-    img_path = Path(f"what_song_{music.id}.png")
-    if isinstance(img, PIL.Image.Image):
-        img.save(img_path)
+    if isinstance(img, bytes):
+        img_path = await spool.save_async(img, f"what_song_{music.id}")
         print(f"推荐曲目信息图片已保存到: {img_path}")
     else:
         print(img)
@@ -254,9 +205,8 @@ async def random_song_cli(user_id, diff, color, level):
             print(msg)
         else:
             img = await draw_music_info(music_data.random(), user_id)
-            img_path = Path(f"random_song_{level}_{diff or 'all'}.png")
-            if isinstance(img, PIL.Image.Image):
-                img.save(img_path)
+            if isinstance(img, bytes):
+                img_path = await spool.save_async(img, f"random_song_{level}_{diff or 'all'}")
                 print(f"随机曲目信息图片已保存到: {img_path}")
             else:
                 print(img)
@@ -271,9 +221,8 @@ async def rating_ranking_cli(user_id, args):
     else:
         name = args.lower()
     pic = await rating_ranking_data(name, page)
-    img_path = Path(f"rating_ranking_{name or page}.png")
     if isinstance(pic, PIL.Image.Image):
-        pic.save(img_path)
+        img_path = await spool.save_async(pic, f"rating_ranking_{name or page}", kind='text')
         print(f"排名图片已保存到: {img_path}")
     else:
         print(pic)
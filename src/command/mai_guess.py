@@ -7,7 +7,7 @@ import io
 from ..libraries.maimaidx_music import guess
 from ..libraries.maimaidx_music_info import draw_music_info
 
-from ..output_manager import OutputManager
+from ..output_manager import OutputManager, spool
 from ..error_handler import ErrorHandler
 
 # 初始化输出管理器和错误处理器
@@ -67,7 +67,7 @@ async def guess_music_handler(event):
                 img_data = guess.Group[gid].img
                 if isinstance(img_data, bytes):
                     # 保存图片到临时文件
-                    img_path = output_manager.save_image(Image.open(io.BytesIO(img_data)), f"guess_music_{gid}.png")
+                    img_path = output_manager.save_image(img_data, f"guess_music_{gid}")
                     await output_manager.send_text(event, f'7/7 这首歌封面的一部分\n答案将在30秒后揭晓')
                 else:
                     await output_manager.send_text(event, f'7/7 这首歌封面的一部分: {img_data}\n答案将在30秒后揭晓')
@@ -83,7 +83,7 @@ async def guess_music_handler(event):
                 
                 guess.Group[gid].end = True
                 answer_img = await draw_music_info(guess.Group[gid].music)
-                if isinstance(answer_img, Image.Image):
+                if isinstance(answer_img, bytes):
                     return await output_manager.send_image(event, answer_img, f"guess_answer_{gid}.png", "猜歌答案")
                 else:
                     return await output_manager.send_text(event, f"答案是：\n{answer_img}")
@@ -115,7 +115,7 @@ async def guess_pic_handler(event):
         img_data = guess.Group[gid].img
         if isinstance(img_data, bytes):
             # 保存图片到临时文件
-            img_path = output_manager.save_image(Image.open(io.BytesIO(img_data)), f"guess_pic_{gid}.png")
+            img_path = output_manager.save_image(img_data, f"guess_pic_{gid}")
             await output_manager.send_text(event, f'以下裁切图片是哪首谱面的曲绘\n请在30s内输入答案')
         else:
             await output_manager.send_text(event, f'以下裁切图片是哪首谱面的曲绘：{img_data}\n请在30s内输入答案')
@@ -131,7 +131,7 @@ async def guess_pic_handler(event):
         
         guess.Group[gid].end = True
         answer_img = await draw_music_info(guess.Group[gid].music)
-        if isinstance(answer_img, Image.Image):
+        if isinstance(answer_img, bytes):
             return await output_manager.send_image(event, answer_img, f"guess_pic_answer_{gid}.png", "猜曲绘答案")
         else:
             return await output_manager.send_text(event, f"答案是：\n{answer_img}")
@@ -161,7 +161,7 @@ async def guess_music_solve_handler(event, answer: str):
         if ans in guess.Group[gid].answer:
             guess.Group[gid].end = True
             answer_img = await draw_music_info(guess.Group[gid].music)
-            if isinstance(answer_img, Image.Image):
+            if isinstance(answer_img, bytes):
                 return await output_manager.send_image(event, answer_img, f"guess_solve_answer_{gid}.png", "猜对了！答案")
             else:
                 return await output_manager.send_text(event, f"猜对了，答案是：\n{answer_img}")
@@ -248,11 +248,9 @@ async def guess_music_cli(group_id: int):
             print(f'{cycle + 1}/7 这首歌{guess.Group[gid].options[cycle]}')
             await asyncio.sleep(8)
         else:
-            img_path = Path(f"guess_music_{gid}.png")
             img_data = guess.Group[gid].img
             if isinstance(img_data, bytes):
-                with open(img_path, 'wb') as f:
-                    f.write(img_data)
+                img_path = await spool.save_async(img_data, f"guess_music_{gid}")
                 print(f'7/7 这首歌封面的一部分已保存到: {img_path}\n答案将在30秒后揭晓')
             else:
                 print(f'7/7 这首歌封面的一部分: {img_data}\n答案将在30秒后揭晓')
@@ -265,9 +263,8 @@ async def guess_music_cli(group_id: int):
                     return
             guess.Group[gid].end = True
             answer_img = await draw_music_info(guess.Group[gid].music)
-            answer_path = Path(f"guess_answer_{gid}.png")
-            if isinstance(answer_img, Image.Image):
-                answer_img.save(answer_path)
+            if isinstance(answer_img, bytes):
+                answer_path = await spool.save_async(answer_img, f"guess_answer_{gid}")
                 print(f"答案图片已保存到: {answer_path}")
             else:
                 print(f"答案是：\n{answer_img}")
@@ -283,11 +280,9 @@ async def guess_pic_cli(group_id: int):
         print('该群已有正在进行的猜歌或猜曲绘')
         return
     guess.startpic(gid)
-    img_path = Path(f"guess_pic_{gid}.png")
     img_data = guess.Group[gid].img
     if isinstance(img_data, bytes):
-        with open(img_path, 'wb') as f:
-            f.write(img_data)
+        img_path = await spool.save_async(img_data, f"guess_pic_{gid}")
         print(f'以下裁切图片是哪首谱面的曲绘，图片已保存到: {img_path}\n请在30s内输入答案')
     else:
         print(f'以下裁切图片是哪首谱面的曲绘：{img_data}\n请在30s内输入答案')
@@ -300,9 +295,8 @@ async def guess_pic_cli(group_id: int):
             return
     guess.Group[gid].end = True
     answer_img = await draw_music_info(guess.Group[gid].music)
-    answer_path = Path(f"guess_pic_answer_{gid}.png")
-    if isinstance(answer_img, Image.Image):
-        answer_img.save(answer_path)
+    if isinstance(answer_img, bytes):
+        answer_path = await spool.save_async(answer_img, f"guess_pic_answer_{gid}")
         print(f"答案图片已保存到: {answer_path}")
     else:
         print(f"答案是：\n{answer_img}")
@@ -318,9 +312,8 @@ async def guess_music_solve_cli(group_id: int, answer: str):
     if ans in guess.Group[gid].answer:
         guess.Group[gid].end = True
         answer_img = await draw_music_info(guess.Group[gid].music)
-        answer_path = Path(f"guess_solve_answer_{gid}.png")
-        if isinstance(answer_img, Image.Image):
-            answer_img.save(answer_path)
+        if isinstance(answer_img, bytes):
+            answer_path = await spool.save_async(answer_img, f"guess_solve_answer_{gid}")
             print(f"猜对了，答案图片已保存到: {answer_path}")
         else:
             print(f"猜对了，答案是：\n{answer_img}")
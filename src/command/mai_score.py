@@ -9,7 +9,9 @@ from ..libraries.maimai_best_50 import generate, computeRa, dxScore, coloumWidth
 from ..libraries.maimaidx_music import mai
 from ..libraries.maimaidx_music_info import draw_music_play_data, draw_music_info
 from ..libraries.maimaidx_player_score import music_global_data
+from ..libraries.maimaidx_error import *
 from ..libraries.maimaidx_model import Notes1, Notes2
+from ..libraries.rating_model import load_rating_model
 
 from ..output_manager import OutputManager
 from ..error_handler import ErrorHandler
@@ -32,9 +34,9 @@ async def b50_handler(event, username=None):
             username = event.sender.name if hasattr(event, 'sender') else ""
         
         img = await generate(username or "")
-        if isinstance(img, Image.Image):
+        if isinstance(img, bytes):
             # 使用输出管理器保存和发送图片
-            result = await output_manager.send_image(event, img, f"b50_{username}.png", f"{username}的B50数据")
+            result = await output_manager.send_image(event, img, f"b50_{username}.png", f"{username}的B50数据", kind='table')
             return result
         else:
             result = await output_manager.send_text(event, str(img))
@@ -151,7 +153,7 @@ async def ginfo_handler(event, args: str):
             return result
 
         result = await draw_music_info(music, level_index)
-        if isinstance(result, Image.Image):
+        if isinstance(result, bytes):
             result = await output_manager.send_image(event, result, f"ginfo_{music.id}_{level_index}.png", f"{music.title}的曲目信息")
             return result
         else:
@@ -261,16 +263,26 @@ async def score_handler(event, args: str):
         result = await error_handler.handle_error(event, e, "分数线计算失败")
         return result
 
+async def whatif_handler(event, username: str, args: str):
+    """
+    假设成绩 Rating 变化命令处理器
+    
+    Args:
+        event: AstrBot 事件对象
+        username: 查分器用户名
+        args: 参数字符串，格式为 "难度+歌曲id 成绩"，可以有多组
+    """
+    try:
+        result = await whatif_cli(username, args)
+        return await output_manager.send_text(event, result)
+    except Exception as e:
+        result = await error_handler.handle_error(event, e, "Rating 模拟失败")
+        return result
+
 # 保留原有的CLI函数以保持向后兼容性
 async def b50_cli(username=None):
     """CLI版本的B50查询（已弃用，请使用b50_handler）"""
-    img = await generate(username or "")
-    if isinstance(img, Image.Image):
-        img_path = f"b50_{username}.png"
-        img.save(img_path)
-        print(f"B50图片已保存到: {img_path}")
-    else:
-        print(img)
+    return await generate(username or "")
 
 async def minfo_cli(username: str, args: str) -> Union[str, Image.Image]:
     """CLI版本的游玩记录查询（已弃用，请使用minfo_handler）"""
@@ -432,4 +444,44 @@ async def score_cli(args: str) -> str:
         '''
         return dedent(msg).strip()
     except Exception as e:
-        return f'计算时出错：{str(e)}'
\ No newline at end of file
+        return f'计算时出错：{str(e)}'
+
+async def whatif_cli(username: str, args: str) -> str:
+    """计算假设成绩带来的 Rating 变化，多组成绩按顺序依次提交"""
+    hypotheses = re.findall(r'([绿黄红紫白])\s*(\d+)\s+(\d+(?:\.\d+)?)', args)
+    if not hypotheses:
+        return dedent('''\
+            请输入难度+歌曲id和假设成绩，可以输入多组
+            例如：whatif 用户名 紫799 100.5 白11311 101
+        ''').strip()
+
+    level_labels = ['绿', '黄', '红', '紫', '白']
+    charts = []
+    for difficulty, song_id, achievement in hypotheses:
+        music = mai.total_list.by_id(song_id)
+        level_index = level_labels.index(difficulty)
+        if not music:
+            return f'未找到曲目：{song_id}'
+        if level_index >= len(music.ds):
+            return f'{music.title} 没有{difficulty}谱'
+        achievement = min(float(achievement), 101.0)
+        charts.append((music, level_index, achievement))
+
+    try:
+        model = await load_rating_model(username)
+    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError) as e:
+        return str(e)
+
+    rating, deltas = model.what_if(
+        (int(music.id), level_index, music.ds[level_index], achievement) for music, level_index, achievement in charts
+    )
+    lines = [f'当前 Rating：{model.rating}（B35 {model.b35.total} + B15 {model.b15.total}）']
+    for (music, level_index, achievement), delta in zip(charts, deltas):
+        ra, rate = computeRa(music.ds[level_index], achievement, israte=True)
+        title = changeColumnWidth(music.title, 24)
+        change = f'+{delta}' if delta else '无变化'
+        lines.append(
+            f'{level_labels[level_index]}{music.id}「{title}」{achievement:.4f}% {rate} 底分 {ra}：{change}'
+        )
+    lines.append(f'提交后 Rating：{rating}（{rating - model.rating:+d}）')
+    return '\n'.join(lines)
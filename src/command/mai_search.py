@@ -1,25 +1,29 @@
 import re
 from re import Match
-from typing import List, Tuple
+from typing import AsyncIterator, List, Tuple, Union
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 import random
 
 from ..libraries.config import Root, SIYUAN, SHANGGUMONO, diffs, SONGS_PER_PAGE
-from ..libraries.image import image_to_base64, text_to_image, tricolor_gradient, rounded_corners
+from ..libraries.image import get_font, image_to_base64, text_to_image, tricolor_gradient, rounded_corners, wrap_text
 from ..libraries.maimaidx_api_data import maiApi
 from ..libraries.maimaidx_error import *
 from ..libraries.maimaidx_model import AliasStatus
 from ..libraries.maimaidx_music import guess, mai
 from ..libraries.maimaidx_music_info import draw_music_info
+from ..libraries.render_cache import render_cache
 
-from ..output_manager import OutputManager
+from ..output_manager import OutputManager, spool
 from ..error_handler import ErrorHandler
 
 # 初始化输出管理器和错误处理器
 output_manager = OutputManager()
 error_handler = ErrorHandler()
 
+# 搜索结果图片每页最多行数
+SEARCH_ROWS_PER_PAGE = 40
+
 def create_beautiful_search_image(title: str, content: str, search_type: str = "search") -> Image.Image:
     """
     创建美观的查歌结果图片
@@ -29,14 +33,22 @@ def create_beautiful_search_image(title: str, content: str, search_type: str = "
         content: 内容文本
         search_type: 搜索类型 (search, base, bpm, artist, charter, alias, id)
     """
-    # 计算内容行数和图片尺寸
-    lines = content.strip().split('\n')
-    line_count = len(lines)
-    
     # 基础尺寸
     base_width = 1200
     base_height = 200  # 标题和装饰区域
     line_height = 35
+    max_line_width = base_width - 100  # 左右各留50像素边距
+    
+    # 字体设置
+    title_font = get_font(SIYUAN, 36)
+    content_font = get_font(SHANGGUMONO, 24)
+    small_font = get_font(SHANGGUMONO, 20)
+    
+    # 先排版再计算图片尺寸，自动换行后的每一行都占一个行高
+    lines = content.strip().split('\n')
+    rows = [wrap_text(line, content_font, max_line_width) for line in lines]
+    line_count = sum(len(r) for r in rows)
+    
     content_height = max(line_count * line_height + 40, 400)  # 最小内容高度
     total_height = base_height + content_height
     
@@ -76,11 +88,6 @@ def create_beautiful_search_image(title: str, content: str, search_type: str = "
     # 绘制文字
     draw = ImageDraw.Draw(bg)
     
-    # 字体设置
-    title_font = ImageFont.truetype(str(SIYUAN), 36)
-    content_font = ImageFont.truetype(str(SHANGGUMONO), 24)
-    small_font = ImageFont.truetype(str(SHANGGUMONO), 20)
-    
     # 绘制标题阴影
     title_x, title_y = base_width // 2, 80
     draw.text((title_x + 2, title_y + 2), title, font=title_font, fill=(180, 180, 180))
@@ -106,41 +113,13 @@ def create_beautiful_search_image(title: str, content: str, search_type: str = "
     content_x = 50
     content_y = base_height + 20
     
-    # 自动换行处理
-    max_line_width = base_width - 100  # 左右各留50像素边距
-    
-    def draw_wrapped_text(text, x, y, font, fill, max_width):
-        """绘制自动换行的文字"""
-        lines = []
-        current_line = ""
-        
-        for char in text:
-            test_line = current_line + char
-            if draw.textlength(test_line, font=font) <= max_width:
-                current_line = test_line
-            else:
-                if current_line:
-                    lines.append(current_line)
-                    current_line = char
-                else:
-                    lines.append(char)
-                    current_line = ""
-        
-        if current_line:
-            lines.append(current_line)
-        
-        # 绘制每一行
-        for i, line in enumerate(lines):
-            draw.text((x, y + i * (font.size + 4)), line, font=font, fill=fill)
-        
-        return len(lines) * (font.size + 4)
-    
     # 绘制内容文本
-    for i, line in enumerate(lines):
-        if i == len(lines) - 1:  # 最后一行（页码信息）用不同颜色
-            draw_wrapped_text(line, content_x, content_y + i * line_height, content_font, (100, 100, 100), max_line_width)
-        else:
-            draw_wrapped_text(line, content_x, content_y + i * line_height, content_font, (60, 60, 60), max_line_width)
+    row = 0
+    for i, wrapped in enumerate(rows):
+        fill = (100, 100, 100) if i == len(rows) - 1 else (60, 60, 60)  # 最后一行（页码信息）用不同颜色
+        for text in wrapped:
+            draw.text((content_x, content_y + row * line_height), text, font=content_font, fill=fill)
+            row += 1
     
     # 添加底部签名
     signature = "Adapted by AbyssSeeker"
@@ -152,6 +131,30 @@ def create_beautiful_search_image(title: str, content: str, search_type: str = "
     
     return bg
 
+async def search_image(title: str, content: str, search_type: str = "search") -> Union[bytes, str]:
+    """绘制搜索结果图片，相同内容的结果会被缓存直到曲库数据更新"""
+    return await render_cache.render(
+        'search', (title, content, search_type), create_beautiful_search_image, title, content, search_type, kind='card'
+    )
+
+
+async def search_images(title: str, content: str, search_type: str = "search") -> AsyncIterator[Union[bytes, str]]:
+    """
+    分页绘制搜索结果图片，内容超过 `SEARCH_ROWS_PER_PAGE` 行时拆分为多张
+
+    内容的最后一行（页码或统计信息）作为页脚，在每一页末尾都绘制一次；
+    每页绘制完成后立即产出，下一页在取用时才开始绘制，同一时刻只占用一张画布
+    """
+    lines = content.strip().split('\n')
+    footer = lines.pop()
+    while lines and not lines[-1].strip():
+        lines.pop()
+    pages = [lines[i:i + SEARCH_ROWS_PER_PAGE] for i in range(0, len(lines), SEARCH_ROWS_PER_PAGE)] or [[]]
+    for n, chunk in enumerate(pages, 1):
+        page_title = title if len(pages) == 1 else f"{title} ({n}/{len(pages)})"
+        yield await search_image(page_title, '\n'.join(chunk + ['', footer]), search_type)
+
+
 def song_level(ds1: float, ds2: float) -> List[Tuple[str, str, float, str]]:
     """
     查询定数范围内的乐曲
@@ -202,7 +205,7 @@ async def search_music_handler(event, name: str, page=1):
         
         if len(result) == 1:
             img = await draw_music_info(result.random(), None)
-            if isinstance(img, Image.Image):
+            if isinstance(img, bytes):
                 return await output_manager.send_image(event, img, f"search_music_{safe_filename(name)}.png", f"搜索结果: {name}")
             else:
                 return await output_manager.send_text(event, str(img))
@@ -223,8 +226,8 @@ async def search_music_handler(event, name: str, page=1):
         search_result += f'\n第 {page}/{total_pages} 页，共 {len(result)} 首歌曲'
         
         # 创建图片
-        img = create_beautiful_search_image(f"关键词搜索: {name}", search_result, "search")
-        return await output_manager.send_image(event, img, f"search_music_{safe_filename(name)}_p{page}.png", f"关键词搜索: {name}")
+        pages = search_images(f"关键词搜索: {name}", search_result, "search")
+        return await output_manager.send_images(event, pages, f"search_music_{safe_filename(name)}_p{page}.png", f"关键词搜索: {name}")
     except Exception as e:
         return await error_handler.handle_error(event, e, "关键词搜索失败")
 
@@ -265,8 +268,8 @@ async def search_base_handler(event, args: str):
         search_result += f'\n共找到 {len(result)} 首歌曲'
         
         # 创建图片
-        img = create_beautiful_search_image(f"定数搜索: {ds1}~{ds2}", search_result, "base")
-        return await output_manager.send_image(event, img, f"search_base_{ds1}_{ds2}.png", f"定数搜索: {ds1}~{ds2}")
+        pages = search_images(f"定数搜索: {ds1}~{ds2}", search_result, "base")
+        return await output_manager.send_images(event, pages, f"search_base_{ds1}_{ds2}.png", f"定数搜索: {ds1}~{ds2}")
     except Exception as e:
         return await error_handler.handle_error(event, e, "定数搜索失败")
 
@@ -310,8 +313,8 @@ async def search_bpm_handler(event, args: str):
         search_result += f'\n共找到 {len(result)} 首歌曲'
         
         # 创建图片
-        img = create_beautiful_search_image(f"BPM搜索: {bpm1}~{bpm2}", search_result, "bpm")
-        return await output_manager.send_image(event, img, f"search_bpm_{bpm1}_{bpm2}.png", f"BPM搜索: {bpm1}~{bpm2}")
+        pages = search_images(f"BPM搜索: {bpm1}~{bpm2}", search_result, "bpm")
+        return await output_manager.send_images(event, pages, f"search_bpm_{bpm1}_{bpm2}.png", f"BPM搜索: {bpm1}~{bpm2}")
     except Exception as e:
         return await error_handler.handle_error(event, e, "BPM搜索失败")
 
@@ -342,8 +345,8 @@ async def search_artist_handler(event, args: str):
         search_result += f'\n共找到 {len(result)} 首歌曲'
         
         # 创建图片
-        img = create_beautiful_search_image(f"曲师搜索: {args}", search_result, "artist")
-        return await output_manager.send_image(event, img, f"search_artist_{safe_filename(args)}.png", f"曲师搜索: {args}")
+        pages = search_images(f"曲师搜索: {args}", search_result, "artist")
+        return await output_manager.send_images(event, pages, f"search_artist_{safe_filename(args)}.png", f"曲师搜索: {args}")
     except Exception as e:
         return await error_handler.handle_error(event, e, "曲师搜索失败")
 
@@ -374,8 +377,8 @@ async def search_charter_handler(event, args: str):
         search_result += f'\n共找到 {len(result)} 首歌曲'
         
         # 创建图片
-        img = create_beautiful_search_image(f"谱师搜索: {args}", search_result, "charter")
-        return await output_manager.send_image(event, img, f"search_charter_{safe_filename(args)}.png", f"谱师搜索: {args}")
+        pages = search_images(f"谱师搜索: {args}", search_result, "charter")
+        return await output_manager.send_images(event, pages, f"search_charter_{safe_filename(args)}.png", f"谱师搜索: {args}")
     except Exception as e:
         return await error_handler.handle_error(event, e, "谱师搜索失败")
 
@@ -404,7 +407,7 @@ async def search_alias_song_handler(event, name: str):
             music = mai.total_list.by_id(str(alias_result[0].SongID))
             if music:
                 img = await draw_music_info(music, None)
-                if isinstance(img, Image.Image):
+                if isinstance(img, bytes):
                     return await output_manager.send_image(event, img, f"alias_{safe_filename(name)}.png", f"别名查询: {name}")
                 else:
                     return await output_manager.send_text(event, str(img))
@@ -421,8 +424,8 @@ async def search_alias_song_handler(event, name: str):
         search_result += f'\n共找到 {len(alias_result)} 首歌曲'
         
         # 创建图片
-        img = create_beautiful_search_image(f"别名搜索: {name}", search_result, "alias")
-        return await output_manager.send_image(event, img, f"search_alias_{safe_filename(name)}.png", f"别名搜索: {name}")
+        pages = search_images(f"别名搜索: {name}", search_result, "alias")
+        return await output_manager.send_images(event, pages, f"search_alias_{safe_filename(name)}.png", f"别名搜索: {name}")
     except Exception as e:
         return await error_handler.handle_error(event, e, "别名搜索失败")
 
@@ -450,7 +453,7 @@ async def query_chart_handler(event, id: str):
             return await output_manager.send_text(event, f'未找到ID为 {id} 的曲目')
         
         img = await draw_music_info(music, None)
-        if isinstance(img, Image.Image):
+        if isinstance(img, bytes):
             return await output_manager.send_image(event, img, f"chart_{id}.png", f"谱面查询: {music.title}")
         else:
             return await output_manager.send_text(event, str(img))
@@ -473,9 +476,8 @@ async def search_music_cli(name: str, page=1, user_id=None):
         return
     if len(result) == 1:
         img = await draw_music_info(result.random(), user_id)
-        if isinstance(img, Image.Image):
-            img_path = Path("output") / f"search_music_{safe_filename(name)}.png"
-            img.save(img_path)
+        if isinstance(img, bytes):
+            img_path = await spool.save_async(img, f"search_music_{safe_filename(name)}")
             print(f"查歌图片已保存到: {img_path}")
         else:
             print(img)
@@ -597,9 +599,8 @@ async def search_alias_song_cli(name: str, user_id=None):
         music = mai.total_list.by_id(str(alias_result[0].SongID))
         if music:
             img = await draw_music_info(music, user_id)
-            if isinstance(img, Image.Image):
-                img_path = Path("output") / f"alias_{safe_filename(name)}.png"
-                img.save(img_path)
+            if isinstance(img, bytes):
+                img_path = await spool.save_async(img, f"alias_{safe_filename(name)}")
                 print(f"别名查询图片已保存到: {img_path}")
             else:
                 print(img)
@@ -631,9 +632,8 @@ async def query_chart_cli(id: str, user_id=None):
         print(f'未找到ID为 {id} 的曲目')
         return
     img = await draw_music_info(music, user_id)
-    if isinstance(img, Image.Image):
-        img_path = Path("output") / f"chart_{id}.png"
-        img.save(img_path)
+    if isinstance(img, bytes):
+        img_path = await spool.save_async(img, f"chart_{id}")
         print(f"谱面查询图片已保存到: {img_path}")
     else:
         print(img)
\ No newline at end of file
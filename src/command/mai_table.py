@@ -1,6 +1,7 @@
 import re
 from re import Match
 from pathlib import Path
+from typing import Union
 from PIL import Image
 
 from ..libraries.config import ratingdir, levelList, platecn, combo_rank, scoreRank, syncRank, Root
@@ -16,37 +17,46 @@ from ..libraries.maimaidx_player_score import (
     rise_score_data,
 )
 from ..libraries.maimaidx_update_table import update_plate_table, update_rating_table
+from ..libraries.render_cache import render_cache
 
-from ..output_manager import OutputManager
+from ..output_manager import OutputManager, spool
 from ..error_handler import ErrorHandler
 
 # 初始化输出管理器和错误处理器
 output_manager = OutputManager()
 error_handler = ErrorHandler()
 
+async def rating_image(rating: str, path: Path) -> Union[bytes, str]:
+    """绘制定数表，结果会被缓存直到曲库数据或定数表图片更新"""
+    return await render_cache.render(
+        'rating', (rating, path.stat().st_mtime_ns), draw_rating, rating, path, kind='table'
+    )
+
 # AstrBot 命令处理器实现
-async def update_rating_table_handler(event):
+async def update_rating_table_handler(event, force: bool = False):
     """
     更新定数表命令处理器
     
     Args:
         event: AstrBot 事件对象
+        force: 是否强制重新绘制全部定数表
     """
     try:
-        result = await update_rating_table()
+        result = await update_rating_table(force)
         return output_manager.send_text(event, result)
     except Exception as e:
         return error_handler.handle_error(event, e, "定数表更新失败")
 
-async def update_plate_table_handler(event):
+async def update_plate_table_handler(event, force: bool = False):
     """
     更新段位表命令处理器
     
     Args:
         event: AstrBot 事件对象
+        force: 是否强制重新绘制全部完成表
     """
     try:
-        result = await update_plate_table()
+        result = await update_plate_table(force)
         return output_manager.send_text(event, result)
     except Exception as e:
         return error_handler.handle_error(event, e, "段位表更新失败")
@@ -68,8 +78,8 @@ async def rating_table_handler(event, args: str):
             rating = m.group(1)
             path = ratingdir / f'{rating}.png'
             if path.exists():
-                pic = draw_rating(rating, path)
-                if isinstance(pic, Image.Image):
+                pic = await rating_image(rating, path)
+                if isinstance(pic, bytes):
                     return output_manager.send_image(event, pic, f"rating_table_{rating}.png", f"{rating}定数表")
                 else:
                     return output_manager.send_text(event, str(pic))
@@ -81,8 +91,8 @@ async def rating_table_handler(event, args: str):
             rating = m.group(1)
             path = ratingdir / f'{rating}.png'
             if path.exists():
-                pic = draw_rating(rating, path)
-                if isinstance(pic, Image.Image):
+                pic = await rating_image(rating, path)
+                if isinstance(pic, bytes):
                     return output_manager.send_image(event, pic, f"rating_table_{rating}.png", f"{rating}定数表")
                 else:
                     return output_manager.send_text(event, str(pic))
@@ -95,8 +105,8 @@ async def rating_table_handler(event, args: str):
         elif args in levelList[6:]:
             path = ratingdir / f'{args}.png'
             if path.exists():
-                pic = draw_rating(args, path)
-                if isinstance(pic, Image.Image):
+                pic = await rating_image(args, path)
+                if isinstance(pic, bytes):
                     return output_manager.send_image(event, pic, f"rating_table_{args}.png", f"{args}定数表")
                 else:
                     return output_manager.send_text(event, str(pic))
@@ -127,7 +137,7 @@ async def table_pfm_handler(event, args: str):
             # 数字完成表（定数表+成绩）
             result = await draw_rating_table(user, ra, False)
             if isinstance(result, Image.Image):
-                return output_manager.send_image(event, result, f"table_pfm_{user}_{ra}.png", f"{user}的{ra}完成表")
+                return output_manager.send_image(event, result, f"table_pfm_{user}_{ra}.png", f"{user}的{ra}完成表", kind='table')
             else:
                 return output_manager.send_text(event, str(result))
         
@@ -146,7 +156,7 @@ async def table_pfm_handler(event, args: str):
             # 文字完成表（段位）
             result = await draw_plate_table(user, ver, plan)
             if isinstance(result, Image.Image):
-                return output_manager.send_image(event, result, f"table_pfm_{user}_{ver}{plan}.png", f"{user}的{ver}{plan}完成表")
+                return output_manager.send_image(event, result, f"table_pfm_{user}_{ver}{plan}.png", f"{user}的{ver}{plan}完成表", kind='table')
             else:
                 return output_manager.send_text(event, str(result))
         
@@ -164,7 +174,7 @@ async def table_pfm_handler(event, args: str):
                 return output_manager.send_text(event, '真系没有真将哦')
             pic = await draw_plate_table(user, ver, plan)
             if isinstance(pic, Image.Image):
-                return output_manager.send_image(event, pic, f"table_plate_{user}_{ver}{plan}.png", f"{user}的{ver}{plan}完成表")
+                return output_manager.send_image(event, pic, f"table_plate_{user}_{ver}{plan}.png", f"{user}的{ver}{plan}完成表", kind='table')
             else:
                 return output_manager.send_text(event, str(pic))
         
@@ -177,7 +187,7 @@ async def table_pfm_handler(event, args: str):
             if ra in levelList[5:]:
                 pic = await draw_rating_table(user, ra, True if plan and plan.lower() in combo_rank else False)
                 if isinstance(pic, Image.Image):
-                    return output_manager.send_image(event, pic, f"table_pfm_{user}_{ra}.png", f"{user}的{ra}完成表")
+                    return output_manager.send_image(event, pic, f"table_pfm_{user}_{ra}.png", f"{user}的{ra}完成表", kind='table')
                 else:
                     return output_manager.send_text(event, str(pic))
             else:
@@ -298,14 +308,14 @@ async def level_achievement_list_handler(event, rating, page=1):
         return error_handler.handle_error(event, e, "等级成就列表查询失败")
 
 # 保留原有的CLI函数以保持向后兼容性
-async def update_rating_table_cli():
+async def update_rating_table_cli(force: bool = False):
     """CLI版本的定数表更新（已弃用，请使用update_rating_table_handler）"""
-    result = await update_rating_table()
+    result = await update_rating_table(force)
     print(result)
 
-async def update_plate_table_cli():
+async def update_plate_table_cli(force: bool = False):
     """CLI版本的段位表更新（已弃用，请使用update_plate_table_handler）"""
-    result = await update_plate_table()
+    result = await update_plate_table(force)
     print(result)
 
 async def rating_table_cli(args: str, username: str = 'default'):
@@ -317,10 +327,9 @@ async def rating_table_cli(args: str, username: str = 'default'):
         rating = m.group(1)
         path = ratingdir / f'{rating}.png'
         if path.exists():
-            pic = draw_rating(rating, path)
-            if isinstance(pic, Image.Image):
-                img_path = Path("output") / f"rating_table_{rating}.png"
-                pic.save(img_path)
+            pic = await rating_image(rating, path)
+            if isinstance(pic, bytes):
+                img_path = await spool.save_async(pic, f"rating_table_{rating}")
                 print(f"定数表图片已保存到: {img_path}")
             else:
                 print(pic)
@@ -332,10 +341,9 @@ async def rating_table_cli(args: str, username: str = 'default'):
         rating = m.group(1)
         path = ratingdir / f'{rating}.png'
         if path.exists():
-            pic = draw_rating(rating, path)
-            if isinstance(pic, Image.Image):
-                img_path = Path("output") / f"rating_table_{rating}.png"
-                pic.save(img_path)
+            pic = await rating_image(rating, path)
+            if isinstance(pic, bytes):
+                img_path = await spool.save_async(pic, f"rating_table_{rating}")
                 print(f"定数表图片已保存到: {img_path}")
             else:
                 print(pic)
@@ -348,10 +356,9 @@ async def rating_table_cli(args: str, username: str = 'default'):
     elif args in levelList[6:]:
         path = ratingdir / f'{args}.png'
         if path.exists():
-            pic = draw_rating(args, path)
-            if isinstance(pic, Image.Image):
-                img_path = Path("output") / f"rating_table_{args}.png"
-                pic.save(img_path)
+            pic = await rating_image(args, path)
+            if isinstance(pic, bytes):
+                img_path = await spool.save_async(pic, f"rating_table_{args}")
                 print(f"定数表图片已保存到: {img_path}")
             else:
                 print(pic)
@@ -372,8 +379,7 @@ async def table_pfm_cli(username, args: str):
         # 数字完成表（定数表+成绩）
         result = await draw_rating_table(user, ra, False)
         if isinstance(result, Image.Image):
-            img_path = Path("output") / f"table_pfm_{user}_{ra}.png"
-            result.save(img_path)
+            img_path = await spool.save_async(result, f"table_pfm_{user}_{ra}", kind='table')
             print(f"完成表图片已保存到: {img_path}")
         else:
             print(result)
@@ -395,8 +401,7 @@ async def table_pfm_cli(username, args: str):
         # 文字完成表（段位）
         result = await draw_plate_table(user, ver, plan)
         if isinstance(result, Image.Image):
-            img_path = Path("output") / f"table_pfm_{user}_{ver}{plan}.png"
-            result.save(img_path)
+            img_path = await spool.save_async(result, f"table_pfm_{user}_{ver}{plan}", kind='table')
             print(f"完成表图片已保存到: {img_path}")
         else:
             print(result)
@@ -417,8 +422,7 @@ async def table_pfm_cli(username, args: str):
             return
         pic = await draw_plate_table(user, ver, plan)
         if isinstance(pic, Image.Image):
-            img_path = Path("output") / f"table_plate_{user}_{ver}{plan}.png"
-            pic.save(img_path)
+            img_path = await spool.save_async(pic, f"table_plate_{user}_{ver}{plan}", kind='table')
             print(f"完成表图片已保存到: {img_path}")
         else:
             print(pic)
@@ -432,8 +436,7 @@ async def table_pfm_cli(username, args: str):
         if ra in levelList[5:]:
             pic = await draw_rating_table(user, ra, True if plan and plan.lower() in combo_rank else False)
             if isinstance(pic, Image.Image):
-                img_path = Path("output") / f"table_pfm_{user}_{ra}.png"
-                pic.save(img_path)
+                img_path = await spool.save_async(pic, f"table_pfm_{user}_{ra}", kind='table')
                 print(f"完成表图片已保存到: {img_path}")
             else:
                 print(pic)
@@ -22,6 +22,8 @@ class ConfigManager:
             "enable_text_output": True,
             "max_search_results": 10,
             "auto_update_data": False,
+            "auto_update_tables": False,
+            "render_cache_disk_mb": 0,
             "data_update_interval": 24
         }
         
@@ -68,6 +70,14 @@ class ConfigManager:
         """是否启用自动更新"""
         return self.get("auto_update_data", False)
     
+    def is_auto_update_tables_enabled(self) -> bool:
+        """曲库更新后是否自动增量更新定数表和完成表"""
+        return self.get("auto_update_tables", False)
+    
+    def get_render_cache_disk_mb(self) -> int:
+        """获取绘图缓存磁盘层容量（MB），为 0 时不启用"""
+        return self.get("render_cache_disk_mb", 0)
+    
     def get_update_interval(self) -> int:
         """获取更新间隔（小时）"""
         return self.get("data_update_interval", 24) 
\ No newline at end of file
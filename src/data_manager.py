@@ -12,10 +12,12 @@ from .libraries.maimaidx_music import mai
 class DataManager:
     """数据管理器，负责曲库数据的初始化和更新"""
     
-    def __init__(self, plugin_root: Path):
+    def __init__(self, plugin_root: Path, auto_update_tables: bool = False):
         self.plugin_root = plugin_root
+        self.auto_update_tables = auto_update_tables
         self.is_initialized = False
         self.initialization_lock = asyncio.Lock()
+        self._cover_task: Optional[asyncio.Task] = None
     
     async def initialize_data(self, force: bool = False) -> bool:
         """初始化曲库数据"""
@@ -37,6 +39,7 @@ class DataManager:
                     await mai.get_plate_json()
                     mai.guess()
                     logger.info("数据初始化完成！")
+                    background = self._sync_covers_and_tables
                 else:
                     logger.info("检测到本地缓存文件，正在加载数据...")
                     await mai.get_music()
@@ -44,8 +47,12 @@ class DataManager:
                     await mai.get_plate_json()
                     mai.guess()
                     logger.info("数据加载完成！")
+                    background = self._sync_covers
                 
+                await self._bake_sprites()
                 self.is_initialized = True
+                # 曲绘下载和表格重绘耗时较长，数据就绪后在后台执行，不阻塞指令
+                self._cover_task = asyncio.create_task(background())
                 return True
                 
             except Exception as e:
@@ -61,11 +68,50 @@ class DataManager:
             await mai.get_plate_json()
             mai.guess()
             logger.info("数据更新完成！")
+            await self._sync_covers()
+            await self._update_tables()
             return True
         except Exception as e:
             logger.error(f"数据更新失败: {e}")
             return False
     
+    async def _sync_covers(self):
+        """下载曲库中缺失的曲绘，需在绘制定数表和完成表之前完成"""
+        from .libraries.cover_sync import cover_sync
+        
+        try:
+            done, failed = await cover_sync.sync()
+            if done or failed:
+                logger.info(f"曲绘同步完成，下载 {len(done)} 张，失败 {len(failed)} 张")
+        except Exception as e:
+            logger.error(f"曲绘同步失败: {e}")
+    
+    async def _sync_covers_and_tables(self):
+        """先补全曲绘，再增量更新定数表和完成表"""
+        await self._sync_covers()
+        await self._update_tables()
+    
+    async def _update_tables(self):
+        """曲库更新后增量更新定数表和完成表，只会重新绘制输入发生变化的图片"""
+        if not self.auto_update_tables:
+            return
+        from .libraries.maimaidx_update_table import update_plate_table, update_rating_table
+        
+        try:
+            logger.info(await update_rating_table())
+            logger.info(await update_plate_table())
+        except Exception as e:
+            logger.error(f"定数表/完成表更新失败: {e}")
+    
+    async def _bake_sprites(self):
+        """素材资源包不存在或素材有更新时重新烘焙，之后的进程启动直接映射资源包"""
+        from .libraries.asset_pack import ensure_sprite_pack
+        
+        try:
+            await asyncio.to_thread(ensure_sprite_pack)
+        except Exception as e:
+            logger.error(f"素材资源包烘焙失败: {e}")
+    
     def is_data_ready(self) -> bool:
         """检查数据是否准备就绪"""
         return self.is_initialized and hasattr(mai, 'total_list') and mai.total_list is not None
@@ -0,0 +1,557 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+from PIL import Image
+
+from .config import cover_archive_file, coverdir, maimaidir, sprite_pack_file
+
+baked_sizes: Dict[str, List[Tuple[int, int]]] = {
+    'UI_TTR_Rank_*.png': [(63, 28), (78, 35), (102, 46)],
+    'UI_MSS_MBase_Icon_*.png': [(34, 34), (50, 50)],
+    'UI_CHR_PlayBonus_*.png': [(75, 75)],
+    'UI_GAM_Gauge_DXScoreIcon_0*.png': [(47, 26)],
+    'DX.png': [(37, 14)],
+    'SD.png': [(37, 14)],
+    'aurora.png': [(1400, 220)],
+    'rainbow_bottom.png': [(1200, 200)],
+}
+"""除原尺寸外额外预烘焙的尺寸，需与 `sprite` 的调用保持一致"""
+
+_MAGIC = b'MAIPACK1'
+_HEADER = struct.Struct('<8sI')
+_ALIGN = 64
+
+_COVER_MAGIC = b'MAICOVR1'
+_RECORD = struct.Struct('<4sIII')
+_RECORD_TAG = b'COVR'
+_FOOTER = struct.Struct('<Q8s')
+
+_CHECK_INTERVAL = 1
+"""两次检查资源代数之间的最短间隔（秒）"""
+
+
+class Generations:
+
+    def __init__(self, path: Path) -> None:
+        """
+        按代保存的资源文件。每次写入都生成新文件 `{stem}.{代数}{suffix}`，再在文件锁内更新代数文件 `{name}.gen`，
+        已被映射的旧文件不会被修改或覆盖，读取方发现代数变化后重新映射
+
+        Params:
+            `path`: 资源路径，实际文件名由此派生
+        """
+        self.path = path
+        self._pointer = path.with_name(f'{path.name}.gen')
+        self._lockfile = path.with_name(f'{path.name}.lock')
+
+    def file(self, gen: int) -> Path:
+        """第 `gen` 代资源文件的路径"""
+        return self.path.with_name(f'{self.path.stem}.{gen}{self.path.suffix}')
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """跨进程的文件锁，读写代数文件时持有"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self._lockfile, 'a+b') as f:
+            if os.name == 'nt':
+                while True:
+                    try:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == 'nt':
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> int:
+        try:
+            return int(self._pointer.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def current(self) -> int:
+        """
+        当前代数
+
+        Returns:
+            `int` 尚未写入过时返回 `0`
+        """
+        with self.lock():
+            return self._read()
+
+    @contextmanager
+    def pinned(self) -> Iterator[int]:
+        """
+        持有文件锁并产出当前代数，锁内打开或映射当前一代文件，不会与发布新一代时的清理交错
+
+        Returns:
+            `int` 尚未写入过时为 `0`
+        """
+        with self.lock():
+            yield self._read()
+
+    def tmp(self) -> Path:
+        """写入新一代资源时使用的临时文件路径"""
+        return self.path.with_name(f'.{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+    def _publish(self, tmp: Path) -> int:
+        gen = self._read() + 1
+        os.replace(tmp, self.file(gen))
+        pointer = self._pointer.with_name(f'.{self._pointer.name}.{os.getpid()}.tmp')
+        pointer.write_text(str(gen))
+        os.replace(pointer, self._pointer)
+        for f in self.path.parent.glob(f'{self.path.stem}.*{self.path.suffix}'):
+            old = f.name[len(self.path.stem) + 1:-len(self.path.suffix)]
+            if old.isdigit() and int(old) != gen:
+                try:
+                    f.unlink()
+                except OSError:
+                    # Windows 下仍被映射的文件无法删除，留到下次写入时再清理
+                    pass
+        return gen
+
+    def publish(self, tmp: Path) -> int:
+        """
+        将写好的临时文件发布为新一代资源，并清理不再使用的旧文件
+
+        Params:
+            `tmp`: 已完整写入的临时文件
+        Returns:
+            `int` 新的代数
+        """
+        with self.lock():
+            return self._publish(tmp)
+
+    def update(self, write: Callable[[Optional[Path], Path], None]) -> int:
+        """
+        基于当前一代资源生成下一代，整个过程持有文件锁，多个进程同时更新时依次进行
+
+        Params:
+            `write`: 以 `(当前资源文件或 None, 临时文件)` 调用，负责写入临时文件
+        Returns:
+            `int` 新的代数
+        """
+        with self.lock():
+            gen = self._read()
+            tmp = self.tmp()
+            try:
+                write(self.file(gen) if gen else None, tmp)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+            return self._publish(tmp)
+
+    def extend(self, write: Callable[[Optional[Path]], Path]) -> int:
+        """
+        在当前一代资源文件上原地追加，再以硬链接发布为下一代，整个过程持有文件锁。
+        只能追加不改动已有内容的格式使用，正在映射旧一代的读取方看到的内容不变；
+        不支持硬链接时退回为复制
+
+        Params:
+            `write`: 以 `(当前资源文件或 None)` 调用，负责追加写入并返回写好的文件，
+                没有当前资源时应写入 `tmp()` 并返回
+        Returns:
+            `int` 新的代数
+        """
+        with self.lock():
+            gen = self._read()
+            current = self.file(gen) if gen else None
+            tmp = self.tmp()
+            try:
+                written = write(current)
+                if written != tmp:
+                    try:
+                        os.link(written, tmp)
+                    except OSError:
+                        shutil.copyfile(written, tmp)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+            return self._publish(tmp)
+
+
+def sprite_key(name: str, size: Optional[Tuple[int, int]] = None) -> str:
+    """
+    素材在资源包索引中的键
+
+    Params:
+        `name`: 素材文件名
+        `size`: 缩放尺寸，为 `None` 时为原尺寸
+    Returns:
+        `str`
+    """
+    return name if size is None else f'{name}@{size[0]}x{size[1]}'
+
+
+def _sources_mtime(directory: Path) -> int:
+    return max((e.stat().st_mtime_ns for e in os.scandir(directory) if e.name.endswith('.png')), default=0)
+
+
+def bake_sprites(directory: Path = maimaidir, output: Path = sprite_pack_file) -> int:
+    """
+    将素材目录下所有图片解码为 RGBA 原始数据，连同 `baked_sizes` 中的缩放尺寸一起写入单个资源包，
+    写入新一代文件后再切换，不修改正在被映射的旧文件
+
+    文件结构为 `魔数 + 索引长度 + JSON 索引 + 按 64 字节对齐的像素数据`
+
+    Params:
+        `directory`: 素材目录
+        `output`: 资源包路径
+    Returns:
+        `int` 写入的素材数量
+    """
+    _otime = time.perf_counter()
+    images: List[Tuple[str, Image.Image]] = []
+    for path in sorted(directory.glob('*.png')):
+        try:
+            im = Image.open(path).convert('RGBA')
+        except Exception as e:
+            print(f'[资源包] 跳过无法读取的素材 {path.name}: {e}')
+            continue
+        images.append((sprite_key(path.name), im))
+        for pattern, sizes in baked_sizes.items():
+            if fnmatch(path.name, pattern):
+                images.extend((sprite_key(path.name, size), im.resize(size)) for size in sizes)
+
+    index: Dict[str, Tuple[int, int, int]] = {}
+    offset = 0
+    for key, im in images:
+        index[key] = (offset, *im.size)
+        offset += -(-im.size[0] * im.size[1] * 4 // _ALIGN) * _ALIGN
+    meta = json.dumps({'mtime': _sources_mtime(directory), 'sprites': index}).encode()
+    base = -(-(_HEADER.size + len(meta)) // _ALIGN) * _ALIGN
+
+    generations = Generations(output)
+    tmp = generations.tmp()
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(meta)))
+        f.write(meta)
+        for key, im in images:
+            f.seek(base + index[key][0])
+            f.write(im.tobytes())
+        f.truncate(base + offset)
+    generations.publish(tmp)
+    sprite_pack.reload()
+    print(f'[资源包] 已写入 {len(images)} 个素材，用时 {time.perf_counter() - _otime:.2f} 秒')
+    return len(images)
+
+
+def ensure_sprite_pack(directory: Path = maimaidir, output: Path = sprite_pack_file) -> bool:
+    """
+    资源包不存在或素材目录有更新时重新烘焙
+
+    Params:
+        `directory`: 素材目录
+        `output`: 资源包路径
+    Returns:
+        `bool` 是否重新烘焙
+    """
+    if Generations(output).current() and sprite_pack.refresh() >= _sources_mtime(directory):
+        return False
+    bake_sprites(directory, output)
+    return True
+
+
+class SpritePack:
+
+    def __init__(self, path: Path) -> None:
+        """
+        只读加载资源包，文件通过 `mmap` 映射，取出的图片直接引用映射内存，不复制像素数据；
+        其他进程重新烘焙后，最迟 `_CHECK_INTERVAL` 秒内映射新一代资源包
+
+        Params:
+            `path`: 资源包路径
+        """
+        self.path = path
+        self.generations = Generations(path)
+        self.mtime = 0
+        self._gen = 0
+        self._checked = 0.0
+        self._state: Optional[Tuple[Dict[str, Tuple[int, int, int]], Optional[memoryview], int]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Tuple[Dict[str, Tuple[int, int, int]], Optional[memoryview], int]:
+        with self._lock:
+            now = time.monotonic()
+            if self._state is not None and now - self._checked < _CHECK_INTERVAL:
+                return self._state
+            self._checked = now
+            # 在文件锁内读取代数并映射文件，其它进程发布新一代时不会先删掉这一代
+            with self.generations.pinned() as gen:
+                if self._state is not None and gen == self._gen:
+                    return self._state
+                self._gen = gen
+                self.mtime = 0
+                index, view, base = {}, None, 0
+                try:
+                    if not gen:
+                        raise FileNotFoundError
+                    with open(self.generations.file(gen), 'rb') as f:
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    magic, length = _HEADER.unpack_from(mm)
+                    if magic != _MAGIC:
+                        raise ValueError('文件格式错误')
+                    meta = json.loads(mm[_HEADER.size:_HEADER.size + length])
+                    # 旧的映射可能仍被已取出的图片引用，不主动关闭，由垃圾回收释放
+                    view = memoryview(mm)
+                    base = -(-(_HEADER.size + length) // _ALIGN) * _ALIGN
+                    self.mtime = meta['mtime']
+                    index = {k: tuple(v) for k, v in meta['sprites'].items()}
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f'[资源包] 无法读取 {self.path}，将直接读取素材文件。错误: {e}')
+            self._state = (index, view, base)
+            return self._state
+
+    def refresh(self) -> int:
+        """
+        检查资源包代数，有新一代时重新映射
+
+        Returns:
+            `int` 当前资源包烘焙时素材目录的修改时间，没有资源包时为 `0`
+        """
+        self._load()
+        return self.mtime
+
+    def reload(self) -> None:
+        """资源包重新烘焙后重新映射"""
+        with self._lock:
+            self._state = None
+            self.mtime = 0
+
+    def get(self, name: str, size: Optional[Tuple[int, int]] = None) -> Optional[Image.Image]:
+        """
+        取出素材，返回的图片为只读共享对象
+
+        Params:
+            `name`: 素材文件名
+            `size`: 缩放尺寸，为 `None` 时为原尺寸
+        Returns:
+            `Optional[PIL.Image.Image]` 资源包中没有该素材时返回 `None`
+        """
+        index, view, base = self._load()
+        entry = index.get(sprite_key(name, size))
+        if entry is None:
+            return None
+        offset, width, height = entry
+        start = base + offset
+        data = view[start:start + width * height * 4]
+        return Image.frombuffer('RGBA', (width, height), data, 'raw', 'RGBA', 0, 1)
+
+
+sprite_pack = SpritePack(sprite_pack_file)
+
+
+def _write_index(f, index: Dict[int, Tuple[int, int, int]], end: int) -> None:
+    meta = json.dumps({str(k): v for k, v in index.items()}).encode()
+    f.seek(end)
+    f.write(meta)
+    f.write(_FOOTER.pack(end, _COVER_MAGIC))
+    f.truncate()
+
+
+def pack_covers(directory: Path = coverdir, output: Path = cover_archive_file) -> int:
+    """
+    将曲绘目录下所有图片原样写入单个曲绘归档，不重新编码，写入新一代文件后再切换
+
+    文件结构为 `魔数 + 若干条记录 + JSON 索引 + 尾部`，每条记录为 `标记、曲目 ID、长度、CRC32 + 图片文件内容`，
+    尾部记录索引的起始位置；索引损坏时可以依次扫描记录头重建
+
+    Params:
+        `directory`: 曲绘目录
+        `output`: 归档路径
+    Returns:
+        `int` 写入的曲绘数量
+    """
+    _otime = time.perf_counter()
+    index: Dict[int, Tuple[int, int, int]] = {}
+    generations = Generations(output)
+    tmp = generations.tmp()
+    with open(tmp, 'wb') as f:
+        f.write(_COVER_MAGIC)
+        for path in sorted((p for p in directory.glob('*.png') if p.stem.isdigit()), key=lambda p: int(p.stem)):
+            data = path.read_bytes()
+            crc = zlib.crc32(data)
+            f.write(_RECORD.pack(_RECORD_TAG, int(path.stem), len(data), crc))
+            index[int(path.stem)] = (f.tell(), len(data), crc)
+            f.write(data)
+        _write_index(f, index, f.tell())
+    generations.publish(tmp)
+    cover_archive.reload()
+    print(f'[曲绘归档] 已写入 {len(index)} 张曲绘，用时 {time.perf_counter() - _otime:.2f} 秒')
+    return len(index)
+
+
+class CoverArchive:
+
+    def __init__(self, path: Path) -> None:
+        """
+        曲绘归档，文件通过 `mmap` 映射，按曲目 ID 查索引后只取出对应的压缩数据，由调用方在首次使用时解码；
+        其他进程更新归档后，最迟 `_CHECK_INTERVAL` 秒内映射新一代归档
+
+        Params:
+            `path`: 归档路径
+        """
+        self.path = path
+        self.generations = Generations(path)
+        self._gen = 0
+        self._checked = 0.0
+        self._state: Optional[Tuple[Dict[int, Tuple[int, int, int]], Optional[memoryview], int]] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scan(mm: mmap.mmap) -> Tuple[Dict[int, Tuple[int, int, int]], int]:
+        index: Dict[int, Tuple[int, int, int]] = {}
+        pos = len(_COVER_MAGIC)
+        while pos + _RECORD.size <= len(mm):
+            tag, music_id, length, crc = _RECORD.unpack_from(mm, pos)
+            start = pos + _RECORD.size
+            if tag != _RECORD_TAG or start + length > len(mm) or zlib.crc32(mm[start:start + length]) != crc:
+                break
+            index[music_id] = (start, length, crc)
+            pos = start + length
+        return index, pos
+
+    def _load(self) -> Tuple[Dict[int, Tuple[int, int, int]], Optional[memoryview], int]:
+        with self._lock:
+            now = time.monotonic()
+            if self._state is not None and now - self._checked < _CHECK_INTERVAL:
+                return self._state
+            self._checked = now
+            # 在文件锁内读取代数并映射文件，追加曲绘发布新一代时不会先删掉这一代
+            with self.generations.pinned() as gen:
+                if self._state is None or gen != self._gen:
+                    self._gen = gen
+                    self._state = self._map(self.generations.file(gen)) if gen else ({}, None, 0)
+            return self._state
+
+    def _map(self, path: Path) -> Tuple[Dict[int, Tuple[int, int, int]], Optional[memoryview], int]:
+        try:
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mm[:len(_COVER_MAGIC)] != _COVER_MAGIC:
+                raise ValueError('文件格式错误')
+            end, magic = _FOOTER.unpack_from(mm, len(mm) - _FOOTER.size)
+            if magic == _COVER_MAGIC and len(_COVER_MAGIC) <= end <= len(mm) - _FOOTER.size:
+                meta = json.loads(mm[end:len(mm) - _FOOTER.size])
+                index = {int(k): tuple(v) for k, v in meta.items()}
+            else:
+                # 上次追加中断，尾部不完整，扫描记录头重建索引
+                print(f'[曲绘归档] {path.name} 索引不完整，扫描记录重建')
+                index, end = self._scan(mm)
+            return index, memoryview(mm), end
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f'[曲绘归档] 无法读取 {path}，将直接读取曲绘文件。错误: {e}')
+        return {}, None, 0
+
+    def reload(self) -> None:
+        """归档重新打包后重新映射"""
+        with self._lock:
+            self._state = None
+
+    def exists(self) -> bool:
+        """是否已经打包过归档"""
+        return self.generations.current() > 0
+
+    def __contains__(self, music_id: int) -> bool:
+        return music_id in self._load()[0]
+
+    def get(self, music_id: int) -> Optional[bytes]:
+        """
+        取出曲绘的压缩数据
+
+        Params:
+            `music_id`: 曲目 ID
+        Returns:
+            `Optional[bytes]` 归档中没有该曲绘时返回 `None`
+        """
+        index, view, _ = self._load()
+        entry = index.get(music_id)
+        if entry is None:
+            return None
+        offset, length, _ = entry
+        return bytes(view[offset:offset + length])
+
+    def stamp(self, music_id: int) -> int:
+        """
+        曲绘内容的 CRC32，用于判断曲绘是否有更新
+
+        Params:
+            `music_id`: 曲目 ID
+        Returns:
+            `int` 归档中没有该曲绘时返回 `0`
+        """
+        entry = self._load()[0].get(music_id)
+        return 0 if entry is None else entry[2]
+
+    def append(self, covers: Dict[int, bytes]) -> None:
+        """
+        追加曲绘，在当前归档的记录末尾原地写入新记录并重写索引和尾部，再发布为新一代归档。
+        原有记录不会被修改，正在映射旧一代的读取方不受影响；同一曲目再次追加时以新记录为准
+
+        Params:
+            `covers`: 曲目 ID 和图片文件内容
+        """
+        def write(current: Optional[Path]) -> Path:
+            index, end = {}, 0
+            if current is not None:
+                index, _, end = self._map(current)
+                index = dict(index)
+            if end:
+                path = current
+                f = open(path, 'r+b')
+            else:
+                path = self.generations.tmp()
+                f = open(path, 'wb')
+                f.write(_COVER_MAGIC)
+                end = len(_COVER_MAGIC)
+            with f:
+                f.seek(end)
+                for music_id, data in covers.items():
+                    crc = zlib.crc32(data)
+                    f.write(_RECORD.pack(_RECORD_TAG, music_id, len(data), crc))
+                    index[music_id] = (f.tell(), len(data), crc)
+                    f.write(data)
+                _write_index(f, index, f.tell())
+            return path
+
+        self.generations.extend(write)
+        self.reload()
+
+
+cover_archive = CoverArchive(cover_archive_file)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['covers']:
+        pack_covers()
+    else:
+        bake_sprites()
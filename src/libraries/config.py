@@ -7,10 +7,6 @@ BOTNAME = 'AbyssSeeker'
 log = print
 public_addr = 'https://www.yuzuchan.moe/vote'
 UUID = uuid.uuid1()
-SNAPSHOT_JS = (
-    "echarts.getInstanceByDom(document.querySelector('div[_echarts_instance_]'))."
-    "getDataURL({type: 'PNG', pixelRatio: 2, excludeComponents: ['toolbox']})"
-)
 Root: Path = PLUGIN_ROOT
 static: Path = STATIC_DIR
 arcades_json: Path = ARCADES_JSON
@@ -21,11 +17,13 @@ music_file: Path = MUSIC_FILE
 chart_file: Path = CHART_FILE
 guess_file: Path = GUESS_FILE
 group_alias_file: Path = GROUP_ALIAS_FILE
-pie_html_file: Path = PIE_HTML_FILE
 maimaidir: Path = MAIMAI_DIR
 coverdir: Path = COVER_DIR
 ratingdir: Path = RATING_DIR
 platedir: Path = PLATE_DIR
+sprite_pack_file: Path = SPRITE_PACK_FILE
+cover_archive_file: Path = COVER_ARCHIVE_FILE
+recorddir: Path = RECORD_DIR
 SIYUAN: Path = SIYUAN_FONT
 SHANGGUMONO: Path = SHANGGUMONO_FONT
 TBFONT: Path = TB_FONT
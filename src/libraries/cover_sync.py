@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from PIL import Image
+
+from .asset_pack import cover_archive
+from .config import coverdir
+from .image import clear_cover_cache, cover_exists
+from .maimai_best_50 import ScoreBaseImage
+from .maimaidx_api_data import MaimaiAPI
+from .maimaidx_music import mai
+from .render_cache import render_cache
+
+
+def cover_id(music_id: int) -> int:
+    """
+    曲目对应的曲绘 ID，DX 谱面与标准谱面、宴会场谱面与原曲共用曲绘
+
+    Params:
+        `music_id`: 曲目 ID
+    Returns:
+        `int`
+    """
+    if music_id > 100000:
+        music_id -= 100000
+    if 10000 < music_id <= 11000:
+        music_id -= 10000
+    return music_id
+
+
+class CoverSync:
+
+    def __init__(
+        self,
+        base_url: str = MaimaiAPI.MaiCover,
+        directory: Path = coverdir,
+        concurrency: int = 8,
+        retries: int = 3,
+        timeout: float = 30,
+        backoff: float = 1
+    ) -> None:
+        """
+        补全缺失的曲绘，所有请求共用一个会话，并发数受限，失败时按指数退避重试
+
+        Params:
+            `base_url`: 曲绘地址，曲绘为 `{base_url}/{曲绘 ID:05d}.png`
+            `directory`: 曲绘目录
+            `concurrency`: 同时下载的数量
+            `retries`: 单张曲绘的最多重试次数
+            `timeout`: 单次请求超时时间（秒）
+            `backoff`: 首次重试前的等待时间（秒），之后每次翻倍
+        """
+        self.base_url = base_url.rstrip('/')
+        self.directory = directory
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.backoff = backoff
+        self._lock = asyncio.Lock()
+
+    def missing(self, music_ids: Iterable[int]) -> List[int]:
+        """
+        找出曲绘归档和曲绘目录中都没有的曲绘
+
+        Params:
+            `music_ids`: 曲目 ID
+        Returns:
+            `List[int]` 缺失的曲绘 ID，已去重
+        """
+        ids = {cover_id(int(_id)) for _id in music_ids if not cover_exists(_id)}
+        return sorted(ids)
+
+    async def _fetch(self, session: ClientSession, semaphore: asyncio.Semaphore, cid: int) -> Optional[bytes]:
+        url = f'{self.base_url}/{cid:05d}.png'
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                async with semaphore, session.get(url) as res:
+                    if res.status == 404:
+                        return None
+                    if res.status != 200:
+                        continue
+                    data = await res.read()
+                Image.open(BytesIO(data)).verify()
+                return data
+            except (ClientError, asyncio.TimeoutError, OSError, SyntaxError):
+                continue
+        return None
+
+    def _save(self, cid: int, data: bytes) -> None:
+        path = self.directory / f'{cid}.png'
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+    async def sync(self, music_ids: Optional[Iterable[int]] = None) -> Tuple[List[int], List[int]]:
+        """
+        下载缺失的曲绘，写入曲绘目录，归档存在时同时追加到归档，之后清空曲绘、成绩卡片和绘图结果的缓存
+
+        Params:
+            `music_ids`: 曲目 ID，默认为 `mai.total_list` 中的全部曲目
+        Returns:
+            `Tuple[List[int], List[int]]` 下载成功和失败的曲绘 ID
+        """
+        async with self._lock:
+            _otime = time.perf_counter()
+            if music_ids is None:
+                music_ids = [int(music.id) for music in mai.total_list]
+            ids = self.missing(music_ids)
+            if not ids:
+                return [], []
+            self.directory.mkdir(parents=True, exist_ok=True)
+            semaphore = asyncio.Semaphore(self.concurrency)
+            async with ClientSession(
+                timeout=ClientTimeout(total=self.timeout),
+                connector=TCPConnector(limit=self.concurrency)
+            ) as session:
+                results = await asyncio.gather(*[self._fetch(session, semaphore, cid) for cid in ids])
+            done, failed = [], []
+            for cid, data in zip(ids, results):
+                if data is None:
+                    failed.append(cid)
+                    continue
+                await asyncio.to_thread(self._save, cid, data)
+                done.append(cid)
+            if done and cover_archive.exists():
+                covers = {cid: data for cid, data in zip(ids, results) if data is not None}
+                await asyncio.to_thread(cover_archive.append, covers)
+            if done:
+                # 缩放曲绘、成绩卡片和已缓存的绘图结果都可能使用了默认曲绘
+                clear_cover_cache()
+                ScoreBaseImage.clear_tiles()
+                await asyncio.to_thread(render_cache.clear)
+            print(f'[曲绘同步] 下载 {len(done)} 张，失败 {len(failed)} 张，用时 {time.perf_counter() - _otime:.2f} 秒')
+            return done, failed
+
+
+cover_sync = CoverSync()
@@ -1,11 +1,20 @@
 import base64
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
 from io import BytesIO
-from typing import Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont, ImageOps
+from PIL import Image, ImageDraw, ImageFont
 
-from .config import SHANGGUMONO, Path, coverdir
+from .asset_pack import cover_archive, sprite_pack
+from .config import SHANGGUMONO, Path, coverdir, maimaidir
+
+logger = logging.getLogger(__name__)
 
 
 class DrawText:
@@ -52,6 +61,178 @@ class DrawText:
             )
 
 
+class CanvasPool:
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024) -> None:
+        """
+        画布池，按 `(模式, 尺寸)` 保存用完的画布，之后同尺寸的画布直接覆盖写入，不再重新分配内存
+        
+        只回收由本池分配的画布，池中空闲画布总大小超过 `max_bytes` 时不再回收
+        
+        Params:
+            `max_bytes`: 空闲画布总大小上限
+        """
+        self.max_bytes = max_bytes
+        self._free: Dict[Tuple[str, Tuple[int, int]], List[Image.Image]] = {}
+        self._bytes = 0
+        self._owned: 'weakref.WeakValueDictionary[int, Image.Image]' = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _nbytes(im: Image.Image) -> int:
+        return im.size[0] * im.size[1] * len(im.getbands())
+
+    def acquire(
+        self,
+        mode: str,
+        size: Tuple[int, int],
+        source: Optional[Image.Image] = None,
+        color: Union[int, Tuple[int, ...]] = 0
+    ) -> Image.Image:
+        """
+        取出画布并清空为 `source` 的内容或纯色
+        
+        Params:
+            `mode`: 模式
+            `size`: 尺寸
+            `source`: 填充内容，模式和尺寸需与画布一致
+            `color`: 无 `source` 时的填充颜色
+        Returns:
+            `PIL.Image.Image`
+        """
+        key = (mode, tuple(size))
+        with self._lock:
+            free = self._free.get(key)
+            im = free.pop() if free else None
+            if im is not None:
+                self._bytes -= self._nbytes(im)
+        if im is None:
+            im = source.copy() if source is not None else Image.new(mode, size, color)
+            self._owned[id(im)] = im
+        elif source is not None:
+            im.paste(source, (0, 0))
+        else:
+            im.paste(color, (0, 0, *size))
+        return im
+
+    def copy(self, source: Image.Image) -> Image.Image:
+        """
+        取出与 `source` 同模式同尺寸的画布并写入其内容，用于替代 `source.copy()`
+        
+        Params:
+            `source`: 源图片
+        Returns:
+            `PIL.Image.Image`
+        """
+        return self.acquire(source.mode, source.size, source)
+
+    def release(self, im: Image.Image) -> None:
+        """
+        归还画布，归还后调用方不可再使用。非本池分配的图片会被忽略
+        
+        Params:
+            `im`: 画布
+        """
+        if self._owned.get(id(im)) is not im:
+            return
+        nbytes = self._nbytes(im)
+        with self._lock:
+            free = self._free.setdefault((im.mode, im.size), [])
+            if any(i is im for i in free) or self._bytes + nbytes > self.max_bytes:
+                return
+            free.append(im)
+            self._bytes += nbytes
+
+    def clear(self) -> None:
+        """清空空闲画布"""
+        with self._lock:
+            self._free.clear()
+            self._bytes = 0
+
+
+canvas_pool = CanvasPool()
+
+
+class GradientCache:
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024) -> None:
+        """
+        渐变图缓存，以 `(尺寸, 颜色)` 为键保存画好的渐变图，总大小超过 `max_bytes` 时按最近最少使用淘汰
+        
+        Params:
+            `max_bytes`: 缓存总大小上限
+        """
+        self.max_bytes = max_bytes
+        self._images: 'OrderedDict[tuple, Image.Image]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[Image.Image]:
+        """
+        取出渐变图，返回的图片为共享对象，只可作为复制源
+        
+        Params:
+            `key`: 缓存键
+        Returns:
+            `Optional[PIL.Image.Image]`
+        """
+        with self._lock:
+            im = self._images.get(key)
+            if im is not None:
+                self._images.move_to_end(key)
+            return im
+
+    def put(self, key: tuple, im: Image.Image) -> None:
+        """
+        保存渐变图的副本，单张超过上限时不保存
+        
+        Params:
+            `key`: 缓存键
+            `im`: 渐变图
+        """
+        nbytes = im.size[0] * im.size[1] * 4
+        if nbytes > self.max_bytes:
+            return
+        im = im.copy()
+        with self._lock:
+            if key in self._images:
+                return
+            self._images[key] = im
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, old = self._images.popitem(last=False)
+                self._bytes -= old.size[0] * old.size[1] * 4
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._images.clear()
+            self._bytes = 0
+
+
+gradient_cache = GradientCache()
+
+
+def _gradient_rows(
+    height: int,
+    color1: Tuple[int, int, int],
+    color2: Tuple[int, int, int],
+    color3: Tuple[int, int, int]
+) -> List[Tuple[int, int, int, int]]:
+    y = np.arange(height, dtype=np.float64)[:, None]
+    c1, c2, c3 = (np.array(c, dtype=np.float64) for c in (color1, color2, color3))
+    split = height * 0.4
+    top = y / split
+    bottom = (y - split) / (height * 0.6)
+    column = np.where(
+        y < split,
+        (1 - top) * c1 + top * c2,
+        (1 - bottom) * c2 + bottom * c3
+    )
+    column = np.clip(column, 0, 255).astype(np.uint8)
+    return [(r, g, b, 255) for r, g, b in column.tolist()]
+
+
 def tricolor_gradient(
     width: int, 
     height: int, 
@@ -59,20 +240,96 @@ def tricolor_gradient(
     color2: Tuple[int, int, int] = (193, 247, 225), 
     color3: Tuple[int, int, int] = (255, 255, 255)
 ) -> Image.Image:
-    """绘制渐变色"""
-    array = np.zeros((height, width, 3), dtype=np.uint8)
+    """
+    绘制渐变色，相同尺寸和颜色的渐变图按字节数上限缓存，每次返回从画布池取出的副本；
+    未命中时逐行颜色一次算出后直接填入从画布池取出的画布
     
-    for y in range(height):
-        if y < height * 0.4:
-            ratio = y / (height * 0.4)
-            color = (1 - ratio) * np.array(color1) + ratio * np.array(color2)
-        else:
-            ratio = (y - height * 0.4) / (height * 0.6)
-            color = (1 - ratio) * np.array(color2) + ratio * np.array(color3)
-        array[y, :] = np.clip(color, 0, 255)
+    Params:
+        `width`: 宽度
+        `height`: 高度
+        `color1`: 顶部颜色
+        `color2`: 40% 高度处颜色
+        `color3`: 底部颜色
+    Returns:
+        `PIL.Image.Image`
+    """
+    key = ((width, height), tuple(color1), tuple(color2), tuple(color3))
+    if (cached := gradient_cache.get(key)) is not None:
+        return canvas_pool.copy(cached)
+    im = canvas_pool.acquire('RGBA', (width, height))
+    for y, color in enumerate(_gradient_rows(height, *key[1:])):
+        im.paste(color, (0, y, width, y + 1))
+    gradient_cache.put(key, im)
+    return im
+
+
+def sprite(name: str, size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    读取 `maimaidir` 下的素材，优先从预烘焙的资源包中取出，不在资源包中时读取图片文件并缓存。
+    资源包中的素材直接引用当前一代的映射内存，不另行缓存，资源包重新烘焙后随之更新。
+    返回的图片为共享对象，只可作为粘贴源，不可修改
+    
+    Params:
+        `name`: 素材文件名
+        `size`: 缩放尺寸，为 `None` 时保持原尺寸
+    Returns:
+        `PIL.Image.Image`
+    """
+    if (im := sprite_pack.get(name, size)) is not None:
+        return im
+    return _sprite_file(name, size)
+
+
+@lru_cache(maxsize=256)
+def _sprite_file(name: str, size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    im = Image.open(maimaidir / name).convert('RGBA')
+    if size is not None:
+        im = im.resize(size)
+    return im
+    im = Image.open(maimaidir / name).convert('RGBA')
+    if size is not None:
+        im = im.resize(size)
+    return im
+
+
+@lru_cache(maxsize=512)
+def _cover_image(music_id: int, size: Tuple[int, int]) -> Image.Image:
+    return open_cover(music_id).convert('RGBA').resize(size)
+
+
+def cover_image(music_id: Union[int, str], size: Tuple[int, int]) -> Image.Image:
+    """
+    读取缩放后的曲绘并缓存，返回的图片为共享对象，只可作为粘贴源，不可修改
+    
+    Params:
+        `music_id`: 曲目 ID
+        `size`: 缩放尺寸
+    Returns:
+        `PIL.Image.Image`
+    """
+    return _cover_image(int(music_id), tuple(size))
+
+
+@lru_cache(maxsize=64)
+def rounded_mask(
+    size: Tuple[int, int],
+    radius: int,
+    corners: Tuple[bool, bool, bool, bool] = (False, False, False, False)
+) -> Image.Image:
+    """
+    生成圆角蒙版并缓存，返回的蒙版为共享对象，不可修改
     
-    image = Image.fromarray(array).convert('RGBA')
-    return image
+    Params:
+        `size`: 蒙版尺寸
+        `radius`: 圆角半径
+        `corners`: 四个角是否绘制圆角，分别是左上、右上、右下、左下
+    Returns:
+        `PIL.Image.Image`
+    """
+    mask = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(mask)
+    draw.rounded_rectangle((0, 0, size[0], size[1]), radius, fill=255, corners=corners)
+    return mask
 
 
 def rounded_corners(
@@ -90,14 +347,57 @@ def rounded_corners(
     Returns:
         `PIL.Image.Image`
     """
-    mask = Image.new('L', image.size, 0)
-    draw = ImageDraw.Draw(mask)
-    draw.rounded_rectangle((0, 0, image.size[0], image.size[1]), radius, fill=255, corners=corners)
+    new_im = image.copy()
+    new_im.putalpha(rounded_mask(image.size, radius, tuple(corners)))
+    return new_im
 
-    new_im = ImageOps.fit(image, mask.size)
-    new_im.putalpha(mask)
 
-    return new_im
+@lru_cache(maxsize=128)
+def _rounded_cover(
+    music_id: int,
+    size: Tuple[int, int],
+    radius: int,
+    corners: Tuple[bool, bool, bool, bool]
+) -> Image.Image:
+    return rounded_corners(_cover_image(music_id, size), radius, corners)
+
+
+def rounded_cover(
+    music_id: Union[int, str],
+    size: Tuple[int, int],
+    radius: int,
+    corners: Tuple[bool, bool, bool, bool] = (True, True, True, True)
+) -> Image.Image:
+    """
+    读取缩放并绘制圆角后的曲绘并缓存，返回的图片为共享对象，只可作为粘贴源，不可修改
+    
+    Params:
+        `music_id`: 曲目 ID
+        `size`: 缩放尺寸
+        `radius`: 圆角半径
+        `corners`: 四个角是否绘制圆角，分别是左上、右上、右下、左下
+    Returns:
+        `PIL.Image.Image`
+    """
+    return _rounded_cover(int(music_id), tuple(size), radius, tuple(corners))
+
+
+def clear_cover_cache() -> None:
+    """曲绘有更新后清空缩放曲绘和圆角曲绘的缓存"""
+    _cover_image.cache_clear()
+    _rounded_cover.cache_clear()
+
+
+def _cover_ids(music_id: int) -> Iterator[int]:
+    """按查找顺序产出曲绘可能使用的曲目 ID，最后为默认曲绘"""
+    yield music_id
+    if music_id > 100000:
+        music_id -= 100000
+        yield music_id
+    if 1000 < music_id < 10000 or 10000 < music_id <= 11000:
+        yield music_id + 10000
+        yield music_id - 10000
+    yield 11000
 
 
 def music_picture(music_id: Union[int, str]) -> Path:
@@ -109,20 +409,59 @@ def music_picture(music_id: Union[int, str]) -> Path:
     Returns:
         `Path`
     """
-    music_id = int(music_id)
-    if (_path := coverdir / f'{music_id}.png').exists():
-        return _path
-    if music_id > 100000:
-        music_id -= 100000
-        if (_path := coverdir / f'{music_id}.png').exists():
+    for _id in _cover_ids(int(music_id)):
+        if (_path := coverdir / f'{_id}.png').exists():
             return _path
-    if 1000 < music_id < 10000 or 10000 < music_id <= 11000:
-        for _id in [music_id + 10000, music_id - 10000]:
-            if (_path := coverdir / f'{_id}.png').exists():
-                return _path
     return coverdir / '11000.png'
 
 
+def open_cover(music_id: Union[int, str]) -> Image.Image:
+    """
+    打开曲绘原图，每个候选 ID 先查曲绘归档，不在归档中时再读取图片文件，查找顺序与 `music_picture` 相同
+    
+    Params:
+        `music_id`: 曲目 ID
+    Returns:
+        `PIL.Image.Image`
+    """
+    for _id in _cover_ids(int(music_id)):
+        if (data := cover_archive.get(_id)) is not None:
+            return Image.open(BytesIO(data))
+        if (_path := coverdir / f'{_id}.png').exists():
+            return Image.open(_path)
+    return Image.open(coverdir / '11000.png')
+
+
+def cover_exists(music_id: Union[int, str]) -> bool:
+    """
+    曲绘归档或曲绘目录中是否有该曲目的曲绘，不计默认曲绘
+
+    Params:
+        `music_id`: 曲目 ID
+    Returns:
+        `bool`
+    """
+    *ids, _ = _cover_ids(int(music_id))
+    return any(_id in cover_archive or (coverdir / f'{_id}.png').exists() for _id in ids)
+
+
+def cover_stamp(music_id: Union[int, str]) -> int:
+    """
+    曲绘版本标识，归档中的曲绘为内容的 CRC32，否则为文件修改时间，曲绘不存在时为 `0`
+    
+    Params:
+        `music_id`: 曲目 ID
+    Returns:
+        `int`
+    """
+    for _id in _cover_ids(int(music_id)):
+        if stamp := cover_archive.stamp(_id):
+            return stamp
+        if (_path := coverdir / f'{_id}.png').exists():
+            return _path.stat().st_mtime_ns
+    return 0
+
+
 def text_to_image(text: str) -> Image.Image:
     font = ImageFont.truetype(str(SHANGGUMONO), 24)
     padding = 10
@@ -142,9 +481,232 @@ def text_to_image(text: str) -> Image.Image:
     return im
 
 
-def image_to_base64(img: Image.Image, format='PNG') -> str:
-    output_buffer = BytesIO()
-    img.save(output_buffer, format)
-    byte_data = output_buffer.getvalue()
-    base64_str = base64.b64encode(byte_data).decode()
+@lru_cache(maxsize=64)
+def get_font(path: Union[str, Path], size: int) -> ImageFont.FreeTypeFont:
+    """
+    读取字体并缓存
+    
+    Params:
+        `path`: 字体路径
+        `size`: 字号
+    Returns:
+        `ImageFont.FreeTypeFont`
+    """
+    return ImageFont.truetype(str(path), size)
+
+
+# 不可出现在行首的标点
+_no_line_start = set('、。，．・：；？！ー～」』）〕］｝〉》】〙〗’”…‥ぁぃぅぇぉっゃゅょァィゥェォッャュョ,.!?;:)]}%')
+# 不可出现在行尾的标点
+_no_line_end = set('「『（〔［｛〈《【〘〖‘“([{')
+
+_advances: Dict[Tuple[str, int], Dict[str, float]] = {}
+_advances_lock = threading.Lock()
+
+
+def _is_cjk(ch: str) -> bool:
+    return '\u2e80' <= ch <= '\ufaff' or '\uff00' <= ch <= '\uffef' or ch >= '\U00020000'
+
+
+def _can_break(prev: str, ch: str) -> bool:
+    """判断 `prev` 和 `ch` 之间能否换行"""
+    if ch in _no_line_start or prev in _no_line_end:
+        return False
+    if prev == ' ':
+        return ch != ' '
+    if ch == ' ':
+        return False
+    return _is_cjk(prev) or _is_cjk(ch) or prev == '-'
+
+
+def glyph_advances(font: ImageFont.FreeTypeFont) -> Dict[str, float]:
+    """
+    获取字体的字形宽度缓存，按 `(字体路径, 字号)` 共享
+    
+    Params:
+        `font`: 字体
+    Returns:
+        `Dict[str, float]` 字符到宽度的映射，未测量的字符需调用方补充
+    """
+    key = (str(font.path), font.size)
+    with _advances_lock:
+        return _advances.setdefault(key, {})
+
+
+def _wrap_line(text: str, font: ImageFont.FreeTypeFont, max_width: float) -> List[str]:
+    advances = glyph_advances(font)
+    prefix = [0.0]
+    for ch in text:
+        if (w := advances.get(ch)) is None:
+            w = advances[ch] = font.getlength(ch)
+        prefix.append(prefix[-1] + w)
+
+    lines = []
+    n = len(text)
+    start = i = 0
+    brk = -1
+    while i < n:
+        if i > start and _can_break(text[i - 1], text[i]):
+            brk = i
+        if i > start and prefix[i + 1] - prefix[start] > max_width:
+            cut = brk if brk > start else i
+            lines.append(text[start:cut].rstrip(' '))
+            start = cut
+            while start < n and text[start] == ' ':
+                start += 1
+            # 断点之后已测量的字符重新扫描一次，每个字符最多被重新扫描一次
+            i = start
+            brk = -1
+            continue
+        i += 1
+    if start < n or not lines:
+        lines.append(text[start:])
+    return lines
+
+
+@lru_cache(maxsize=2048)
+def _wrap_text(text: str, path: str, size: int, max_width: float) -> Tuple[str, ...]:
+    font = get_font(path, size)
+    lines = []
+    for paragraph in text.split('\n'):
+        lines.extend(_wrap_line(paragraph, font, max_width))
+    return tuple(lines)
+
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: float) -> Tuple[str, ...]:
+    """
+    按像素宽度自动换行，相同内容的排版结果会被缓存
+    
+    每个字形的宽度按字体只测量一次，断行在一次线性扫描中完成：
+    中日韩文字之间可以断行，拉丁文字只在空格和连字符后断行，单词超过整行宽度时按字符断行，
+    行首行尾禁则标点不会被单独断开
+    
+    Params:
+        `text`: 文本，`\\n` 为强制换行
+        `font`: 字体
+        `max_width`: 最大行宽
+    Returns:
+        `Tuple[str, ...]` 各行文本
+    """
+    return _wrap_text(text, str(font.path), font.size, max_width)
+
+
+def draw_wrapped_text(
+    draw: ImageDraw.ImageDraw,
+    xy: Tuple[float, float],
+    text: str,
+    font: ImageFont.FreeTypeFont,
+    fill: Tuple[int, ...],
+    max_width: float,
+    line_height: Optional[int] = None,
+    align: str = 'left'
+) -> int:
+    """
+    绘制自动换行的文字
+    
+    Params:
+        `draw`: 画布
+        `xy`: 起始坐标，`align` 为 `center` 时 `x` 为中心线
+        `text`: 文本
+        `font`: 字体
+        `fill`: 颜色
+        `max_width`: 最大行宽
+        `line_height`: 行高，默认为字号加 `4`
+        `align`: `left` 或 `center`
+    Returns:
+        `int` 绘制的总高度
+    """
+    if line_height is None:
+        line_height = font.size + 4
+    x, y = xy
+    lines = wrap_text(text, font, max_width)
+    for i, line in enumerate(lines):
+        lx = x - draw.textlength(line, font=font) // 2 if align == 'center' else x
+        draw.text((lx, y + i * line_height), line, font=font, fill=fill)
+    return len(lines) * line_height
+
+
+encode_profiles: Dict[str, Dict[str, Any]] = {
+    'default': {'format': 'PNG', 'compress_level': 6},
+    'text': {'format': 'PNG', 'compress_level': 6, 'palette': 256},
+    'card': {'format': 'PNG', 'compress_level': 3},
+    'table': {'format': 'JPEG', 'quality': 90, 'subsampling': 0},
+}
+"""
+各类图片的编码参数，可在运行时修改
+
+    - `format`: `PNG`、`JPEG` 或 `WEBP`
+    - `palette`: 大于 `0` 时先量化为对应颜色数的调色板图
+    - 其余参数直接传给 `PIL.Image.Image.save`，如 `compress_level`、`quality`
+"""
+
+_buffers = threading.local()
+
+
+def _encode(image: Image.Image, kind: str, label: str, options: Dict[str, Any]) -> BytesIO:
+    """
+    按图片类型编码到当前线程复用的缓冲区，返回的缓冲区在同一线程下次编码前有效
+    """
+    opts = {**encode_profiles.get(kind, encode_profiles['default']), **options}
+    fmt = opts.pop('format').upper()
+    palette = opts.pop('palette', 0)
+    _otime = time.perf_counter()
+    if palette:
+        image = image.quantize(palette, method=Image.Quantize.FASTOCTREE)
+    elif fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        if 'A' in image.getbands():
+            flat = Image.new('RGB', image.size, (255, 255, 255))
+            flat.paste(image, mask=image.getchannel('A'))
+            image = flat
+        else:
+            image = image.convert('RGB')
+    buffer: Optional[BytesIO] = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    image.save(buffer, fmt, **opts)
+    logger.debug(
+        '[图片编码] %s %dx%d %s %.1fKB %.1fms', label or kind, image.width, image.height, fmt,
+        buffer.tell() / 1024, (time.perf_counter() - _otime) * 1000
+    )
+    return buffer
+
+
+def encode_image(image: Image.Image, kind: str = 'default', label: str = '', **options: Any) -> bytes:
+    """
+    按图片类型选择格式并编码
+    
+    Params:
+        `image`: 图片
+        `kind`: 图片类型，见 `encode_profiles`
+        `label`: 日志中显示的名称
+        `options`: 覆盖 `encode_profiles` 中的参数
+    Returns:
+        `bytes`
+    """
+    return _encode(image, kind, label, options).getvalue()
+
+
+def image_suffix(data: bytes) -> str:
+    """
+    根据文件头判断已编码图片的后缀名
+    
+    Params:
+        `data`: 已编码的图片
+    Returns:
+        `str`
+    """
+    if data[:3] == b'\xff\xd8\xff':
+        return '.jpg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    return '.png'
+
+
+def image_to_base64(img: Image.Image, format='PNG', kind: Optional[str] = None) -> str:
+    options = {} if kind else {'format': format}
+    buffer = _encode(img, kind or 'default', '', options)
+    with buffer.getbuffer() as view:
+        base64_str = base64.b64encode(view).decode()
     return 'base64://' + base64_str
\ No newline at end of file
@@ -1,16 +1,26 @@
+import asyncio
+import heapq
 import math
+import threading
 import traceback
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from functools import lru_cache
 from io import BytesIO
-from typing import Optional, Tuple, Union, overload, List
+from typing import Optional, Sequence, Set, Tuple, Union, overload, List
 
+import numpy as np
+from aiohttp import ClientError
 from PIL import Image, ImageDraw
 
-from .config import BOTNAME, maimaidir, coverdir, ratingdir, platedir, SIYUAN, SHANGGUMONO, TBFONT, score_Rank_l, fcl, fsl
-from .image import DrawText, image_to_base64, music_picture
+from .config import BOTNAME, maimaidir, coverdir, ratingdir, platedir, SIYUAN, SHANGGUMONO, TBFONT, score_Rank_l, fcl, fsl, achievementList, BaseRaSpp
+from .image import DrawText, canvas_pool, cover_image, encode_image, image_to_base64, music_picture, sprite, tricolor_gradient
 from .maimaidx_api_data import maiApi
 from .maimaidx_error import *
-from .maimaidx_model import ChartInfo, PlayInfoDefault, PlayInfoDev, UserInfo
+from .maimaidx_model import ChartInfo, Data, PlayInfoDefault, PlayInfoDev, UserInfo, UserInfoDev
 from .maimaidx_music import mai
+from .record_store import record_store
+from .render import renderer, singleflight
 
 
 class ScoreBaseImage:
@@ -47,17 +57,20 @@ class ScoreBaseImage:
     pattern_bg = None
     rainbow_bg = None
     rainbow_bottom_bg = None
+    _backgrounds: 'OrderedDict[Tuple[int, int], Image.Image]' = OrderedDict()
+    _backgrounds_bytes: int = 0
+    _backgrounds_limit: int = 128 * 1024 * 1024
+    _pattern_strip: Optional[Image.Image] = None
+    _tiles: 'OrderedDict[tuple, Image.Image]' = OrderedDict()
+    _tiles_limit: int = 512
+    _lock = threading.RLock()
 
     @classmethod
     def _load_image(cls):
         def safe_open(path, size=None, mode=None, name_hint=None):
             try:
-                img = Image.open(path)
-                if mode:
-                    img = img.convert(mode)
-                if size:
-                    img = img.resize(size)
-                return img
+                # 素材均作为 RGBA 粘贴源使用，统一经由 `sprite` 从资源包或图片文件读取
+                return sprite(path.name, size)
             except Exception as e:
                 print(f"[图片缺失] 无法加载 {path}，用于{name_hint or path}，将使用空白图代替。错误: {e}")
                 if size:
@@ -89,12 +102,87 @@ class ScoreBaseImage:
         cls.rainbow_bg = safe_open(maimaidir / 'rainbow.png', None, 'RGBA', 'rainbow')
         cls.rainbow_bottom_bg = safe_open(maimaidir / 'rainbow_bottom.png', (1200, 200), 'RGBA', 'rainbow_bottom')
         cls.id_diff = cls._diff
-    
+        cls._backgrounds.clear()
+        cls._backgrounds_bytes = 0
+        cls._pattern_strip = None
+        cls._tiles.clear()
+
+    @classmethod
+    def clear_tiles(cls) -> None:
+        """清空成绩卡片缓存，曲绘有更新后调用"""
+        with ScoreBaseImage._lock:
+            ScoreBaseImage._tiles.clear()
+
+    @classmethod
+    def _ensure_image(cls) -> None:
+        """强制加载图片资源"""
+        with ScoreBaseImage._lock:
+            if not ScoreBaseImage._diff or any(i is None for i in ScoreBaseImage._diff):
+                ScoreBaseImage._load_image()
+
+    @classmethod
+    def _pattern_layer(cls, width: int, height: int) -> Image.Image:
+        """
+        获取平铺花纹层，已有更高的花纹层时直接裁剪，不够高时重新延长
+        
+        Params:
+            `width`: 宽度
+            `height`: 高度
+        Returns:
+            `PIL.Image.Image`
+        """
+        strip = ScoreBaseImage._pattern_strip
+        if strip is None or strip.size[0] != width or strip.size[1] < height:
+            tall = max(height, strip.size[1] if strip is not None and strip.size[0] == width else 0)
+            strip = Image.new('RGBA', (width, tall), (0, 0, 0, 0))
+            for h in range((tall // 358) + 1):
+                strip.paste(cls.pattern_bg, (0, (358 + 7) * h))
+            ScoreBaseImage._pattern_strip = strip
+        return strip.crop((0, 0, width, height))
+
+    @classmethod
+    def background(cls, width: int, height: int) -> Image.Image:
+        """
+        获取合成好装饰层的背景图，包含渐变、极光、闪光、彩虹和平铺花纹。
+        同尺寸背景只合成一次，之后返回从画布池取出的副本
+        
+        Params:
+            `width`: 宽度
+            `height`: 高度
+        Returns:
+            `PIL.Image.Image`
+        """
+        cache = ScoreBaseImage._backgrounds
+        key = (width, height)
+        with ScoreBaseImage._lock:
+            bg = cache.get(key)
+            if bg is not None:
+                cache.move_to_end(key)
+        if bg is not None:
+            return canvas_pool.copy(bg)
+
+        cls._ensure_image()
+        def safe_bg(bg, size):
+            return bg if bg is not None else Image.new('RGBA', size, (0, 0, 0, 0))
+        bg = tricolor_gradient(width, height)
+        bg.alpha_composite(safe_bg(cls.aurora_bg, (1400, 220)))
+        bg.alpha_composite(safe_bg(cls.shines_bg, (1400, 220)), (34, 0))
+        bg.alpha_composite(safe_bg(cls.rainbow_bg, (1400, 220)), (319, height - 643))
+        bg.alpha_composite(safe_bg(cls.rainbow_bottom_bg, (1200, 200)), (100, height - 343))
+        with ScoreBaseImage._lock:
+            pattern = cls._pattern_layer(width, height)
+        bg.alpha_composite(pattern)
+        with ScoreBaseImage._lock:
+            if key not in cache:
+                cache[key] = bg
+                ScoreBaseImage._backgrounds_bytes += width * height * 4
+            while ScoreBaseImage._backgrounds_bytes > cls._backgrounds_limit and len(cache) > 1:
+                (w, h), _ = cache.popitem(last=False)
+                ScoreBaseImage._backgrounds_bytes -= w * h * 4
+        return canvas_pool.copy(bg)
     
     def __init__(self, image: Image.Image = None) -> None:
-        # 强制加载图片资源
-        if not ScoreBaseImage._diff or any(i is None for i in ScoreBaseImage._diff):
-            ScoreBaseImage._load_image()
+        self._ensure_image()
         self._im = image
         dr = ImageDraw.Draw(self._im)
         self._sy = DrawText(dr, SIYUAN)
@@ -127,48 +215,84 @@ class ScoreBaseImage:
             else:
                 x += 276
 
-            # 直接用原图作为背景，左上角对齐，不做resize
-            bg_img = self._diff[info.level_index]
-            if bg_img is not None:
-                self._im.alpha_composite(bg_img, (x, y))
-            cover = Image.open(music_picture(info.song_id)).resize((75, 75))
-            self._im.alpha_composite(cover, (x + 12, y + 12))
-            version = Image.open(maimaidir / f'{info.type.upper()}.png').resize((37, 14))
-            if info.rate.islower():
-                rate = Image.open(maimaidir / f'UI_TTR_Rank_{score_Rank_l[info.rate]}.png').resize((63, 28))
-            else:
-                rate = Image.open(maimaidir / f'UI_TTR_Rank_{info.rate}.png').resize((63, 28))
-
-            self._im.alpha_composite(version, (x + 51, y + 91))
-            self._im.alpha_composite(rate, (x + 92, y + 78))
-            if info.fc:
-                fc = Image.open(maimaidir / f'UI_MSS_MBase_Icon_{fcl[info.fc]}.png').resize((34, 34))
-                self._im.alpha_composite(fc, (x + 154, y + 77))
-            if info.fs:
-                fs = Image.open(maimaidir / f'UI_MSS_MBase_Icon_{fsl[info.fs]}.png').resize((34, 34))
-                self._im.alpha_composite(fs, (x + 185, y + 77))
-            
             dxscore = sum(mai.total_list.by_id(str(info.song_id)).charts[info.level_index].notes) * 3
-            dxnum = dxScore(info.dxScore / dxscore * 100)
-            if dxnum:
-                self._im.alpha_composite(
-                    Image.open(maimaidir / f'UI_GAM_Gauge_DXScoreIcon_0{dxnum}.png').resize((47, 26)), (x + 217, y + 80)
-                )
-
-            self._tb.draw(x + 26, y + 98, 13, info.song_id, self.id_color[info.level_index], anchor='mm')
-            title = info.title
-            if coloumWidth(title) > 18:
-                title = changeColumnWidth(title, 17) + '...'
-            self._sy.draw(x + 93, y + 14, 14, title, self.t_color[info.level_index], anchor='lm')
-            self._tb.draw(x + 93, y + 38, 30, f'{info.achievements:.4f}%', self.t_color[info.level_index], anchor='lm')
-            self._tb.draw(x + 219, y + 65, 15, f'{info.dxScore}/{dxscore}', self.t_color[info.level_index], anchor='mm')
-            self._tb.draw(x + 93, y + 65, 15, f'{info.ds} -> {info.ra}', self.t_color[info.level_index], anchor='lm')
+            self._im.alpha_composite(self._score_tile(info, dxscore), (x, y))
+
+    @classmethod
+    def _score_tile(cls, info: Union[ChartInfo, PlayInfoDefault, PlayInfoDev], dxscore: int) -> Image.Image:
+        """
+        获取单个成绩卡片，相同成绩的卡片只绘制一次，之后从缓存中取出
+        
+        Params:
+            `info`: 成绩
+            `dxscore`: 谱面DX分上限
+        Returns:
+            `PIL.Image.Image` 共享对象，只可作为粘贴源
+        """
+        key = (
+            info.song_id, info.level_index, info.type, info.title, info.achievements,
+            info.fc, info.fs, info.dxScore, dxscore, info.ds, info.ra, info.rate
+        )
+        cache = ScoreBaseImage._tiles
+        with ScoreBaseImage._lock:
+            tile = cache.get(key)
+            if tile is not None:
+                cache.move_to_end(key)
+                return tile
+
+        tile = cls._draw_tile(info, dxscore)
+        with ScoreBaseImage._lock:
+            cache[key] = tile
+            while len(cache) > cls._tiles_limit:
+                cache.popitem(last=False)
+        return tile
+
+    @classmethod
+    def _draw_tile(cls, info: Union[ChartInfo, PlayInfoDefault, PlayInfoDev], dxscore: int) -> Image.Image:
+        """
+        绘制单个成绩卡片
+        
+        Params:
+            `info`: 成绩
+            `dxscore`: 谱面DX分上限
+        Returns:
+            `PIL.Image.Image`
+        """
+        # 直接用原图作为背景，左上角对齐，不做resize
+        bg_img = cls._diff[info.level_index]
+        tile = bg_img.convert('RGBA') if bg_img is not None else Image.new('RGBA', (264, 109))
+        dr = ImageDraw.Draw(tile)
+        sy = DrawText(dr, SIYUAN)
+        tb = DrawText(dr, TBFONT)
+
+        tile.alpha_composite(cover_image(info.song_id, (75, 75)), (12, 12))
+        rate = score_Rank_l[info.rate] if info.rate.islower() else info.rate
+        tile.alpha_composite(sprite(f'{info.type.upper()}.png', (37, 14)), (51, 91))
+        tile.alpha_composite(sprite(f'UI_TTR_Rank_{rate}.png', (63, 28)), (92, 78))
+        if info.fc:
+            tile.alpha_composite(sprite(f'UI_MSS_MBase_Icon_{fcl[info.fc]}.png', (34, 34)), (154, 77))
+        if info.fs:
+            tile.alpha_composite(sprite(f'UI_MSS_MBase_Icon_{fsl[info.fs]}.png', (34, 34)), (185, 77))
+
+        dxnum = dxScore(info.dxScore / dxscore * 100)
+        if dxnum:
+            tile.alpha_composite(sprite(f'UI_GAM_Gauge_DXScoreIcon_0{dxnum}.png', (47, 26)), (217, 80))
+
+        tb.draw(26, 98, 13, info.song_id, cls.id_color[info.level_index], anchor='mm')
+        title = info.title
+        if coloumWidth(title) > 18:
+            title = changeColumnWidth(title, 17) + '...'
+        sy.draw(93, 14, 14, title, cls.t_color[info.level_index], anchor='lm')
+        tb.draw(93, 38, 30, f'{info.achievements:.4f}%', cls.t_color[info.level_index], anchor='lm')
+        tb.draw(219, 65, 15, f'{info.dxScore}/{dxscore}', cls.t_color[info.level_index], anchor='mm')
+        tb.draw(93, 65, 15, f'{info.ds} -> {info.ra}', cls.t_color[info.level_index], anchor='lm')
+        return tile
 
 
 class DrawBest(ScoreBaseImage):
 
     def __init__(self, UserInfo: UserInfo) -> None:
-        super().__init__(Image.open(maimaidir / 'b50_bg.png').convert('RGBA'))
+        super().__init__(canvas_pool.copy(sprite('b50_bg.png')))
         self.userName = UserInfo.nickname
         self.plate = UserInfo.plate
         self.addRating = UserInfo.additional_rating
@@ -220,7 +344,7 @@ class DrawBest(ScoreBaseImage):
             num = f'{self.addRating + 1:02d}'
         return f'UI_DNM_DaniPlate_{num}.png'
 
-    async def draw(self) -> Image.Image:
+    def draw(self) -> Image.Image:
         
         logo = Image.open(maimaidir / 'logo.png').resize((249, 120))
         dx_rating = Image.open(maimaidir / self._findRaPic()).resize((186, 35))
@@ -291,37 +415,102 @@ def dxScore(dx: int) -> int:
     return result
 
 
+# 东亚字符显示宽度表，`(码位上界, 宽度)`，按码位升序排列
+_width_bounds = [
+    126, 159, 687, 710, 711, 727, 733, 879, 1154, 1161,
+    4347, 4447, 7467, 7521, 8369, 8426, 9000, 9002, 11021,
+    12350, 12351, 12438, 12442, 19893, 19967, 55203, 63743,
+    64106, 65039, 65059, 65131, 65279, 65376, 65500, 65510,
+    120831, 262141, 1114109,
+]
+_width_values = [
+    1, 0, 1, 0, 1, 0, 1, 0, 1, 0,
+    1, 2, 1, 0, 1, 0, 1, 2, 1,
+    2, 1, 2, 0, 2, 1, 2, 1,
+    2, 1, 0, 2, 1, 2, 1, 2,
+    1, 2, 1,
+]
+
+
+def _bmp_width_table() -> bytes:
+    table = bytearray(0x10000)
+    low = 0
+    for num, wid in zip(_width_bounds, _width_values):
+        high = min(num, 0xffff) + 1
+        table[low:high] = bytes([wid]) * (high - low)
+        low = high
+        if low > 0xffff:
+            break
+    table[0xe] = table[0xf] = 0
+    return bytes(table)
+
+
+_bmp_widths = _bmp_width_table()
+
+
 def getCharWidth(o: int) -> int:
-    widths = [
-        (126, 1), (159, 0), (687, 1), (710, 0), (711, 1), (727, 0), (733, 1), (879, 0), (1154, 1), (1161, 0),
-        (4347, 1), (4447, 2), (7467, 1), (7521, 0), (8369, 1), (8426, 0), (9000, 1), (9002, 2), (11021, 1),
-        (12350, 2), (12351, 1), (12438, 2), (12442, 0), (19893, 2), (19967, 1), (55203, 2), (63743, 1),
-        (64106, 2), (65039, 1), (65059, 0), (65131, 2), (65279, 1), (65376, 2), (65500, 1), (65510, 2),
-        (120831, 1), (262141, 2), (1114109, 1),
-    ]
-    if o == 0xe or o == 0xf:
-        return 0
-    for num, wid in widths:
-        if o <= num:
-            return wid
-    return 1
+    if o <= 0xffff:
+        return _bmp_widths[o]
+    i = bisect_left(_width_bounds, o)
+    return _width_values[i] if i < len(_width_values) else 1
 
 
+@lru_cache(maxsize=4096)
 def coloumWidth(s: str) -> int:
-    res = 0
-    for ch in s:
-        res += getCharWidth(ord(ch))
-    return res
+    return sum(getCharWidth(ord(ch)) for ch in s)
 
 
+@lru_cache(maxsize=4096)
 def changeColumnWidth(s: str, len: int) -> str:
     res = 0
-    sList = []
-    for ch in s:
+    for n, ch in enumerate(s):
         res += getCharWidth(ord(ch))
-        if res <= len:
-            sList.append(ch)
-    return ''.join(sList)
+        if res > len:
+            return s[:n]
+    return s
+
+
+rateList: List[str] = ['D', 'C', 'B', 'BB', 'BBB', 'A', 'AA', 'AAA', 'S', 'Sp', 'SS', 'SSp', 'SSS', 'SSSp']
+"""评价，与 `BaseRaSpp` 一一对应，`achievementList` 为相邻评价的分界"""
+
+_ra_bounds = np.array(achievementList)
+_ra_base = np.array(BaseRaSpp)
+
+
+def computeRaArray(
+    ds: Union[Sequence[float], np.ndarray],
+    achievements: Union[Sequence[float], np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    批量计算底分和评价，`ds` 与 `achievements` 按 NumPy 规则广播，结果与逐个调用 `computeRa` 相同
+    
+    Params:
+        `ds`: 定数
+        `achievements`: 成绩
+    Returns:
+        `Tuple[np.ndarray, np.ndarray]` 底分和评价在 `rateList` 中的下标
+    """
+    ds = np.asarray(ds, dtype=np.float64)
+    achievements = np.asarray(achievements, dtype=np.float64)
+    index = np.searchsorted(_ra_bounds, achievements, side='right')
+    ra = np.floor(ds * (np.minimum(100.5, achievements) / 100) * _ra_base[index]).astype(np.int64)
+    return ra, index
+
+
+def fillRa(records: Sequence[PlayInfoDefault], ds: Sequence[float]) -> None:
+    """
+    批量计算成绩的底分和评价并写入 `ra` 和 `rate`
+    
+    Params:
+        `records`: 成绩列表
+        `ds`: 与成绩一一对应的定数
+    """
+    if not records:
+        return
+    ra, index = computeRaArray(ds, [record.achievements for record in records])
+    for record, _ra, _i in zip(records, ra.tolist(), index.tolist()):
+        record.ra = _ra
+        record.rate = rateList[_i]
 
 
 @overload
@@ -366,48 +555,9 @@ def computeRa(
     onlyrate: bool = False, 
     israte: bool = False
 ) -> Union[int, Tuple[int, str]]:
-    if achievement < 50:
-        baseRa = 7.0
-        rate = 'D'
-    elif achievement < 60:
-        baseRa = 8.0
-        rate = 'C'
-    elif achievement < 70:
-        baseRa = 9.6
-        rate = 'B'
-    elif achievement < 75:
-        baseRa = 11.2
-        rate = 'BB'
-    elif achievement < 80:
-        baseRa = 12.0
-        rate = 'BBB'
-    elif achievement < 90:
-        baseRa = 13.6
-        rate = 'A'
-    elif achievement < 94:
-        baseRa = 15.2
-        rate = 'AA'
-    elif achievement < 97:
-        baseRa = 16.8
-        rate = 'AAA'
-    elif achievement < 98:
-        baseRa = 20.0
-        rate = 'S'
-    elif achievement < 99:
-        baseRa = 20.3
-        rate = 'Sp'
-    elif achievement < 99.5:
-        baseRa = 20.8
-        rate = 'SS'
-    elif achievement < 100:
-        baseRa = 21.1
-        rate = 'SSp'
-    elif achievement < 100.5:
-        baseRa = 21.6
-        rate = 'SSS'
-    else:
-        baseRa = 22.4
-        rate = 'SSSp'
+    index = bisect_right(achievementList, achievement)
+    baseRa = BaseRaSpp[index]
+    rate = rateList[index]
 
     if israte:
         data = (math.floor(ds * (min(100.5, achievement) / 100) * baseRa), rate)
@@ -419,22 +569,93 @@ def computeRa(
     return data
 
 
-async def generate(username: Optional[str] = None) -> Union[Image.Image, str]:
+RECORD_TTL = 60
+"""本地成绩库中的成绩在此时间（秒）内视为最新，直接用于生成 B50"""
+
+
+def new_song_ids() -> Set[int]:
+    """
+    当前版本的曲目 ID，计入 B15，其余曲目计入 B35
+    
+    Returns:
+        `Set[int]`
     """
-    生成b50
+    return {int(m.id) for m in mai.total_list if m.basic_info and m.basic_info.is_new}
+
+
+def best50_from_records(info: UserInfoDev) -> UserInfo:
+    """
+    从全部成绩中选出旧版本底分最高的 35 个和当前版本底分最高的 15 个谱面，生成与 `query_user_b50` 相同结构的数据
+    
+    Params:
+        `info`: 开发者用户信息
+    Returns:
+        `UserInfo`
+    """
+    new_ids = new_song_ids()
+    records = [r for r in info.records or [] if r.song_id < 100000]
+    fillRa(records, [r.ds for r in records])
+    old, new = [], []
+    for r in records:
+        (new if r.song_id in new_ids else old).append(r)
+    # 转换为 `ChartInfo`，`whiledraw` 按类型判断是否为 B50 布局
+    sd = [ChartInfo(**r.model_dump()) for r in heapq.nlargest(35, old, key=lambda r: (r.ra, r.achievements))]
+    dx = [ChartInfo(**r.model_dump()) for r in heapq.nlargest(15, new, key=lambda r: (r.ra, r.achievements))]
+    return UserInfo(
+        additional_rating=info.additional_rating,
+        nickname=info.nickname,
+        plate=info.plate,
+        rating=sum(r.ra for r in sd) + sum(r.ra for r in dx),
+        username=info.username,
+        charts=Data(sd=sd, dx=dx)
+    )
+
+
+async def load_dev_records(username: Optional[str]) -> UserInfoDev:
+    """
+    获取玩家的全部成绩，本地成绩库中的成绩在 `RECORD_TTL` 内直接使用，查分器不可用时使用本地成绩库中的成绩
+    
+    Params:
+        `username`: 查分器用户名
+    Returns:
+        `UserInfoDev`
+    """
+    info = await asyncio.to_thread(record_store.load, username, RECORD_TTL)
+    if info is None:
+        try:
+            info = await maiApi.query_user_get_dev(username=username)
+        except (ClientError, asyncio.TimeoutError, ServerError, UnknownError):
+            if (info := await asyncio.to_thread(record_store.load, username)) is None:
+                raise
+            print(f'[成绩库] 查分器不可用，使用本地成绩库中 {username or "默认用户"} 的成绩')
+    return info
+
+
+async def generate(username: Optional[str] = None) -> Union[bytes, str]:
+    """
+    生成b50，同一用户同时发起的多次请求只会查询和绘制一次，所有请求共享编码后的图片
     Params:
         `username`: 用户名
     Returns:
-        `Union[PIL.Image.Image, str]`
+        `Union[bytes, str]`
     """
+    return await singleflight.do(('b50', username), lambda: _generate(username))
+
+
+async def _generate(username: Optional[str]) -> Union[bytes, str]:
     try:
         if not hasattr(mai, 'total_list'):
             return '曲库未初始化，请先执行一次主菜单或相关数据加载指令！'
-        userinfo = await maiApi.query_user_b50(username=username)
-        draw_best = DrawBest(userinfo)
-        # 直接返回图片对象
-        return await draw_best.draw()
-    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError) as e:
+        if maiApi.token:
+            userinfo = best50_from_records(await load_dev_records(username))
+        else:
+            userinfo = await maiApi.query_user_b50(username=username)
+        im = await renderer.run(lambda: DrawBest(userinfo).draw())
+        data = await renderer.run(encode_image, im, 'table', 'b50')
+        # 编码后画布不再使用，归还画布池
+        canvas_pool.release(im)
+        return data
+    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError, RenderQueueFullError, RenderTimeoutError) as e:
         return str(e)
     except Exception as e:
         print(traceback.format_exc())
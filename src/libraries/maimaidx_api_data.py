@@ -10,6 +10,7 @@ from aiohttp import ClientSession, ClientTimeout
 from .config import config_json
 from .maimaidx_error import *
 from .maimaidx_model import *
+from .record_store import record_store
 
 
 class MaiConfig(BaseModel):
@@ -183,7 +184,12 @@ class MaimaiAPI:
         if username:
             params['username'] = username
         result = await self._requestmai('GET', '/dev/player/records', params=params)
-        return UserInfoDev.parse_obj(result)
+        info = UserInfoDev.parse_obj(result)
+        try:
+            await asyncio.to_thread(record_store.save, username, info)
+        except Exception as e:
+            print(f'[成绩库] 保存成绩失败: {e}')
+        return info
 
     async def query_user_post_dev(
         self,
@@ -65,5 +65,17 @@ class AliasesNotFoundError(Exception):
         return '未找到别名'
 
 
+class RenderQueueFullError(Exception):
+
+    def __str__(self) -> str:
+        return '当前绘图任务过多，请稍后再试'
+
+
+class RenderTimeoutError(Exception):
+
+    def __str__(self) -> str:
+        return '绘图超时，请稍后再试'
+
+
 class UnknownError(Exception):
     """未知错误"""
\ No newline at end of file
@@ -1,17 +1,18 @@
 import asyncio
+import hashlib
 import json
 import random
 import traceback
 from collections import Counter, defaultdict
 from copy import deepcopy
-from typing import Tuple
+from typing import Any, Tuple
 from pathlib import Path
 
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
 from .config import *
-from .image import image_to_base64, music_picture
+from .image import image_to_base64, open_cover
 from .maimaidx_api_data import maiApi
 from .maimaidx_error import *
 from .maimaidx_model import *
@@ -346,22 +347,37 @@ class MaiMusic:
     """游玩次数超过1w次的曲目数据"""
     guess_data: List[Music]
     """猜歌数据"""
+    _digests: Dict[str, str] = {}
+    """曲目、别名和牌子数据各自的内容摘要"""
 
     def __init__(self) -> None:
         """封装所有曲目信息以及猜歌数据，便于更新"""
+        self._digests = {}
+
+    @property
+    def version(self) -> str:
+        """曲库数据版本，由曲目、别名和牌子数据的内容摘要得出，数据不变时重启后保持不变，用于使绘图缓存失效"""
+        return hashlib.sha1(repr(sorted(self._digests.items())).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _digest(data: Any) -> str:
+        return hashlib.sha1(json.dumps(data, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
 
     async def get_music(self) -> None:
         """获取所有曲目数据"""
         self.total_list = await get_music_list()
         self.total_level_data = self.total_list.by_level_list()
+        self._digests['music'] = self._digest([m.model_dump(mode='json') for m in self.total_list])
 
     async def get_music_alias(self) -> None:
         """获取所有曲目别名"""
         self.total_alias_list = await get_music_alias_list()
+        self._digests['alias'] = self._digest([a.model_dump(mode='json') for a in self.total_alias_list])
         
     async def get_plate_json(self) -> None:
         """获取所有牌子数据"""
         self.total_plate_id_list = await maiApi.get_plate_json()
+        self._digests['plate'] = self._digest(self.total_plate_id_list)
 
     def guess(self):
         """初始化猜歌数据"""
@@ -439,7 +455,7 @@ class Guess:
 
     def pic(self, music: Music) -> Image.Image:
         """裁切曲绘"""
-        im = Image.open(music_picture(music.id))
+        im = open_cover(music.id)
         w, h = im.size
         weights = self.calculate_frequency_weights(im)
         scale = random.uniform(0.15, 0.4)  # 裁剪尺寸范围 可在此修改
@@ -3,16 +3,29 @@ import asyncio
 import json
 import random
 from pathlib import Path
-from typing import List, Optional, Union, Any, Sequence, Dict, MutableSequence, cast
+from functools import lru_cache
+from typing import List, Optional, Union, Any, Sequence, Dict, MutableSequence, Tuple, cast
 from PIL import Image, ImageDraw, ImageFont
 from .config import maimaidir, SIYUAN, TBFONT, fcl, fsl, achievementList, plate_to_dx_version, platecn, version_map, Root, BOTNAME, score_Rank_l, score_Rank, combo_rank, sync_rank, ratingdir, platedir, levelList, diffs
-from .image import DrawText, image_to_base64, music_picture, text_to_image, rounded_corners
+from .image import DrawText, canvas_pool, image_to_base64, open_cover, text_to_image, rounded_cover, sprite
 from .maimaidx_api_data import maiApi
 from .maimaidx_error import *
 from .maimaidx_model import ChartInfo, PlayInfoDefault, PlayInfoDev, UserInfo, Music
 from .maimaidx_music import mai
+from .render import renderer
+from .render_cache import render_cache
 import traceback
 from .maimai_best_50 import coloumWidth, changeColumnWidth, computeRa, ScoreBaseImage, dxScore
+from .maimaidx_update_table import (
+    build_plate_marks,
+    plate_cells_path,
+    plate_marks_path,
+    plate_table_layout,
+    plate_table_musics,
+    rating_cells_path,
+    rating_table_groups,
+    rating_table_layout
+)
 
 # genre 到图片名的映射
 category = {
@@ -37,18 +50,27 @@ def newbestscore(song_id: str, lv: int, value: int, bestlist: List[ChartInfo]) -
                 return 0
     return value - bestlist[-1].ra
 
-async def draw_music_info(music: Music, level_index: Optional[int] = None) -> Union[str, Image.Image]:
+async def draw_music_info(music: Music, level_index: Optional[int] = None) -> Union[str, bytes]:
     """
-    查看谱面
+    查看谱面，结果会被缓存直到曲库数据更新
     
     Params:
         `music`: 曲目模型
         `level_index`: 难度索引
     Returns:
-        `Union[str, Image.Image]`
+        `Union[str, bytes]` 编码后的图片或错误信息
     """
     try:
-        im = Image.open(maimaidir / 'song_bg.png').convert('RGBA')
+        return await render_cache.render(
+            'music_info', (music.id, level_index), _draw_music_info, music, level_index, kind='card'
+        )
+    except (RenderQueueFullError, RenderTimeoutError) as e:
+        return str(e)
+
+
+def _draw_music_info(music: Music, level_index: Optional[int] = None) -> Union[str, Image.Image]:
+    try:
+        im = canvas_pool.copy(sprite('song_bg.png'))
         dr = ImageDraw.Draw(im)
         mr = DrawText(dr, SIYUAN)
         tb = DrawText(dr, TBFONT)
@@ -58,8 +80,7 @@ async def draw_music_info(music: Music, level_index: Optional[int] = None) -> Un
         im.alpha_composite(Image.open(maimaidir / 'logo.png').resize((249, 120)), (65, 25))
         if music.basic_info and music.basic_info.is_new:
             im.alpha_composite(Image.open(maimaidir / 'UI_CMN_TabTitle_NewSong.png').resize((249, 120)), (940, 100))
-        songbg = Image.open(music_picture(music.id or '0')).resize((280, 280))
-        im.alpha_composite(rounded_corners(songbg, 17, (True, False, False, True)), (110, 180))
+        im.alpha_composite(rounded_cover(music.id or '0', (280, 280), 17, (True, False, False, True)), (110, 180))
         if music.basic_info and music.basic_info.version:
             im.alpha_composite(Image.open(maimaidir / f'{music.basic_info.version}.png').resize((182, 90)), (800, 370))
         if music.type:
@@ -199,14 +220,28 @@ async def draw_music_play_data(username: str, music_id: str) -> Union[str, Image
                 raise MusicNotPlayError
             dev = False
 
-        im = Image.open(maimaidir / 'info_bg.png').convert('RGBA')
+        return await renderer.run(_draw_music_play_data, music, music_id, diff, dev)
+    except (RenderQueueFullError, RenderTimeoutError) as e:
+        return str(e)
+    except Exception as e:
+        return f'生成游玩数据时出错：{str(e)}'
+
+
+def _draw_music_play_data(
+    music: Music, 
+    music_id: str, 
+    diff: Sequence[Union[None, PlayInfoDev, PlayInfoDefault]], 
+    dev: bool
+) -> Union[str, Image.Image]:
+    try:
+        im = canvas_pool.copy(sprite('info_bg.png'))
     
         dr = ImageDraw.Draw(im)
         tb = DrawText(dr, TBFONT)
         mr = DrawText(dr, SIYUAN)
 
         im.alpha_composite(Image.open(maimaidir / 'logo.png').resize((249, 120)), (0, 34))
-        cover = Image.open(music_picture(music_id))
+        cover = open_cover(music_id)
         im.alpha_composite(cover.resize((300, 300)), (100, 260))
         if music.basic_info and music.basic_info.genre in category:
             im.alpha_composite(Image.open(maimaidir / f'info-{category[music.basic_info.genre]}.png'), (100, 260))
@@ -304,7 +339,37 @@ async def draw_rating_table(username: str, rating: str, isfc: bool = False) -> U
             return '曲库未初始化，请先执行 init 指令！'
         version = list(set(_v for _v in plate_to_dx_version.values()))
         obj = await maiApi.query_user_plate(username=username, version=version)
-        
+        return await renderer.run(_draw_rating_table, obj, rating, isfc)
+    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError, RenderQueueFullError, RenderTimeoutError) as e:
+        return str(e)
+    except Exception as e:
+        print(traceback.format_exc())
+        return f'未知错误：{type(e)}\n请联系Bot管理员'
+
+
+def rating_table_cells(rating: str) -> Dict[str, Tuple[int, int]]:
+    """
+    获取定数表坐标映射，优先读取更新定数表时生成的 `{rating}.cells.json`，缺失时按曲库数据现场计算
+    
+    Params:
+        `rating`: 等级
+    Returns:
+        `Dict[str, Tuple[int, int]]` `"{曲目ID}-{难度}"` 到曲绘左上角坐标的映射
+    """
+    path = rating_cells_path(rating)
+    if path.exists():
+        return _load_cells(path, path.stat().st_mtime_ns)
+    return rating_table_layout(rating_table_groups(rating))[1]
+
+
+@lru_cache(maxsize=64)
+def _load_cells(path: Path, mtime: int) -> Dict[str, Tuple[int, int]]:
+    with open(path, encoding='utf-8') as f:
+        return {k: tuple(v) for k, v in json.load(f).items()}
+
+
+def _draw_rating_table(obj: List[PlayInfoDefault], rating: str, isfc: bool) -> Union[Image.Image, str]:
+    try:
         statistics = {
             'clear': 0,
             'sync':  0,
@@ -323,19 +388,13 @@ async def draw_rating_table(username: str, rating: str, isfc: bool = False) -> U
             'fsd':   0,
             'fsdp':  0,
         }
-        fromid = {}
+        played: Dict[str, PlayInfoDefault] = {}
         
         sp = score_Rank[-6:]
         for _d in obj:
             if _d.level != rating:
                 continue
-            if (id := str(_d.song_id)) not in fromid:
-                fromid[id] = {}
-            fromid[id][str(_d.level_index)] = {
-                'achievements': _d.achievements,
-                'fc': _d.fc,
-                'level': _d.level
-            }
+            played[f'{_d.song_id}-{_d.level_index}'] = _d
             rate = computeRa(_d.ds, _d.achievements, onlyrate=True).lower()
             if _d.achievements >= 80:
                 statistics['clear'] += 1
@@ -356,12 +415,12 @@ async def draw_rating_table(username: str, rating: str, isfc: bool = False) -> U
                         statistics[sync_rank[_s]] += 1
 
         achievements_fc_list: List[Union[float, List[float]]] = []
-        lvlist = mai.total_level_data[rating]
-        lvnum = sum([len(v) for v in lvlist.values()])
+        cells = rating_table_cells(rating)
+        lvnum = len(cells)
         
-        rating_bg = Image.open(maimaidir / 'rating_bg.png')
-        unfinished_bg = Image.open(maimaidir / 'unfinished_bg.png')
-        complete_bg = Image.open(maimaidir / 'complete_bg.png')
+        rating_bg = sprite('rating_bg.png')
+        unfinished_bg = sprite('unfinished_bg.png')
+        complete_bg = sprite('complete_bg.png')
         
         bg = ratingdir / f'{rating}.png'
         
@@ -384,43 +443,28 @@ async def draw_rating_table(username: str, rating: str, isfc: bool = False) -> U
                 x += 64
             tb.draw(x, y, 20, statistics[v], (124, 129, 255, 255), 'mm', 2, (255, 255, 255, 255))
         
-        y = 118
-        for ra in lvlist:
-            x = 158
-            y += 20
-            for num, music in enumerate(lvlist[ra]):
-                if num % 14 == 0:
-                    x = 158
-                    y += 85
-                else:
-                    x += 85
-                if music.id in fromid and music.lv in fromid[music.id]:
-                    if not isfc:
-                        score = fromid[music.id][music.lv]['achievements']
-                        achievements_fc_list.append(score)
-                        rate = computeRa(music.ds, score, onlyrate=True)
-                        rank = Image.open(maimaidir / f'UI_TTR_Rank_{rate}.png').resize((78, 35))
-                        if score >= 100:
-                            im.alpha_composite(complete_bg, (x + 2, y - 18))
-                        else:
-                            im.alpha_composite(unfinished_bg, (x + 2, y - 18))
-                        im.alpha_composite(rank, (x, y - 5))
-                        continue
-                    if _fc := fromid[music.id][music.lv]['fc']:
-                        achievements_fc_list.append(combo_rank.index(_fc))
-                        fc = Image.open(maimaidir / f'UI_MSS_MBase_Icon_{fcl[_fc]}.png').resize((50, 50))
-                        im.alpha_composite(complete_bg, (x + 2, y - 18))
-                        im.alpha_composite(fc, (x + 15, y - 12))
+        for key, (x, y) in cells.items():
+            if (record := played.get(key)) is None:
+                continue
+            if not isfc:
+                score = record.achievements
+                achievements_fc_list.append(score)
+                rate = computeRa(record.ds, score, onlyrate=True)
+                im.alpha_composite(complete_bg if score >= 100 else unfinished_bg, (x, y))
+                im.alpha_composite(sprite(f'UI_TTR_Rank_{rate}.png', (78, 35)), (x - 2, y + 13))
+                continue
+            if _fc := record.fc:
+                achievements_fc_list.append(combo_rank.index(_fc))
+                im.alpha_composite(complete_bg, (x, y))
+                im.alpha_composite(sprite(f'UI_MSS_MBase_Icon_{fcl[_fc]}.png', (50, 50)), (x + 13, y + 6))
 
         if len(achievements_fc_list) == lvnum:
             r = calc_achievements_fc(achievements_fc_list, lvnum, isfc)
             if r != -1:
                 pic = fcl[combo_rank[r]] if isfc else score_Rank_l[score_Rank[-6:][r]]
-                im.alpha_composite(Image.open(maimaidir / f'UI_MSS_Allclear_Icon_{pic}.png'), (40, 40))
+                im.alpha_composite(sprite(f'UI_MSS_Allclear_Icon_{pic}.png'), (40, 40))
         
         return im
-    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError) as e:
-        return str(e)
     except Exception as e:
         print(traceback.format_exc())
         return f'未知错误：{type(e)}\n请联系Bot管理员'
@@ -432,165 +476,104 @@ async def draw_plate_table(username: str, version: str, plan: str) -> Union[Imag
             return '曲库未初始化，请先执行 init 指令！'
         if version in platecn:
             version = platecn[version]
-        ver, _ver = version_map.get(version, ([plate_to_dx_version[version]], version))
-        music_id_list = mai.total_plate_id_list[_ver]
-        music = mai.total_list.by_id_list(music_id_list)
-        plate_total_num = len(music_id_list)
-        playerdata: List[PlayInfoDefault] = []
+        ver, _ = version_map.get(version, ([plate_to_dx_version[version]], version))
         obj = await maiApi.query_user_plate(username=username, version=ver)
-        for _d in obj:
-            if _d.song_id not in music_id_list:
-                continue
-            _music = mai.total_list.by_id(_d.song_id)
-            _d.table_level = _music.level
-            _d.ds = _music.ds[_d.level_index]
-            playerdata.append(_d)
-
-        ra: Dict[str, Dict[str, List[Optional[PlayInfoDefault]]]] = {}
-        """
-        {
-            "14+": {
-                "365": [None, None, None, PlayInfoDefault, None],
-                ...
-            },
-            "14": {
-                ...
-            }
-        }
-        """
-        music.sort(key=lambda x: x.ds[3], reverse=True)
+        return await renderer.run(_draw_plate_table, obj, version, plan)
+    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError, RenderQueueFullError, RenderTimeoutError) as e:
+        return str(e)
+    except Exception as e:
+        print(traceback.format_exc())
+        return f'未知错误：{type(e)}\n请联系Bot管理员'
+
+
+def plate_table_cells(version: str) -> Dict[str, Tuple[int, int]]:
+    """
+    获取完成表坐标映射，优先读取更新完成表时生成的 `{version}.cells.json`，缺失时按曲库数据现场计算
+    
+    Params:
+        `version`: 版本
+    Returns:
+        `Dict[str, Tuple[int, int]]` 曲目ID到曲绘左上角坐标的映射
+    """
+    path = plate_cells_path(version)
+    if path.exists():
+        return _load_cells(path, path.stat().st_mtime_ns)
+    ralv = plate_table_musics(version)
+    return plate_table_layout([(r, [m.id for m in ralv[r]]) for r in ralv])[1]
+
+
+def plate_marks() -> List[Image.Image]:
+    """
+    获取难度完成标记组合，下标为难度二进制掩码，优先读取更新完成表时生成的素材
+    
+    Returns:
+        `List[PIL.Image.Image]` 共 `16` 帧
+    """
+    path = plate_marks_path()
+    return _load_plate_marks(path.stat().st_mtime_ns if path.exists() else 0)
+
+
+@lru_cache(maxsize=2)
+def _load_plate_marks(mtime: int) -> List[Image.Image]:
+    strip = Image.open(plate_marks_path()).convert('RGBA') if mtime else build_plate_marks()
+    height = strip.height // 16
+    return [strip.crop((0, height * n, strip.width, height * (n + 1))) for n in range(16)]
+
+
+def _draw_plate_table(obj: List[PlayInfoDefault], version: str, plan: str) -> Union[Image.Image, str]:
+    try:
+        _, _ver = version_map.get(version, ([plate_to_dx_version[version]], version))
+        plate_total_num = len(mai.total_plate_id_list[_ver])
+        cells = plate_table_cells(version)
         number = 4 if version not in ['霸', '舞'] else 5
-        for _m in music:
-            if _m.level[3] not in ra:
-                ra[_m.level[3]] = {}
-            ra[_m.level[3]][_m.id] = [None for _ in range(number)]
-        for _d in playerdata:
-            if number == 4 and _d.level_index == 4:
-                continue
-            ra[_d.table_level[3]][str(_d.song_id)][_d.level_index] = _d
         
-        finished_bg = [Image.open(maimaidir / f't-{_}.png') for _ in range(4)]
-        unfinished_bg = Image.open(maimaidir / 'unfinished_bg_2.png')
-        complete_bg = Image.open(maimaidir / 'complete_bg_2.png')
+        if plan == '极' or plan == '極':
+            finished = lambda play: bool(play.fc)
+        elif plan == '将':
+            finished = lambda play: play.achievements >= 100
+        elif plan == '神':
+            finished = lambda play: play.fc in ['ap', 'app']
+        elif plan == '舞舞':
+            finished = lambda play: play.fs in ['fsd', 'fdx', 'fsdp', 'fdxp']
+        else:
+            finished = lambda play: False
+        
+        complete_bg = sprite('complete_bg_2.png')
 
-        im = Image.open(platedir / f'{version}.png')
+        im = Image.open(platedir / f'{version}.png').convert('RGBA')
         draw = ImageDraw.Draw(im)
         tr = DrawText(draw, TBFONT)
         mr = DrawText(draw, SIYUAN)
         
-        im.alpha_composite(Image.open(maimaidir / 'plate_num.png'), (185, 20))
+        im.alpha_composite(sprite('plate_num.png'), (185, 20))
         im.alpha_composite(
-            Image.open(platedir / f'{version}{"極" if plan == "极" else plan}.png').resize((1000, 161)), 
+            Image.open(platedir / f'{version}{"極" if plan == "极" else plan}.png').convert('RGBA').resize((1000, 161)), 
             (200, 35)
         )
         lv: List[set[int]] = [set() for _ in range(number)]
-        y = 245
-        # if plan == '者':
-        #     for level in ra:
-        #         x = 200
-        #         y += 15
-        #         for num, _id in enumerate(ra[level]):
-        #             if num % 10 == 0:
-        #                 x = 200
-        #                 y += 115
-        #             else:
-        #                 x += 115
-        #             f: List[int] = []
-        #             for num, play in enumerate(ra[level][_id]):
-        #                 if play.achievements or not play.achievements >= 80: continue
-        #                 fc = Image.open(maimaidir / f'UI_MSS_MBase_Icon_{fcl[play.fc]}.png')
-        #                 im.alpha_composite(fc, (x, y))
-        #                 f.append(n)
-        #             for n in f:
-        #                 im.alpha_composite(finished_bg[n], (x + 5 + 25 * n, y + 67))
-        if plan == '极' or plan == '極':
-            for level in ra:
-                x = 200
-                y += 15
-                for num, _id in enumerate(ra[level]):
-                    if num % 10 == 0:
-                        x = 200
-                        y += 115
-                    else:
-                        x += 115
-                    f: List[int] = []
-                    for n, play in enumerate(ra[level][_id]):
-                        if play is None or not play.fc: continue
-                        if n == 3:
-                            im.alpha_composite(complete_bg, (x, y))
-                            fc = Image.open(maimaidir / f'UI_CHR_PlayBonus_{fcl[play.fc]}.png').resize((75, 75))
-                            im.alpha_composite(fc, (x + 13, y + 3))
-                        lv[n].add(play.song_id)
-                        f.append(n)
-                    for n in f:
-                        im.alpha_composite(finished_bg[n], (x + 5 + 25 * n, y + 67))
-        if plan == '将':
-            for level in ra:
-                x = 200
-                y += 15
-                for num, _id in enumerate(ra[level]):
-                    if num % 10 == 0:
-                        x = 200
-                        y += 115
-                    else:
-                        x += 115
-                    f: List[int] = []
-                    for n, play in enumerate(ra[level][_id]):
-                        if play is None or play.achievements < 100: continue
-                        if n == 3:
-                            im.alpha_composite(complete_bg if play.achievements >= 100 else unfinished_bg, (x, y))
-                            rate = computeRa(play.ds, play.achievements, onlyrate=True)
-                            rank = Image.open(maimaidir / f'UI_TTR_Rank_{rate}.png').resize((102, 46))
-                            im.alpha_composite(rank, (x - 1, y + 15))
-                        lv[n].add(play.song_id)
-                        f.append(n)
-                    for n in f:
-                        im.alpha_composite(finished_bg[n], (x + 5 + 25 * n, y + 67))
-        if plan == '神':
-            _fc = ['ap', 'app']
-            for level in ra:
-                x = 200
-                y += 15
-                for num, _id in enumerate(ra[level]):
-                    if num % 10 == 0:
-                        x = 200
-                        y += 115
-                    else:
-                        x += 115
-                    f: List[int] = []
-                    for n, play in enumerate(ra[level][_id]):
-                        if play is None or play.fc not in _fc: continue
-                        if n == 3:
-                            im.alpha_composite(complete_bg, (x, y))
-                            ap = Image.open(maimaidir / f'UI_CHR_PlayBonus_{fcl[play.fc]}.png').resize((75, 75))
-                            im.alpha_composite(ap, (x + 13, y + 3))
-                        lv[n].add(play.song_id)
-                        f.append(n)
-                    for n in f:
-                        im.alpha_composite(finished_bg[n], (x + 5 + 25 * n, y + 67))
-        if plan == '舞舞':
-            fs = ['fsd', 'fdx', 'fsdp', 'fdxp']
-            for level in ra:
-                x = 200
-                y += 15
-                for num, _id in enumerate(ra[level]):
-                    if num % 10 == 0:
-                        x = 200
-                        y += 115
-                    else:
-                        x += 115
-                    f: List[int] = []
-                    for n, play in enumerate(ra[level][_id]):
-                        if play is None or play.fs not in fs:
-                            continue
-                        if n == 3:
-                            im.alpha_composite(complete_bg, (x, y))
-                            fsd = Image.open(maimaidir / f'UI_CHR_PlayBonus_{fsl[play.fs]}.png').resize((75, 75))
-                            im.alpha_composite(fsd, (x + 13, y + 3))
-                        lv[n].add(play.song_id)
-                        f.append(n)
-                    for n in f:
-                        im.alpha_composite(finished_bg[n], (x + 5 + 25 * n, y + 67))
+        masks: Dict[str, int] = {}
+        for play in obj:
+            if (cell := cells.get(id := str(play.song_id))) is None:
+                continue
+            if play.level_index >= number or not finished(play):
+                continue
+            lv[play.level_index].add(play.song_id)
+            masks[id] = masks.get(id, 0) | (1 << play.level_index)
+            if play.level_index != 3:
+                continue
+            x, y = cell
+            im.alpha_composite(complete_bg, (x, y))
+            if plan == '将':
+                rate = computeRa(play.ds, play.achievements, onlyrate=True)
+                im.alpha_composite(sprite(f'UI_TTR_Rank_{rate}.png', (102, 46)), (x - 1, y + 15))
+            else:
+                bonus = fsl[play.fs] if plan == '舞舞' else fcl[play.fc]
+                im.alpha_composite(sprite(f'UI_CHR_PlayBonus_{bonus}.png', (75, 75)), (x + 13, y + 3))
+        
+        marks = plate_marks()
+        for id, mask in masks.items():
+            x, y = cells[id]
+            im.alpha_composite(marks[mask & 15], (x, y + 67))
         
         color = ScoreBaseImage.id_color.copy()
         color.insert(0, (124, 129, 255, 255))
@@ -606,8 +589,6 @@ async def draw_plate_table(username: str, version: str, plan: str) -> Union[Imag
                 tr.draw(390 + 200 * num, 270, 40, _v, color[num], 'rm', 4, (255, 255, 255, 255))
         
         return im
-    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError) as e:
-        return str(e)
     except Exception as e:
         print(traceback.format_exc())
         return f'未知错误：{type(e)}\n请联系Bot管理员'
\ No newline at end of file
@@ -2,14 +2,13 @@ import asyncio
 import json
 import math
 import traceback
-from io import BytesIO
 from typing import List, Optional, Union, Tuple, Dict
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 
 from .config import BOTNAME
 from .config import *
-from .image import DrawText, image_to_base64, text_to_image, tricolor_gradient, music_picture
+from .image import DrawText, canvas_pool, cover_image, image_to_base64, text_to_image
 from .maimaidx_api_data import maiApi
 from .maimaidx_error import *
 from .maimaidx_model import UserRanking, PlayInfoDefault, PlayInfoDev, RaMusic, PlanInfo, RiseScore, ChartInfo
@@ -18,12 +17,11 @@ import random
 import time
 from typing import Callable
 
-import pyecharts.options as opts
-from pyecharts.charts import Pie
+import numpy as np
 
-from .maimai_best_50 import ScoreBaseImage, changeColumnWidth, coloumWidth, computeRa
+from .maimai_best_50 import ScoreBaseImage, changeColumnWidth, coloumWidth, computeRa, computeRaArray, fillRa, rateList
 from .maimaidx_music import Music, mai
-from .tool import run_chrome_to_base64
+from .render import renderer
 
 Filter = Tuple[
     List[PlayInfoDefault],
@@ -34,6 +32,211 @@ Filter = Tuple[
 ]
 Condition = Callable[[PlayInfoDefault], bool]
 
+def _palette(anchors: List[Tuple[int, int, int]], count: int) -> List[Tuple[int, int, int, int]]:
+    """
+    在锚点颜色之间线性插值生成配色
+    
+    Params:
+        `anchors`: 锚点颜色
+        `count`: 颜色数量
+    Returns:
+        `List[Tuple[int, int, int, int]]`
+    """
+    anchors = np.array(anchors, dtype=np.float64)
+    pos = np.linspace(0, len(anchors) - 1, count)
+    low = np.floor(pos).astype(int).clip(0, len(anchors) - 2)
+    t = (pos - low)[:, None]
+    colors = (1 - t) * anchors[low] + t * anchors[low + 1]
+    return [(*map(int, c), 255) for c in np.rint(colors)]
+
+
+pie_fc_colors = [(200, 200, 200, 255), (102, 187, 106, 255), (38, 166, 154, 255), (255, 193, 7, 255), (255, 112, 67, 255)]
+pie_rate_colors = _palette([(176, 190, 197), (84, 112, 198), (154, 96, 180), (238, 102, 102), (250, 200, 88)], len(scoreRank))
+
+
+class DrawPie:
+    
+    width = 1200
+    height = 800
+    scale = 2
+    
+    def __init__(self) -> None:
+        self._im = Image.new('RGBA', (self.width, self.height), (255, 255, 255, 255))
+        dr = ImageDraw.Draw(self._im)
+        self._sy = DrawText(dr, SIYUAN)
+        self._tb = DrawText(dr, TBFONT)
+        self.cx = self.width // 2 + 80
+        self.cy = self.height // 2 + 40
+    
+    @staticmethod
+    def slices(values: List[float]) -> List[Tuple[float, float, float]]:
+        """
+        计算各扇区的起止角度，从12点方向顺时针排列
+        
+        Params:
+            `values`: 各扇区数值
+        Returns:
+            `List[Tuple[float, float, float]]` 起始角度、结束角度、占比
+        """
+        total = sum(values)
+        if total <= 0:
+            return [(-90, -90, 0) for _ in values]
+        result = []
+        angle = -90
+        for v in values:
+            share = v / total
+            result.append((angle, angle + share * 360, share))
+            angle += share * 360
+        return result
+    
+    def donut(
+        self,
+        values: List[float],
+        colors: List[Tuple[int, int, int, int]],
+        outer: int,
+        inner: int = 0
+    ) -> List[Tuple[float, float, float]]:
+        """
+        绘制环形图，超采样后缩小以获得平滑边缘
+        
+        Params:
+            `values`: 各扇区数值
+            `colors`: 各扇区颜色
+            `outer`: 外半径
+            `inner`: 内半径，为 `0` 时绘制饼图
+        Returns:
+            `List[Tuple[float, float, float]]` 同 `slices`
+        """
+        s = self.scale
+        size = outer * 2 * s
+        layer = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        dr = ImageDraw.Draw(layer)
+        parts = self.slices(values)
+        for (start, end, share), color in zip(parts, colors):
+            if share <= 0:
+                continue
+            if share >= 1:
+                dr.ellipse((0, 0, size - 1, size - 1), color)
+            else:
+                dr.pieslice((0, 0, size - 1, size - 1), start, end, color, (255, 255, 255, 255), s)
+        if inner:
+            hole = (outer - inner) * s
+            dr.ellipse((hole, hole, size - 1 - hole, size - 1 - hole), (0, 0, 0, 0))
+        layer = layer.resize((outer * 2, outer * 2), Image.LANCZOS)
+        self._im.alpha_composite(layer, (self.cx - outer, self.cy - outer))
+        return parts
+    
+    def outside_labels(
+        self,
+        parts: List[Tuple[float, float, float]],
+        names: List[str],
+        values: List[float],
+        colors: List[Tuple[int, int, int, int]],
+        radius: int
+    ):
+        """
+        在环形图外侧绘制引导线和标签，同侧标签按纵向间距错开
+        
+        Params:
+            `parts`: 扇区角度，见 `slices`
+            `names`: 各扇区名称
+            `values`: 各扇区数值
+            `colors`: 各扇区颜色
+            `radius`: 环形图外半径
+        """
+        spacing = 24
+        sides: Dict[bool, List[list]] = {True: [], False: []}
+        for (start, end, share), name, value, color in zip(parts, names, values, colors):
+            if share <= 0:
+                continue
+            mid = math.radians((start + end) / 2)
+            cos, sin = math.cos(mid), math.sin(mid)
+            anchor = (self.cx + cos * radius, self.cy + sin * radius)
+            elbow = (self.cx + cos * (radius + 20), self.cy + sin * (radius + 20))
+            text = f'{name}: {value:g}  {share * 100:.2f}%'
+            sides[cos >= 0].append([elbow[1], anchor, elbow, text, color])
+        top, bottom = 80, self.height - 20
+        for right, labels in sides.items():
+            labels.sort(key=lambda x: x[0])
+            for i in range(1, len(labels)):
+                labels[i][0] = max(labels[i][0], labels[i - 1][0] + spacing)
+            if labels:
+                labels[-1][0] = min(labels[-1][0], bottom)
+            for i in range(len(labels) - 2, -1, -1):
+                labels[i][0] = min(labels[i][0], labels[i + 1][0] - spacing)
+            if labels:
+                labels[0][0] = max(labels[0][0], top)
+            dr = self._sy._img
+            for y, anchor, elbow, text, color in labels:
+                end_x = self.cx + (radius + 40) * (1 if right else -1)
+                dr.line([anchor, (elbow[0], y), (end_x, y)], color, 2)
+                self._sy.draw(end_x + (6 if right else -6), y, 16, text, (44, 52, 60, 255), 'lm' if right else 'rm')
+    
+    def inside_labels(self, parts: List[Tuple[float, float, float]], radius: int):
+        """
+        在饼图扇区内绘制占比，占比过小的扇区不绘制
+        
+        Params:
+            `parts`: 扇区角度，见 `slices`
+            `radius`: 饼图半径
+        """
+        for start, end, share in parts:
+            if share < 0.08:
+                continue
+            mid = math.radians((start + end) / 2)
+            x = self.cx + math.cos(mid) * radius * 0.6
+            y = self.cy + math.sin(mid) * radius * 0.6
+            self._tb.draw(x, y, 16, f'{share * 100:.1f}%', (255, 255, 255, 255), 'mm', 2, (44, 52, 60, 255))
+    
+    def legend(self, title: str, names: List[str], colors: List[Tuple[int, int, int, int]], y: int) -> int:
+        """
+        绘制图例
+        
+        Params:
+            `title`: 图例标题
+            `names`: 各项名称
+            `colors`: 各项颜色
+            `y`: 起始Y轴
+        Returns:
+            `int` 结束Y轴
+        """
+        dr = self._sy._img
+        self._sy.draw(15, y, 16, title, (153, 153, 153, 255), 'lm')
+        for name, color in zip(names, colors):
+            y += 22
+            dr.rounded_rectangle((15, y - 7, 40, y + 7), 3, color)
+            self._sy.draw(48, y, 15, name, (51, 51, 51, 255), 'lm')
+        return y + 30
+    
+    def draw(self, title: str, fc_names: List[str], fc_values: List[float], rate_names: List[str], rate_values: List[float]) -> Image.Image:
+        """
+        绘制全连等级饼图和达成率等级环形图
+        
+        Params:
+            `title`: 标题
+            `fc_names`: 全连等级名称
+            `fc_values`: 全连等级人数
+            `rate_names`: 达成率等级名称
+            `rate_values`: 达成率等级人数
+        Returns:
+            `Image.Image`
+        """
+        unit = min(self.width, self.height) // 2
+        inner, ring_in, ring_out = int(unit * 0.3), int(unit * 0.5), int(unit * 0.7)
+        
+        self._sy.draw(self.cx, 30, 24, title, (44, 52, 60, 255), 'mt')
+        fc_parts = self.donut(fc_values, pie_fc_colors, inner)
+        rate_parts = self.donut(rate_values, pie_rate_colors, ring_out, ring_in)
+        self.inside_labels(fc_parts, inner)
+        self.outside_labels(rate_parts, rate_names, rate_values, pie_rate_colors, ring_out)
+        
+        fc_legend = [f'{n}: {v:g} ({p * 100:.1f}%)' for n, v, (_, _, p) in zip(fc_names, fc_values, fc_parts)]
+        y = self.legend('全连等级', fc_legend, pie_fc_colors, 20)
+        self.legend('达成率等级', rate_names, pie_rate_colors, y)
+        
+        return self._im
+
+
 async def music_global_data(music: Music, level_index: int) -> Union[Image.Image, str]:
     """
     绘制曲目游玩详情
@@ -44,74 +247,24 @@ async def music_global_data(music: Music, level_index: int) -> Union[Image.Image
     Returns:
         `Union[Image.Image, str]`
     """
+    if not music.stats or len(music.stats) <= level_index:
+        return '该谱面暂无统计数据'
     stats = music.stats[level_index]
-    fc_data_pair = [list(z) for z in zip([c.upper() if c else 'Not FC' for c in [''] + comboRank], stats.fc_dist)]
-    acc_data_pair = [list(z) for z in zip([s.upper() for s in scoreRank], stats.dist)]
-
-    initopts = opts.InitOpts(width='1000px', height='800px', bg_color='#fff', js_host='./')
-    labelopts = opts.LabelOpts(
-        position='outside',
-        formatter='{a|{a}}{abg|}\n{hr|}\n {b|{b}: }{c}  {per|{d}%}  ',
-        background_color='#eee',
-        border_color='#aaa',
-        border_width=1,
-        border_radius=4,
-        rich={
-            'a': {'color': '#999', 'lineHeight': 22, 'align': 'center'},
-            'abg': {
-                'backgroundColor': '#e3e3e3',
-                'width': '100%',
-                'align': 'right',
-                'height': 22,
-                'borderRadius': [4, 4, 0, 0],
-            },
-            'hr': {
-                'borderColor': '#aaa',
-                'width': '100%',
-                'borderWidth': 0.5,
-                'height': 0,
-            },
-            'b': {'fontSize': 16, 'lineHeight': 33},
-            'per': {
-                'color': '#eee',
-                'backgroundColor': '#334455',
-                'padding': [2, 4],
-                'borderRadius': 2,
-            },
-        },
-    )
-    titleopts = opts.TitleOpts(
-        title=f'{music.id} {music.title} 「{diffs[level_index]}」',
-        pos_left='center',
-        pos_top='20',
-        title_textstyle_opts=opts.TextStyleOpts(color='#2c343c'),
+    if not stats or not stats.fc_dist or not stats.dist:
+        return '该谱面暂无统计数据'
+    fc_names = [c.upper() if c else 'Not FC' for c in [''] + comboRank]
+    rate_names = [s.upper() for s in scoreRank]
+    title = f'{music.id} {music.title} 「{diffs[level_index]}」'
+
+    return await renderer.run(
+        lambda: DrawPie().draw(title, fc_names, list(stats.fc_dist), rate_names, list(stats.dist))
     )
-    legendopts = opts.LegendOpts(pos_left=15, pos_top=10, orient='vertical')
-
-    pie = Pie(initopts)
-    pie.add('全连等级', fc_data_pair, radius=[0, '30%'], label_opts=labelopts)
-    pie.add('达成率等级', acc_data_pair, radius=['50%', '70%'], is_clockwise=True, label_opts=labelopts)
-    pie.set_global_opts(title_opts=titleopts, legend_opts=legendopts)
-    pie.set_series_opts(tooltip_opts=opts.TooltipOpts(trigger='item', formatter='{a} <br/>{b}: {c} ({d}%)'))
-    pie.render(str(pie_html_file))
-    base64 = await run_chrome_to_base64()
-
-    return Image.open(BytesIO(base64))
 
 
 class DrawScore(ScoreBaseImage):
     
-    def __init__(self, image: Image.Image = None) -> None:
-        super().__init__(image)
-        def safe_bg(bg, size):
-            return bg if bg is not None else Image.new('RGBA', size, (0,0,0,0))
-        self._im.alpha_composite(safe_bg(self.aurora_bg, (1400, 220)))
-        self._im.alpha_composite(safe_bg(self.shines_bg, (1400, 220)), (34, 0))
-        self._im.alpha_composite(safe_bg(self.rainbow_bg, (1400, 220)), (319, self._im.size[1] - 643))
-        self._im.alpha_composite(safe_bg(self.rainbow_bottom_bg, (1200, 200)), (100, self._im.size[1] - 343))
-        for h in range((self._im.size[1] // 358) + 1):
-            pattern = self.pattern_bg if self.pattern_bg is not None else Image.new('RGBA', (1400, 365), (0,0,0,0))
-            self._im.alpha_composite(pattern, (0, (358 + 7) * h))
+    def __init__(self, height: int) -> None:
+        super().__init__(self.background(1400, height))
 
     def whilepic(self, data: List[RaMusic], y: int = 200):
         """
@@ -129,7 +282,7 @@ class DrawScore(ScoreBaseImage):
                 y += dy if n != 0 else 0
             else:
                 x += 65
-            cover = Image.open(music_picture(v.id)).resize((55, 55))
+            cover = cover_image(v.id, (55, 55))
             self._im.alpha_composite(cover, (x, y))
             self._im.alpha_composite(self.id_diff[int(v.lv)], (x, y + 45))
             self._tb.draw(x + 27, y + 50, 10, v.id, self.t_color[int(v.lv)], 'mm')
@@ -151,7 +304,7 @@ class DrawScore(ScoreBaseImage):
             rate = Image.open(maimaidir / f'UI_TTR_Rank_{_d.rate}.png').resize((63, 28))
             
             self._im.alpha_composite(self._rise[_d.level_index], (x + 30, y))
-            self._im.alpha_composite(Image.open(music_picture(_d.song_id)).resize((80, 80)), (x + 55, y + 40))
+            self._im.alpha_composite(cover_image(_d.song_id, (80, 80)), (x + 55, y + 40))
             self._im.alpha_composite(Image.open(maimaidir / f'{_d.type.upper()}.png').resize((60, 22)), (x + 240, y + 114))
             if _d.oldrate:
                 oldrate = Image.open(maimaidir / f'UI_TTR_Rank_{_d.oldrate}.png').resize((63, 28))
@@ -261,9 +414,9 @@ class DrawScore(ScoreBaseImage):
             `Image.Image`
         """
         lendata = len(data)
-        newdata = data[(page - 1) * 80: page * 80]
         self._im.alpha_composite(self.title_lengthen_bg, (475, 30))
         if category == 'completed' or category == 'unfinished':
+            newdata = data[(page - 1) * 80: page * 80]
             txt = '已完成' if category == 'completed' else '未完成'
             self._sy.draw(700, 77, 28, f'{txt}谱面', self.text_color, 'mm')
             self.whiledraw(newdata, True, 140)
@@ -274,10 +427,17 @@ class DrawScore(ScoreBaseImage):
             pagemsg += f'当前第「{page} / {end_page}」页'
             self._sy.draw(700, self._im.size[1] - 70, 25, pagemsg, self.text_color, 'mm')
         else:
+            # 未游玩谱面可能多达上千个，按每页200个分页，避免单张图片过高
+            newdata = data[(page - 1) * 200: page * 200]
             self._sy.draw(700, 77, 28, '未游玩谱面', self.text_color, 'mm')
-            self.whilepic(data)
+            self.whilepic(newdata)
             self._im.alpha_composite(self.design_bg, (200, self._im.size[1] - 113))
-            self._sy.draw(700, self._im.size[1] - 70, 25, f'未游玩谱面共计「{len(data)}」个', self.text_color, 'mm')
+            
+            pagemsg = f'未游玩谱面共计「{lendata}」个'
+            if end_page > 1:
+                pagemsg += f'，展示第「{(page - 1) * 200 + 1}-{200 * (page - 1) + len(newdata)}」个，'
+                pagemsg += f'当前第「{page} / {end_page}」页'
+            self._sy.draw(700, self._im.size[1] - 70, 25, pagemsg, self.text_color, 'mm')
         return self._im
     
     def draw_scorelist(
@@ -349,48 +509,50 @@ def get_rise_score_list(
     ds = (sssp_ds + 0.1, ss_ds + 0.1)
     version = list(plate_to_dx_version.values())[-1] if type == 'DX' else list(plate_to_dx_version.values())[:-1]
     musiclist = mai.total_list.filter(level=level, ds=ds, version=version)
-    for _m in musiclist:
-        if (song_id := int(_m.id)) in ignore:
-            continue
-        if song_id >= 100000:
-            continue
-        for index in _m.diff:
-            for r in achievementList[-4:]:
-                basera, rate = computeRa(_m.ds[index], r, israte=True)
-                if basera <= ra:
-                    continue
-                if score and basera - score < ra:
+    charts = [
+        (song_id, _m, index) for _m in musiclist
+        if (song_id := int(_m.id)) not in ignore and song_id < 100000
+        for index in _m.diff
+    ]
+    targets = achievementList[-4:]
+    ras, rates = computeRaArray(np.array([_m.ds[index] for _, _m, index in charts])[:, None], targets)
+    for (song_id, _m, index), _ras, _rates in zip(charts, ras.tolist(), rates.tolist()):
+        for r, basera, rate in zip(targets, _ras, _rates):
+            rate = rateList[rate]
+            if basera <= ra:
+                continue
+            if score and basera - score < ra:
+                continue
+            if song_id in old_records and old_records[song_id]['level_index'] == index:
+                oldra, oldrate = computeRa(_m.ds[index], old_records[song_id]['achievements'], israte=True)
+                if oldra >= basera:
                     continue
-                if song_id in old_records and old_records[song_id]['level_index'] == index:
-                    oldra, oldrate = computeRa(_m.ds[index], old_records[song_id]['achievements'], israte=True)
-                    if oldra >= basera:
-                        continue
-                    ss = RiseScore(
-                        song_id=song_id,
-                        title=_m.title,
-                        type=_m.type,
-                        level_index=index,
-                        ds=_m.ds[index],
-                        ra=basera,
-                        rate=rate,
-                        achievements=r,
-                        oldra=oldra,
-                        oldrate=oldrate,
-                        oldachievements=old_records[song_id]['achievements']
-                    )
-                else:
-                    ss = RiseScore(
-                        song_id=song_id,
-                        title=_m.title,
-                        type=_m.type,
-                        level_index=index,
-                        ds=_m.ds[index],
-                        ra=basera,
-                        rate=rate,
-                        achievements=r
-                    )
-                music.append(ss)
-                break
+                ss = RiseScore(
+                    song_id=song_id,
+                    title=_m.title,
+                    type=_m.type,
+                    level_index=index,
+                    ds=_m.ds[index],
+                    ra=basera,
+                    rate=rate,
+                    achievements=r,
+                    oldra=oldra,
+                    oldrate=oldrate,
+                    oldachievements=old_records[song_id]['achievements']
+                )
+            else:
+                ss = RiseScore(
+                    song_id=song_id,
+                    title=_m.title,
+                    type=_m.type,
+                    level_index=index,
+                    ds=_m.ds[index],
+                    ra=basera,
+                    rate=rate,
+                    achievements=r
+                )
+            music.append(ss)
+            break
     if not music:
         return music, 0
     new = random.sample(music, musiclen if 0 < (musiclen := len(musiclist)) < 5 else 5)
@@ -435,13 +597,15 @@ async def rise_score_data(
         
         h = max(lensd, lendx)
         height = h * 140 + 110 + 150
-        image = tricolor_gradient(1400, height)
-        
-        ds = DrawScore(image)
-        im = ds.draw_rise(sd, sd_low_score, dx, dx_low_score).crop((200, 0, 1200, height))
+        def draw() -> Image.Image:
+            canvas = DrawScore(height).draw_rise(sd, sd_low_score, dx, dx_low_score)
+            im = canvas.crop((200, 0, 1200, height))
+            canvas_pool.release(canvas)
+            return im
+        im = await renderer.run(draw)
         
         return im
-    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError) as e:
+    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError, RenderQueueFullError, RenderTimeoutError) as e:
         return str(e)
     except Exception as e:
         print(traceback.format_exc())
@@ -643,14 +807,9 @@ async def level_process_data(
                 ))
             return False
         
+        defaults = [_d for _d in obj if isinstance(_d, PlayInfoDefault)]
+        fillRa(defaults, [mai.total_list.by_id(_d.song_id).ds[_d.level_index] for _d in defaults])
         for _d in obj:
-            if isinstance(_d, PlayInfoDefault):
-                _m = mai.total_list.by_id(_d.song_id)
-                ds: float = _m.ds[_d.level_index]
-                a: float = _d.achievements
-                ra, rate = computeRa(ds, a, israte=True)
-                _d.ra = ra
-                _d.rate = rate
             if (song_id := str(_d.song_id)) in music and _d.level == level:
                 if isinstance(music[song_id], Dict):
                     music[song_id][_d.level_index] = PlanInfo()
@@ -696,9 +855,11 @@ async def level_process_data(
             unfinished_y = (ulen // 5 + (0 if ulen % 5 == 0 else 1)) * 109 + 140
             nlen = len(notplayed[:100])
             notstarted_y = (nlen // 20 + (0 if nlen % 20 == 0 else 1)) * 65 + 140
-            image = tricolor_gradient(1400, 150 + completed_y + unfinished_y + notstarted_y)
-            dp = DrawScore(image)
-            im = dp.draw_plan(completed, completed_y, unfinished, unfinished_y, notplayed, plan, completed_len)
+            im = await renderer.run(
+                lambda: DrawScore(150 + completed_y + unfinished_y + notstarted_y).draw_plan(
+                    completed, completed_y, unfinished, unfinished_y, notplayed, plan, completed_len
+                )
+            )
         elif category == 'completed' or category == 'unfinished':
             data = completed if category == 'completed' else unfinished
             lendata = len(data)
@@ -707,18 +868,22 @@ async def level_process_data(
                 return f'超出页数，您的成绩共计「{end_page_num}」页，请重新输入'
             topage = len(data[(page - 1) * 80: page * 80])
             plc = (topage // 5 + (0 if topage % 5 == 0 else 1)) * 109
-            image = tricolor_gradient(1400, 240 + plc + 120)
-            dp = DrawScore(image)
-            im = dp.draw_category(category, data, page, end_page_num)
+            im = await renderer.run(
+                lambda: DrawScore(240 + plc + 120).draw_category(category, data, page, end_page_num)
+            )
         else:
             lennotstarted = len(notplayed)
-            pln = (lennotstarted // 20 + (0 if lennotstarted % 20 == 0 else 1)) * 65
-            image = tricolor_gradient(1400, 240 + pln + 120)
-            dp = DrawScore(image)
-            im = dp.draw_category(category, notplayed)
+            end_page_num = lennotstarted // 200 + 1
+            if page > end_page_num:
+                return f'超出页数，您的未游玩谱面共计「{end_page_num}」页，请重新输入'
+            topage = len(notplayed[(page - 1) * 200: page * 200])
+            pln = (topage // 20 + (0 if topage % 20 == 0 else 1)) * 65
+            im = await renderer.run(
+                lambda: DrawScore(240 + pln + 120).draw_category(category, notplayed, page, end_page_num)
+            )
         
         return im
-    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError) as e:
+    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError, RenderQueueFullError, RenderTimeoutError) as e:
         return str(e)
     except Exception as e:
         print(traceback.format_exc())
@@ -754,7 +919,7 @@ async def level_achievement_list_data(
             for _d in obj:
                 music = mai.total_list.by_id(_d.song_id)
                 _d.ds = music.ds[_d.level_index]
-                _d.ra, _d.rate = computeRa(_d.ds, _d.achievements, israte=True)
+            fillRa(obj, [_d.ds for _d in obj])
             data = obj
 
         if isinstance(rating, str):
@@ -780,12 +945,9 @@ async def level_achievement_list_data(
         else:
             plc = line * 109 + 140 * 4
         
-        image = tricolor_gradient(1400, 150 + plc)
-
-        sc = DrawScore(image)
-        im = sc.draw_scorelist(rating, newdata, page, end_page_num)
+        im = await renderer.run(lambda: DrawScore(150 + plc).draw_scorelist(rating, newdata, page, end_page_num))
         return im
-    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError) as e:
+    except (UserNotFoundError, UserNotExistsError, UserDisabledQueryError, RenderQueueFullError, RenderTimeoutError) as e:
         return str(e)
     except Exception as e:
         print(traceback.format_exc())
@@ -822,8 +984,10 @@ async def rating_ranking_data(name: str, page: int) -> Union[Image.Image, str]:
             for i, ranker in enumerate(rank_data[(page - 1) * 50:end]):
                 msg += f'No.{i + 1 + (page - 1) * 50:02d}.「{ranker.ra}」 {ranker.username} \n'
             msg += f'第「{page}」页，共「{user_num // 50 + 1}」页'
-            data = Image.open(BytesIO(text_to_image(msg.strip())))
+            data = await renderer.run(text_to_image, msg.strip())
         return data
+    except (RenderQueueFullError, RenderTimeoutError) as e:
+        return str(e)
     except Exception as e:
         print(traceback.format_exc())
         return f'未知错误：{type(e)}\n请联系Bot管理员'
\ No newline at end of file
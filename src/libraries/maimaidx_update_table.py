@@ -1,237 +1,528 @@
-import copy
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import aiofiles
-
-from .image import tricolor_gradient
 from .maimai_best_50 import *
 from .maimaidx_music import Music, mai
 from .config import levelList, plate_to_dx_version, maimaidir, ratingdir, platedir, BOTNAME, platecn, version_map
 from .maimai_best_50 import ScoreBaseImage
-from .image import DrawText
-from typing import Dict
+from .image import DrawText, canvas_pool, cover_image, cover_stamp, sprite
+from typing import Callable, Dict, Optional, Tuple, Union
+
+
+RatingGroups = List[Tuple[str, List[Tuple[str, str, str]]]]
+"""定数表分组：`[(定数, [(曲目ID, 类型, 难度), ...]), ...]`"""
+PlateGroups = List[Tuple[str, List[str]]]
+"""完成表分组：`[(等级, [曲目ID, ...]), ...]`"""
+
+LAYOUT_VERSION = 3
+"""表格布局版本，修改绘制布局或素材后需要递增，使所有表格重新绘制"""
+
+_assets: Dict[str, Optional[Image.Image]] = {}
+"""进程内共享的表格素材，由 `_init_table_worker` 预加载"""
+
+
+def _table_hash(name: str, charts: List[list]) -> str:
+    """
+    计算表格输入的哈希值
+
+    Params:
+        `name`: 等级或版本
+        `charts`: 绘制所需的全部谱面数据，每项需包含曲目ID
+    Returns:
+        `str`
+    """
+    payload = [LAYOUT_VERSION, name, [chart + [cover_stamp(chart[0])] for chart in charts]]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+
+
+def _load_manifest(directory: Path) -> Dict[str, str]:
+    """
+    读取表格目录下的 `manifest.json`，布局版本不一致时视为空
+
+    Params:
+        `directory`: 表格目录
+    Returns:
+        `Dict[str, str]` 表格名称与输入哈希
+    """
+    try:
+        manifest = json.loads((directory / 'manifest.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('layout_version') != LAYOUT_VERSION:
+        return {}
+    return manifest.get('tables', {})
+
+
+def _save_manifest(directory: Path, tables: Dict[str, str]) -> None:
+    path = directory / 'manifest.json'
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    tmp.write_text(
+        json.dumps({'layout_version': LAYOUT_VERSION, 'tables': tables}, ensure_ascii=False, indent=4),
+        encoding='utf-8'
+    )
+    os.replace(tmp, path)
+
+
+def _open_asset(name: str) -> Optional[Image.Image]:
+    path = maimaidir / name
+    return Image.open(path).convert('RGBA') if path.exists() else None
+
+
+def _init_table_worker() -> None:
+    """进程池初始化，每个工作进程只加载一次素材。工作进程以 `spawn` 方式启动，只依赖绘制参数和素材文件，不使用主进程中的曲库数据"""
+    ScoreBaseImage._ensure_image()
+    dx_img = _open_asset('DX.png')
+    chara = _open_asset('UI_CMN_Chara_Level_S_01.png')
+    _assets.update(
+        dx=dx_img.resize((44, 16)) if dx_img else Image.new('RGBA', (44, 16)),
+        design=_open_asset('design.png'),
+        chara=chara,
+        chara_small=chara.resize((80, 80)) if chara else None,
+        id_bg=Image.new('RGBA', (100, 20), (124, 129, 255, 255)),
+    )
+    for n, color in enumerate(ScoreBaseImage.bg_color):
+        _assets[f'diff_{n}'] = Image.new('RGBA', (75, 16), color)
+
+
+def _save_atomic(data: Union[Image.Image, str], path: Path) -> None:
+    """
+    先写入同目录临时文件再替换，读取方不会拿到写了一半的文件
+
+    Params:
+        `data`: 图片或文本
+        `path`: 保存路径
+    """
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        if isinstance(data, Image.Image):
+            data.save(tmp, 'PNG')
+        else:
+            tmp.write_text(data, encoding='utf-8')
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def rating_table_groups(lv: str) -> RatingGroups:
+    """
+    从曲库数据生成定数表分组
+
+    Params:
+        `lv`: 等级
+    Returns:
+        `RatingGroups`
+    """
+    lvlist = mai.total_level_data[lv]
+    return [(_lv, [(m.id, m.type, m.lv) for m in lvlist[_lv]]) for _lv in lvlist]
+
+
+def rating_table_layout(groups: RatingGroups) -> Tuple[List[int], Dict[str, Tuple[int, int]]]:
+    """
+    计算定数表布局，绘制定数表和绘制玩家定数表共用
+
+    Params:
+        `groups`: 定数表分组
+    Returns:
+        `Tuple[List[int], Dict[str, Tuple[int, int]]]` 各定数分组标题的 `y` 坐标，
+        以及 `"{曲目ID}-{难度}"` 到曲绘左上角坐标的映射
+    """
+    headers: List[int] = []
+    cells: Dict[str, Tuple[int, int]] = {}
+    y = 100
+    for _, musics in groups:
+        x = 160
+        y += 20
+        headers.append(y)
+        for num, (music_id, _, music_lv) in enumerate(musics):
+            if num % 14 == 0:
+                x = 160
+                y += 85
+            else:
+                x += 85
+            cells[f'{music_id}-{music_lv}'] = (x, y)
+        if not musics:
+            y += 85
+    return headers, cells
+
+
+def rating_cells_path(lv: str) -> Path:
+    """定数表坐标映射文件路径"""
+    return ratingdir / f'{lv}.cells.json'
+
+
+def _draw_footer(im: Image.Image, height: int) -> None:
+    sy = DrawText(ImageDraw.Draw(im), SIYUAN)
+    if _assets['design']:
+        im.alpha_composite(_assets['design'], (200, height - 113))
+    sy.draw(
+        700,
+        height - 70,
+        22,
+        f'Designed by Yuri-YuzuChaN & BlueDeer233. Adapted by AbyssSeeker',
+        ScoreBaseImage.text_color,
+        'mm'
+    )
+
+
+def plate_table_musics(version: str) -> Dict[str, List[Music]]:
+    """
+    从曲库数据生成完成表各等级的曲目，已按定数从高到低排序
+
+    Params:
+        `version`: 版本
+    Returns:
+        `Dict[str, List[Music]]` 等级从高到低
+    """
+    _, _ver = version_map.get(version, ([plate_to_dx_version.get(version)], version))
+    ralv: Dict[str, List[Music]] = {_: [] for _ in reversed(levelList)}
+    for m in mai.total_list.by_id_list(mai.total_plate_id_list[_ver]):
+        ralv[m.level[3]].append(m)
+    for r in ralv:
+        if version in ['霸', '舞']:
+            ralv[r].sort(key=lambda x: x.ds[-1], reverse=True)
+        else:
+            ralv[r].sort(key=lambda x: x.ds[3], reverse=True)
+    return ralv
+
+
+def plate_table_layout(groups: PlateGroups) -> Tuple[List[int], Dict[str, Tuple[int, int]]]:
+    """
+    计算完成表布局，绘制完成表和绘制玩家完成表共用
+
+    Params:
+        `groups`: 完成表分组
+    Returns:
+        `Tuple[List[int], Dict[str, Tuple[int, int]]]` 各等级标题的 `y` 坐标，
+        以及曲目ID到曲绘左上角坐标的映射
+    """
+    headers: List[int] = []
+    cells: Dict[str, Tuple[int, int]] = {}
+    y = 245
+    for _, ids in groups:
+        if ids:
+            y += 15
+        headers.append(y)
+        x = 200
+        for num, music_id in enumerate(ids):
+            if num % 10 == 0:
+                x = 200
+                y += 115
+            else:
+                x += 115
+            cells[music_id] = (x, y)
+    return headers, cells
+
+
+def plate_cells_path(version: str) -> Path:
+    """完成表坐标映射文件路径"""
+    return platedir / f'{version}.cells.json'
+
+
+def plate_marks_path() -> Path:
+    """完成表难度完成标记素材路径"""
+    return platedir / 'marks.png'
+
+
+def build_plate_marks() -> Image.Image:
+    """
+    预先合成全部难度完成标记组合，第 `mask` 帧为 `mask` 二进制位对应难度的 `t-N` 标记叠加，
+    各帧纵向排列，粘贴在曲绘左上角 `(0, 67)` 处
+
+    Returns:
+        `PIL.Image.Image`
+    """
+    marks = [sprite(f't-{n}.png') for n in range(4)]
+    width = 5 + 25 * 3 + max(m.width for m in marks)
+    height = max(m.height for m in marks)
+    im = Image.new('RGBA', (width, height * 16))
+    for mask in range(16):
+        for n in range(4):
+            if mask & (1 << n):
+                im.alpha_composite(marks[n], (5 + 25 * n, height * mask))
+    return im
+
+
+def _render_rating_table(lv: str, groups: RatingGroups, path: Path) -> Tuple[str, float]:
+    """
+    绘制单个等级的定数表，并在旁边写入坐标映射 `{lv}.cells.json`，在工作进程中执行
+
+    Params:
+        `lv`: 等级
+        `groups`: 定数表分组
+        `path`: 保存路径
+    Returns:
+        `Tuple[str, float]` 等级和耗时
+    """
+    _otime = time.perf_counter()
+    if not _assets:
+        _init_table_worker()
+    lines = 0
+    for _, musics in groups:
+        musicnum = len(musics)
+        if musicnum == 0:
+            r = 1
+        else:
+            remainder = musicnum % 14
+            r = (musicnum // 14) + (1 if remainder else 0)
+        lines += r
+
+    if '+' in lv:
+        f = 4
+    elif lv == '6':
+        f = 10
+    else:
+        f = 8
+
+    linesheight = 85 * lines
+    """
+    `85` 为曲绘高度 `80` + 间隔 `5`
+    `lines` 为行数
+    """
+
+    width, height = 1400, 325 + f * 20 + linesheight
+    """
+    `325` 为顶部文字和底部图片高度 + 上下间隔高度
+    `f * 20` 为等级数量 `f` * 等级间隔 `20`
+    `linesheight` 为各等级曲绘和间隔总和高度
+    """
+
+    im = ScoreBaseImage.background(width, height)
+    ts = DrawText(ImageDraw.Draw(im), TBFONT)
+    _draw_footer(im, height)
+    headers, cells = rating_table_layout(groups)
+    for (_lv, musics), y in zip(groups, headers):
+        if _assets['chara_small']:
+            im.alpha_composite(_assets['chara_small'], (50, y + 80))
+        ts.draw(88, y + 120, 35, _lv, anchor='mm')
+        for music_id, music_type, music_lv in musics:
+            x, y = cells[f'{music_id}-{music_lv}']
+            if cover_stamp(music_id):
+                im.alpha_composite(cover_image(music_id, (75, 75)), (x, y))
+            if music_type == 'DX':
+                im.alpha_composite(_assets['dx'], (x + 31, y))
+            im.alpha_composite(_assets[f'diff_{int(music_lv)}'], (x, y + 59))
+            ts.draw(x + 37, y + 67, 13, music_id, ScoreBaseImage.t_color[int(music_lv)], 'mm')
+
+    _save_atomic(im, path)
+    canvas_pool.release(im)
+    _save_atomic(json.dumps(cells), rating_cells_path(lv))
+    return lv, time.perf_counter() - _otime
+
+
+def _render_plate_table(ver: str, groups: PlateGroups, path: Path) -> Tuple[str, float]:
+    """
+    绘制单个版本的完成表，并在旁边写入坐标映射 `{ver}.cells.json`，在工作进程中执行
+
+    Params:
+        `ver`: 版本
+        `groups`: 完成表分组，已按定数排序
+        `path`: 保存路径
+    Returns:
+        `Tuple[str, float]` 版本和耗时
+    """
+    _otime = time.perf_counter()
+    if not _assets:
+        _init_table_worker()
+    lines = 0
+    interval = 0
+    for _, ids in groups:
+        musicnum = len(ids)
+        if musicnum == 0:
+            continue
+        interval += 1
+        remainder = musicnum % 10
+        lines += (musicnum // 10) + (1 if remainder else 0)
 
+    linesheight = 115 * lines + (interval - 1) * 15
+    """
+    `linesheight`: 各等级曲绘和间隔总和高度
 
-async def update_rating_table() -> str:
-    """更新定数表"""
+        - `115` 为曲绘高度 `100` + 间隔 `15`
+        - `lines` 为行数
+        - `interval` 为各等级间隔行数
+        - `(interval - 1) * 15` 为各等级间隔高度，各等级之间间隔为 `30`，所以只加 `15`
+    """
+    width, height = 1400, 150 + linesheight + 360
+    """
+    `150` 为底部图片 `design` 高度 + 上下间隔高度
+    `linesheight` 为各等级曲绘和间隔总和高度
+    `360` 为顶部图片 `` 高度 + 上下间隔高度
+    """
+
+    im = ScoreBaseImage.background(width, height)
+    ts = DrawText(ImageDraw.Draw(im), TBFONT)
+    _draw_footer(im, height)
+    headers, cells = plate_table_layout(groups)
+    for (r, ids), y in zip(groups, headers):
+        if ids:
+            if _assets['chara']:
+                im.alpha_composite(_assets['chara'], (65, y + 115))
+            ts.draw(113, y + 164, 35, r, anchor='mm')
+        for music_id in ids:
+            x, y = cells[music_id]
+            if cover_stamp(music_id):
+                im.alpha_composite(cover_image(music_id, (100, 100)), (x, y))
+            im.alpha_composite(_assets['id_bg'], (x, y + 80))
+            ts.draw(x + 50, y + 88, 20, music_id, anchor='mm')
+
+    _save_atomic(im, path)
+    canvas_pool.release(im)
+    _save_atomic(json.dumps(cells), plate_cells_path(ver))
+    return ver, time.perf_counter() - _otime
+
+
+async def _run_table_jobs(
+    jobs: List[Tuple[Callable[..., Tuple[str, float]], tuple]],
+    label: str,
+    max_workers: Optional[int] = None
+) -> Tuple[float, List[str]]:
+    """
+    将表格绘制任务分发到进程池，每完成一个任务输出一次进度
+
+    Params:
+        `jobs`: `(绘制函数, 参数)` 列表，参数第一项为表格名称
+        `label`: 进度输出中的表格名称
+        `max_workers`: 进程数，默认为 CPU 核心数
+    Returns:
+        `Tuple[float, List[str]]` 总耗时（秒）和绘制成功的表格名称
+    """
+    _otime = time.perf_counter()
+    total = len(jobs)
+    if not total:
+        return 0, []
+    done: List[str] = []
+    workers = min(max_workers or os.cpu_count() or 1, total)
+    loop = asyncio.get_running_loop()
+    # 插件进程中有绘图线程、锁和事件循环，`fork` 可能复制被其它线程持有的锁导致工作进程死锁
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_table_worker)
     try:
-        dx_img = Image.open(maimaidir / 'DX.png') if (maimaidir / 'DX.png').exists() else None
-        dx = dx_img.convert('RGBA').resize((44, 16)) if dx_img else Image.new('RGBA', (44, 16))
-        diff = [Image.new('RGBA', (75, 16), color) for color in ScoreBaseImage.bg_color]
-        atime = 0
+        futures = [loop.run_in_executor(pool, func, *args) for func, args in jobs]
+        for n, future in enumerate(asyncio.as_completed(futures), 1):
+            try:
+                name, cost = await future
+            except Exception:
+                print(traceback.format_exc())
+                print(f'[{n}/{total}] {label}更新失败')
+                continue
+            done.append(name)
+            print(f'[{n}/{total}] {name} {label}更新完成，耗时：{cost:.2f}s')
+    finally:
+        # 不在事件循环中等待工作进程退出；被取消时尚未开始的任务直接取消，已开始的任务在后台跑完
+        pool.shutdown(wait=False, cancel_futures=True)
+    return time.perf_counter() - _otime, done
+
+
+async def _update_tables(
+    directory: Path,
+    tables: Dict[str, Tuple[Callable[..., Tuple[str, float]], tuple, str]],
+    label: str,
+    outputs: Callable[[str], List[str]],
+    force: bool,
+    max_workers: Optional[int]
+) -> str:
+    """
+    对比 `manifest.json` 中的输入哈希，只重新绘制输入发生变化或图片缺失的表格
+
+    Params:
+        `directory`: 表格目录
+        `tables`: 表格名称与 `(绘制函数, 参数, 输入哈希)`
+        `label`: 表格名称
+        `outputs`: 根据表格名称返回其输出文件名
+        `force`: 是否忽略哈希强制全部重新绘制
+        `max_workers`: 进程数
+    Returns:
+        `str`
+    """
+    manifest = {} if force else _load_manifest(directory)
+    jobs = []
+    for name, (func, args, digest) in tables.items():
+        if manifest.get(name) == digest and all((directory / f).exists() for f in outputs(name)):
+            continue
+        jobs.append((func, args))
+    if not jobs:
+        print(f'{label}无变化，跳过更新')
+        return f'{label}无变化，无需更新'
+    atime, done = await _run_table_jobs(jobs, label, max_workers)
+    manifest = {name: digest for name, (_, _, digest) in tables.items() if manifest.get(name) == digest}
+    manifest.update({name: tables[name][2] for name in done})
+    _save_manifest(directory, manifest)
+    result = f'{label}更新完成，重新绘制 {len(done)}/{len(tables)} 张，共耗时{atime:.2f}s'
+    if len(done) < len(jobs):
+        result += f'，{len(jobs) - len(done)} 张绘制失败'
+    print(result)
+    return result
+
+
+async def update_rating_table(force: bool = False, max_workers: Optional[int] = None) -> str:
+    """
+    更新定数表，只重新绘制输入发生变化的等级，各等级在进程池中并行绘制
+
+    Params:
+        `force`: 是否强制全部重新绘制
+        `max_workers`: 进程数，默认为 CPU 核心数
+    Returns:
+        `str`
+    """
+    def build() -> Dict[str, Tuple[Callable[..., Tuple[str, float]], tuple, str]]:
+        tables = {}
         for lv in levelList[6:]:
-            _otime = time.time()
-            picname = ratingdir / f'{lv}.png'
             lvlist = mai.total_level_data[lv]
-            lines = 0
-            for _lv in lvlist:
-                musicnum = len(lvlist[_lv])
-                if musicnum == 0:
-                    r = 1
-                else:
-                    remainder = musicnum % 14
-                    r = (musicnum // 14) + (1 if remainder else 0)
-                lines += r
-
-            if '+' in lv:
-                f = 4
-            elif lv == '6':
-                f = 10
-            else:
-                f = 8
-
-            linesheight = 85 * lines
-            """
-            `85` 为曲绘高度 `80` + 间隔 `5`
-            `lines` 为行数
-            """
-            
-            width, height = 1400, 325 + f * 20 + linesheight
-            """
-            `325` 为顶部文字和底部图片高度 + 上下间隔高度
-            `f * 20` 为等级数量 `f` * 等级间隔 `20`
-            `linesheight` 为各等级曲绘和间隔总和高度
-            """
-            
-            im = tricolor_gradient(width, height)
-            
-            aurora_bg = ScoreBaseImage.aurora_bg if ScoreBaseImage.aurora_bg else Image.new('RGBA', (1400, 220))
-            shines_bg = ScoreBaseImage.shines_bg if ScoreBaseImage.shines_bg else Image.new('RGBA', (1400, 220))
-            rainbow_bg = ScoreBaseImage.rainbow_bg if ScoreBaseImage.rainbow_bg else Image.new('RGBA', (1400, 220))
-            rainbow_bottom_bg = ScoreBaseImage.rainbow_bottom_bg if ScoreBaseImage.rainbow_bottom_bg else Image.new('RGBA', (1200, 200))
-            im.alpha_composite(aurora_bg)
-            im.alpha_composite(shines_bg, (34, 0))
-            im.alpha_composite(rainbow_bg, (319, height - 643))
-            im.alpha_composite(rainbow_bottom_bg, (100, height - 343))
-            for h in range((height // 358) + 1):
-                pattern = ScoreBaseImage.pattern_bg
-                if pattern is None:
-                    pattern = Image.new('RGBA', (1400, 365), (0,0,0,0))
-                im.alpha_composite(pattern, (0, (358 + 7) * h))
-
-            dr = ImageDraw.Draw(im)
-            sy = DrawText(dr, SIYUAN)
-            ts = DrawText(dr, TBFONT)
-            design_img = Image.open(maimaidir / 'design.png') if (maimaidir / 'design.png').exists() else None
-            if design_img:
-                im.alpha_composite(design_img, (200, height - 113))
-            sy.draw(
-                700, 
-                height - 70, 
-                22, 
-                f'Designed by Yuri-YuzuChaN & BlueDeer233. Adapted by AbyssSeeker', 
-                ScoreBaseImage.text_color, 
-                'mm'
-            )
-            y = 100
-            for _lv in lvlist: 
-                x = 160
-                y += 20
-                chara_img = Image.open(maimaidir / 'UI_CMN_Chara_Level_S_01.png') if (maimaidir / 'UI_CMN_Chara_Level_S_01.png').exists() else None
-                if chara_img:
-                    im.alpha_composite(chara_img.resize((80, 80)), (50, y + 80))
-                ts.draw(88, y + 120, 35, _lv, anchor='mm')
-                for num, music in enumerate(lvlist[_lv]):
-                    if num % 14 == 0:
-                        x = 160
-                        y += 85
-                    else:
-                        x += 85
-                    cover_img = Image.open(music_picture(music.id)) if Path(music_picture(music.id)).exists() else None
-                    if cover_img:
-                        im.alpha_composite(cover_img.resize((75, 75)), (x, y))
-                    if music.type == 'DX':
-                        im.alpha_composite(dx, (x + 31, y))
-                    im.alpha_composite(diff[int(music.lv)], (x, y + 59))
-                    ts.draw(x + 37, y + 67, 13, music.id, ScoreBaseImage.t_color[int(music.lv)], 'mm')
-                if not lvlist[_lv]:
-                    y += 85
-
-            by = BytesIO()
-            im.save(by, 'PNG')
-            async with aiofiles.open(picname, 'wb') as f:
-                await f.write(by.getbuffer())
-            _ntime = int(time.time() - _otime)
-            atime += _ntime
-            print(f'lv.{lv} 定数表更新完成，耗时：{_ntime}s')
-        print(f'定数表更新完成，共耗时{atime}s')
-        return f'定数表更新完成，共耗时{atime}s'
+            groups = rating_table_groups(lv)
+            digest = _table_hash(lv, [[m.id, m.type, m.lv, m.ds, _lv] for _lv in lvlist for m in lvlist[_lv]])
+            tables[lv] = (_render_rating_table, (lv, groups, ratingdir / f'{lv}.png'), digest)
+        return tables
+
+    try:
+        # 输入哈希需要读取每张曲绘的版本标识，在线程中计算，不阻塞事件循环
+        tables = await asyncio.to_thread(build)
+        return await _update_tables(
+            ratingdir, tables, '定数表', lambda lv: [f'{lv}.png', f'{lv}.cells.json'], force, max_workers
+        )
     except Exception as e:
         print(traceback.format_exc())
         return f'定数表更新失败，Error: {e}'
 
 
-async def update_plate_table() -> str:
-    """更新完成表"""
-    try:
+async def update_plate_table(force: bool = False, max_workers: Optional[int] = None) -> str:
+    """
+    更新完成表，只重新绘制输入发生变化的版本，各版本在进程池中并行绘制
+
+    Params:
+        `force`: 是否强制全部重新绘制
+        `max_workers`: 进程数，默认为 CPU 核心数
+    Returns:
+        `str`
+    """
+    def build() -> Dict[str, Tuple[Callable[..., Tuple[str, float]], tuple, str]]:
         version = list(_ for _ in plate_to_dx_version.keys())[1:]
         # version.append('霸')
         # version.append('舞')
-        id_bg = Image.new('RGBA', (100, 20), (124, 129, 255, 255))
-        rlv: Dict[str, List[Music]] = {}
-        for _ in list(reversed(levelList)):
-            rlv[_] = []
+        if force or not plate_marks_path().exists():
+            _save_atomic(build_plate_marks(), plate_marks_path())
+        tables = {}
         for _v in version:
             if _v in platecn:
                 _v = platecn[_v]
-            ver, _ver = version_map.get(_v, ([plate_to_dx_version.get(_v)], _v))
-            
-            music_id_list = mai.total_plate_id_list[_ver]
-            music = mai.total_list.by_id_list(music_id_list)
-            ralv = copy.deepcopy(rlv)
-
-            for m in music:
-                ralv[m.level[3]].append(m)
-
-            lines = 0
-            interval = 0
-            for _ in ralv:
-                musicnum = len(ralv[_])
-                if musicnum == 0:
-                    continue
-                interval += 1
-                remainder = musicnum % 10
-                lines += (musicnum // 10) + (1 if remainder else 0)
-            
-            linesheight = 115 * lines + (interval - 1) * 15
-            """
-            `linesheight`: 各等级曲绘和间隔总和高度
-            
-                - `115` 为曲绘高度 `100` + 间隔 `15`
-                - `lines` 为行数
-                - `interval` 为各等级间隔行数
-                - `(interval - 1) * 15` 为各等级间隔高度，各等级之间间隔为 `30`，所以只加 `15`
-            """
-            width, height = 1400, 150 + linesheight + 360
-            """
-            `150` 为底部图片 `design` 高度 + 上下间隔高度
-            `linesheight` 为各等级曲绘和间隔总和高度
-            `360` 为顶部图片 `` 高度 + 上下间隔高度
-            """
-
-            im = tricolor_gradient(width, height)
-            
-            aurora_bg = ScoreBaseImage.aurora_bg if ScoreBaseImage.aurora_bg else Image.new('RGBA', (1400, 220))
-            shines_bg = ScoreBaseImage.shines_bg if ScoreBaseImage.shines_bg else Image.new('RGBA', (1400, 220))
-            rainbow_bg = ScoreBaseImage.rainbow_bg if ScoreBaseImage.rainbow_bg else Image.new('RGBA', (1400, 220))
-            rainbow_bottom_bg = ScoreBaseImage.rainbow_bottom_bg if ScoreBaseImage.rainbow_bottom_bg else Image.new('RGBA', (1200, 200))
-            im.alpha_composite(aurora_bg)
-            im.alpha_composite(shines_bg, (34, 0))
-            im.alpha_composite(rainbow_bg, (319, height - 643))
-            im.alpha_composite(rainbow_bottom_bg, (100, height - 343))
-            for h in range((height // 358) + 1):
-                pattern = ScoreBaseImage.pattern_bg
-                if pattern is None:
-                    pattern = Image.new('RGBA', (1400, 365), (0,0,0,0))
-                im.alpha_composite(pattern, (0, (358 + 7) * h))
-            
-            dr = ImageDraw.Draw(im)
-            ts = DrawText(dr, TBFONT)
-            sy = DrawText(dr, SIYUAN)
-            design_img = Image.open(maimaidir / 'design.png') if (maimaidir / 'design.png').exists() else None
-            if design_img:
-                im.alpha_composite(design_img, (200, height - 113))
-            sy.draw(
-                700, 
-                height - 70, 
-                22, 
-                f'Designed by Yuri-YuzuChaN & BlueDeer233. Adapted by AbyssSeeker', 
-                ScoreBaseImage.text_color, 
-                'mm'
-            )
-            y = 245
-            for r in ralv:
-                if _v in ['霸', '舞']:
-                    ralv[r].sort(key=lambda x: x.ds[-1], reverse=True)
-                else:
-                    ralv[r].sort(key=lambda x: x.ds[3], reverse=True)
-                if ralv[r]:
-                    y += 15
-                    chara_img = Image.open(maimaidir / 'UI_CMN_Chara_Level_S_01.png') if (maimaidir / 'UI_CMN_Chara_Level_S_01.png').exists() else None
-                    if chara_img:
-                        im.alpha_composite(chara_img, (65, y + 115))
-                    ts.draw(113, y + 164, 35, r, anchor='mm')
-                x = 200
-                for num, music in enumerate(ralv[r]):
-                    if num % 10 == 0:
-                        x = 200
-                        y += 115
-                    else:
-                        x += 115
-                    cover_path = music_picture(music.id)
-                    cover_img = Image.open(cover_path) if Path(cover_path).exists() else None
-                    if cover_img:
-                        im.alpha_composite(cover_img.resize((100, 100)), (x, y))
-                    im.alpha_composite(id_bg, (x, y + 80))
-                    ts.draw(x + 50, y + 88, 20, music.id, anchor='mm')
-
-            by = BytesIO()
-            im.save(by, 'PNG')
-            async with aiofiles.open(platedir / f'{_v}.png', 'wb') as f:
-                await f.write(by.getbuffer())
-            print(f'{_v}代牌子更新完成')
-        return f'完成表更新完成'
+            ralv = plate_table_musics(_v)
+            groups: PlateGroups = [(r, [m.id for m in ralv[r]]) for r in ralv]
+            charts = [[m.id, r, m.ds] for r in ralv for m in ralv[r]]
+            tables[_v] = (_render_plate_table, (_v, groups, platedir / f'{_v}.png'), _table_hash(_v, charts))
+        return tables
+
+    try:
+        # 输入哈希需要读取每张曲绘的版本标识，在线程中计算，不阻塞事件循环
+        tables = await asyncio.to_thread(build)
+        return await _update_tables(
+            platedir, tables, '完成表', lambda v: [f'{v}.png', f'{v}.cells.json'], force, max_workers
+        )
     except Exception as e:
         print(traceback.format_exc())
-        return f'完成表更新失败，Error: {e}'
\ No newline at end of file
+        return f'完成表更新失败，Error: {e}'
@@ -0,0 +1,207 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from .config import plate_to_dx_version
+from .maimai_best_50 import computeRa, fillRa, load_dev_records, new_song_ids
+from .maimaidx_api_data import maiApi
+from .maimaidx_model import ChartInfo, PlayInfoDefault
+from .maimaidx_music import mai
+
+ChartKey = Tuple[int, int]
+"""`(曲目 ID, 难度)`"""
+
+
+class _TopK:
+
+    def __init__(self, size: int) -> None:
+        """
+        保留底分最高的 `size` 个谱面，入选谱面按 `(底分, 成绩)` 升序保存，首项为入选线
+
+        Params:
+            `size`: 入选数量
+        """
+        self.size = size
+        self.total = 0
+        self.members: Dict[ChartKey, Tuple[int, float]] = {}
+        self._sorted: List[Tuple[int, float, ChartKey]] = []
+
+    def _member(self, key: ChartKey) -> Optional[Tuple[int, float]]:
+        return self.members.get(key)
+
+    def _count(self) -> int:
+        return len(self.members)
+
+    def _floor(self) -> Tuple[int, float, ChartKey]:
+        return self._sorted[0]
+
+    def _drop(self, key: ChartKey, value: Tuple[int, float]) -> None:
+        del self.members[key]
+        del self._sorted[bisect_left(self._sorted, (*value, key))]
+
+    def _add(self, key: ChartKey, value: Tuple[int, float]) -> None:
+        self.members[key] = value
+        insort(self._sorted, (*value, key))
+
+    def push(self, key: ChartKey, ra: int, achievement: float) -> int:
+        """
+        提交谱面的新成绩，成绩只会提高
+
+        Params:
+            `key`: 谱面
+            `ra`: 新底分
+            `achievement`: 新成绩
+        Returns:
+            `int` 总底分变化
+        """
+        if (old := self._member(key)) is not None:
+            delta = ra - old[0]
+            self._drop(key, old)
+        elif self._count() < self.size:
+            delta = ra
+        else:
+            low_ra, low_achievement, low_key = self._floor()
+            if (ra, achievement) <= (low_ra, low_achievement):
+                return 0
+            self._drop(low_key, (low_ra, low_achievement))
+            delta = ra - low_ra
+        self._add(key, (ra, achievement))
+        self.total += delta
+        return delta
+
+    def ranked(self) -> List[Tuple[ChartKey, int, float]]:
+        """按底分从高到低排列的入选谱面"""
+        return [(k, ra, a) for ra, a, k in reversed(self._sorted)]
+
+
+class _Overlay(_TopK):
+
+    def __init__(self, base: _TopK) -> None:
+        """
+        叠加在 `base` 上的假设成绩，只记录新入选和被挤出的谱面，不复制也不修改 `base`
+
+        Params:
+            `base`: 当前的入选谱面
+        """
+        self.base = base
+        self.size = base.size
+        self.total = base.total
+        self.members: Dict[ChartKey, Tuple[int, float]] = {}
+        self._sorted: List[Tuple[int, float, ChartKey]] = []
+        self._removed: Set[ChartKey] = set()
+        self._low = 0
+
+    def _member(self, key: ChartKey) -> Optional[Tuple[int, float]]:
+        if key in self.members:
+            return self.members[key]
+        if key in self._removed:
+            return None
+        return self.base.members.get(key)
+
+    def _count(self) -> int:
+        return len(self.base.members) - len(self._removed) + len(self.members)
+
+    def _floor(self) -> Tuple[int, float, ChartKey]:
+        # `base` 中被挤出的谱面只会增加，跳过的位置不必回退
+        base = self.base._sorted
+        while self._low < len(base) and base[self._low][2] in self._removed:
+            self._low += 1
+        candidates = []
+        if self._low < len(base):
+            candidates.append(base[self._low])
+        if self._sorted:
+            candidates.append(self._sorted[0])
+        return min(candidates)
+
+    def _drop(self, key: ChartKey, value: Tuple[int, float]) -> None:
+        if key in self.members:
+            _TopK._drop(self, key, value)
+        else:
+            self._removed.add(key)
+
+
+class RatingModel:
+
+    def __init__(self, records: Sequence[Union[ChartInfo, PlayInfoDefault]], new_ids: Optional[Set[int]] = None) -> None:
+        """
+        玩家 Rating 模型，分别保留 B35 和 B15，用于计算假设成绩带来的 Rating 变化。
+        提交一个成绩只涉及入选的 50 个谱面，开销与成绩总数无关
+
+        Params:
+            `records`: 玩家成绩，需包含定数
+            `new_ids`: 当前版本的曲目 ID，默认为 `new_song_ids()`
+        """
+        self.new_ids = new_song_ids() if new_ids is None else new_ids
+        self.b35 = _TopK(35)
+        self.b15 = _TopK(15)
+        self.best: Dict[ChartKey, Tuple[int, float]] = {}
+        records = [r for r in records if r.song_id < 100000]
+        fillRa(records, [r.ds for r in records])
+        for r in records:
+            self._push((r.song_id, r.level_index), r.ra, r.achievements)
+
+    @property
+    def rating(self) -> int:
+        return self.b35.total + self.b15.total
+
+    def _push(self, key: ChartKey, ra: int, achievement: float) -> int:
+        if (old := self.best.get(key)) is not None and (ra, achievement) <= old:
+            return 0
+        self.best[key] = (ra, achievement)
+        return (self.b15 if key[0] in self.new_ids else self.b35).push(key, ra, achievement)
+
+    def apply(self, song_id: int, level_index: int, ds: float, achievement: float) -> int:
+        """
+        提交一个成绩，低于已有成绩时不产生变化
+
+        Params:
+            `song_id`: 曲目 ID
+            `level_index`: 难度
+            `ds`: 定数
+            `achievement`: 成绩
+        Returns:
+            `int` Rating 变化
+        """
+        return self._push((int(song_id), level_index), computeRa(ds, achievement), achievement)
+
+    def what_if(self, hypotheses: Iterable[Tuple[int, int, float, float]]) -> Tuple[int, List[int]]:
+        """
+        依次提交一组假设成绩，假设成绩记录在叠加层中，不复制也不修改当前模型
+
+        Params:
+            `hypotheses`: `(曲目 ID, 难度, 定数, 成绩)` 列表
+        Returns:
+            `Tuple[int, List[int]]` 提交全部成绩后的 Rating 和每个成绩带来的变化
+        """
+        b35, b15 = _Overlay(self.b35), _Overlay(self.b15)
+        best: Dict[ChartKey, Tuple[int, float]] = {}
+        deltas = []
+        for song_id, level_index, ds, achievement in hypotheses:
+            key = (int(song_id), level_index)
+            value = (computeRa(ds, achievement), achievement)
+            if (old := best.get(key, self.best.get(key))) is not None and value <= old:
+                deltas.append(0)
+                continue
+            best[key] = value
+            deltas.append((b15 if key[0] in self.new_ids else b35).push(key, *value))
+        return b35.total + b15.total, deltas
+
+
+async def load_rating_model(username: Optional[str]) -> RatingModel:
+    """
+    获取玩家成绩并建立 Rating 模型，有开发者 `token` 时使用全部成绩，否则使用各版本成绩
+
+    Params:
+        `username`: 查分器用户名
+    Returns:
+        `RatingModel`
+    """
+    if maiApi.token:
+        records = (await load_dev_records(username)).records or []
+    else:
+        version = list(set(plate_to_dx_version.values()))
+        records = await maiApi.query_user_plate(username=username, version=version)
+        musics = {int(m.id): m for m in mai.total_list}
+        records = [r for r in records if r.song_id in musics]
+        for r in records:
+            r.ds = musics[r.song_id].ds[r.level_index]
+    return RatingModel(records)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from .config import recorddir
+from .maimaidx_model import UserInfoDev
+
+
+class RecordStore:
+
+    def __init__(self, directory: Path) -> None:
+        """
+        本地成绩库，保存每个玩家最近一次通过开发者接口获取的全部成绩，
+        用于在有效期内跳过重复请求，以及查分器不可用时离线生成 B50
+
+        Params:
+            `directory`: 保存目录
+        """
+        self.directory = directory
+
+    def _path(self, username: Optional[str]) -> Path:
+        digest = hashlib.sha1((username or '').encode()).hexdigest()[:20]
+        return self.directory / f'{digest}.json'
+
+    def save(self, username: Optional[str], info: UserInfoDev) -> None:
+        """
+        保存玩家成绩，原子写入
+
+        Params:
+            `username`: 查分器用户名
+            `info`: 开发者用户信息
+        """
+        path = self._path(username)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_text(json.dumps(info.dict(by_alias=True), ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def load(self, username: Optional[str], max_age: Optional[float] = None) -> Optional[UserInfoDev]:
+        """
+        读取玩家成绩
+
+        Params:
+            `username`: 查分器用户名
+            `max_age`: 有效期（秒），为 `None` 时不限
+        Returns:
+            `Optional[UserInfoDev]` 没有保存或已过期时返回 `None`
+        """
+        path = self._path(username)
+        try:
+            if max_age is not None and time.time() - path.stat().st_mtime > max_age:
+                return None
+            return UserInfoDev.parse_obj(json.loads(path.read_text(encoding='utf-8')))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f'[成绩库] 无法读取 {path.name}: {e}')
+            return None
+
+
+record_store = RecordStore(recorddir)
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from .maimaidx_error import RenderQueueFullError, RenderTimeoutError
+
+T = TypeVar('T')
+
+
+class RenderExecutor:
+    
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_processes: int = 0,
+        max_queue: int = 32,
+        timeout: float = 60
+    ) -> None:
+        """
+        绘图执行器，所有 PIL 绘图都在线程池（或进程池）中执行，避免阻塞事件循环
+        
+        Params:
+            `max_workers`: 线程池大小，默认为 `min(4, CPU 核心数)`
+            `max_processes`: 进程池大小，为 `0` 时不启用进程池
+            `max_queue`: 排队和执行中的任务上限，超出时直接拒绝
+            `timeout`: 单个任务默认超时时间（秒）
+        """
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_processes = max_processes
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """排队和执行中的任务数量"""
+        return self._pending
+
+    def _executor(self, process: bool) -> Executor:
+        if process and self.max_processes > 0:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_processes)
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(
+                max_workers=self.max_workers, 
+                thread_name_prefix='maimaidx-render'
+            )
+        return self._threads
+
+    async def run(
+        self, 
+        func: Callable[..., T], 
+        *args: Any, 
+        timeout: Optional[float] = None, 
+        process: bool = False, 
+        **kwargs: Any
+    ) -> T:
+        """
+        在执行器中运行绘图函数
+        
+        超时或调用方被取消时，尚未开始的任务会被一并取消；已经开始的任务会在后台跑完，结果被丢弃。
+        任务在执行器中真正结束（完成或被取消）后才释放排队名额，超时后仍在执行的任务继续计入 `max_queue`
+        
+        Params:
+            `func`: 绘图函数
+            `args`: 位置参数
+            `timeout`: 超时时间（秒），为 `None` 时使用默认值
+            `process`: 是否优先使用进程池，`func` 和参数必须可被 `pickle`
+            `kwargs`: 关键字参数
+        Returns:
+            `func` 的返回值
+        """
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise RenderQueueFullError
+            self._pending += 1
+        try:
+            job = self._executor(process).submit(partial(func, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        job.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            raise RenderTimeoutError
+
+    def _release(self, _: Any = None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        """关闭线程池和进程池，未开始的任务会被取消"""
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+
+class SingleFlight:
+
+    def __init__(self) -> None:
+        """合并相同键的并发任务，同一时刻每个键只执行一次，结果分发给所有等待方"""
+        self._inflight: Dict[Hashable, 'asyncio.Task[Any]'] = {}
+
+    @property
+    def inflight(self) -> int:
+        """正在执行的任务数量"""
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行任务，已有相同键的任务在执行时直接等待其结果
+        
+        任务在独立的 `Task` 中执行，任一等待方被取消不会影响其它等待方
+        
+        Params:
+            `key`: 任务键
+            `factory`: 创建任务的函数，只有在没有相同键的任务时才会被调用
+        Returns:
+            任务结果，任务抛出的异常会传给所有等待方
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+renderer = RenderExecutor()
+singleflight = SingleFlight()
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from PIL import Image
+
+from .image import canvas_pool, encode_image
+from .maimaidx_music import mai
+from .render import SingleFlight, renderer
+
+
+class RenderCache:
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[Path] = None,
+        disk_max_bytes: int = 256 * 1024 * 1024
+    ) -> None:
+        """
+        绘图结果缓存，以 `(绘图名称, 参数, 曲库数据版本)` 为键保存编码后的图片，
+        分为内存和可选的磁盘两层，均按最近最少使用淘汰
+
+        Params:
+            `max_bytes`: 内存层容量上限
+            `disk_dir`: 磁盘层目录，为 `None` 时不启用磁盘层
+            `disk_max_bytes`: 磁盘层容量上限
+        """
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_dir: Optional[Path] = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        if disk_dir is not None:
+            self.enable_disk(disk_dir, disk_max_bytes)
+
+    def enable_disk(self, disk_dir: Path, max_bytes: int) -> None:
+        """
+        启用磁盘层，已有的缓存文件会被保留
+
+        Params:
+            `disk_dir`: 磁盘层目录
+            `max_bytes`: 磁盘层容量上限
+        """
+        disk_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._disk_dir = disk_dir
+            self.disk_max_bytes = max_bytes
+            self._disk_bytes = sum(f.stat().st_size for f in disk_dir.glob('*.bin'))
+            self._evict_disk()
+
+    @staticmethod
+    def key(name: str, *args: Any) -> str:
+        """
+        生成缓存键，曲库数据更新后所有旧键自动失效
+
+        Params:
+            `name`: 绘图名称
+            `args`: 决定绘图结果的参数，需有稳定的 `repr`
+        Returns:
+            `str`
+        """
+        return hashlib.sha1(repr((name, args, mai.version)).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        读取缓存，内存层未命中时读取磁盘层并回填内存层
+
+        Params:
+            `key`: 缓存键
+        Returns:
+            `Optional[bytes]`
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            if self._disk_dir is None:
+                return None
+            path = self._disk_dir / f'{key}.bin'
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        写入缓存
+
+        Params:
+            `key`: 缓存键
+            `data`: 编码后的图片
+        """
+        self._put_memory(key, data)
+        if self._disk_dir is None or len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_dir / f'{key}.bin'
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            tmp.write_bytes(data)
+            # 同名文件可能已由本进程或共用目录的其它进程写入，覆盖前先扣除其大小
+            try:
+                old = path.stat().st_size
+            except FileNotFoundError:
+                old = 0
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._disk_bytes += len(data) - old
+            self._evict_disk()
+
+    def clear(self) -> None:
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._disk_dir is not None:
+                for f in self._disk_dir.glob('*.bin'):
+                    f.unlink(missing_ok=True)
+                self._disk_bytes = 0
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if (old := self._memory.pop(key, None)) is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_bytes:
+                _, old = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old)
+
+    def _evict_disk(self) -> None:
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+        files = sorted(self._disk_dir.glob('*.bin'), key=lambda f: f.stat().st_mtime)
+        for f in files:
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            size = f.stat().st_size
+            f.unlink(missing_ok=True)
+            self._disk_bytes -= size
+
+    async def render(
+        self,
+        name: str,
+        key: Tuple[Any, ...],
+        func: Callable[..., Any],
+        *args: Any,
+        kind: str = 'default',
+        **kwargs: Any
+    ) -> Union[bytes, str]:
+        """
+        读取缓存，未命中时绘制并编码后写入缓存。绘图返回的文本（如错误信息）不会被缓存
+        
+        同一时刻相同键的请求只会绘制一次，所有请求共享同一个结果
+
+        Params:
+            `name`: 绘图名称
+            `key`: 决定绘图结果的参数
+            `func`: 绘图函数，同步函数会在绘图执行器中运行
+            `args`: 绘图函数位置参数
+            `kind`: 图片类型，决定编码格式，见 `encode_profiles`
+            `kwargs`: 绘图函数关键字参数
+        Returns:
+            `Union[bytes, str]` 编码后的图片或绘图返回的文本
+        """
+        cache_key = self.key(name, *key)
+        if (data := self.get(cache_key)) is not None:
+            return data
+        return await self._flight.do(cache_key, lambda: self._render(name, cache_key, func, args, kwargs, kind))
+
+    async def _render(
+        self,
+        name: str,
+        cache_key: str,
+        func: Callable[..., Any],
+        args: Tuple[Any, ...],
+        kwargs: Dict[str, Any],
+        kind: str
+    ) -> Union[bytes, str]:
+        if asyncio.iscoroutinefunction(func):
+            result = await func(*args, **kwargs)
+        else:
+            result = await renderer.run(func, *args, **kwargs)
+        if not isinstance(result, Image.Image):
+            return result
+        data = await renderer.run(encode_image, result, kind, name)
+        # 编码后画布不再使用，归还画布池
+        canvas_pool.release(result)
+        self.put(cache_key, data)
+        return data
+
+
+render_cache = RenderCache()
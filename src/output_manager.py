@@ -1,16 +1,169 @@
 import os
 import asyncio
-from typing import Union, Optional
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterable, Union, Optional
 from PIL import Image
 import io
 
+import astrbot.api.message_components as Comp
+from astrbot.api.event import MessageChain
+
+from .libraries.image import canvas_pool, encode_image, image_suffix
+from .libraries.render import renderer
+from .path_manager import OUTPUT_DIR
+
+
+class Spool:
+    """
+    按内容寻址的图片暂存目录
+
+    文件名由图片内容的哈希生成，相同内容只写一次，不同内容不会互相覆盖；
+    超过保留时间或总大小超过上限的文件会被定期清理
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 256 * 1024 * 1024, max_age: int = 3600, interval: int = 60):
+        """
+        Args:
+            directory: 暂存目录
+            max_bytes: 总大小上限
+            max_age: 文件保留时间（秒）
+            interval: 两次清理之间的最短间隔（秒）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self._last_cleanup = 0.0
+        self._lock = threading.Lock()
+
+    def save(self, image: Union[Image.Image, bytes], prefix: str = "image", kind: str = "default") -> Path:
+        """
+        写入暂存目录，传入的图片编码后归还画布池，调用方不可再使用
+
+        Args:
+            image: PIL图片对象，或已编码的图片字节
+            prefix: 文件名前缀，便于辨认
+            kind: 图片类型，决定编码格式，见 `encode_profiles`
+        Returns:
+            Path: 文件路径
+        """
+        if isinstance(image, bytes):
+            data = image
+        else:
+            data = encode_image(image, kind, prefix)
+            # 编码后画布不再使用，归还画布池
+            canvas_pool.release(image)
+        digest = hashlib.sha1(data).hexdigest()[:20]
+        path = self.directory / f"{prefix}-{digest}{image_suffix(data)}"
+        if path.exists():
+            os.utime(path)
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        if time.time() - self._last_cleanup > self.interval:
+            self.cleanup()
+        return path
+
+    async def save_async(self, image: Union[Image.Image, bytes], prefix: str = "image", kind: str = "default") -> Path:
+        """
+        在线程中编码并写入暂存目录，供异步代码调用，参数同 `save`
+        """
+        return await asyncio.to_thread(self.save, image, prefix, kind)
+
+    def cleanup(self, max_age: Optional[int] = None) -> int:
+        """
+        清理过期文件，之后按最近使用时间淘汰直到总大小不超过上限
+
+        Args:
+            max_age: 文件保留时间（秒），为 `None` 时使用默认值
+        Returns:
+            int: 删除的文件数量
+        """
+        if not self._lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_cleanup = now = time.time()
+            max_age = self.max_age if max_age is None else max_age
+            files = []
+            for f in self.directory.glob("*"):
+                try:
+                    stat = f.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, f))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, f in files:
+                if now - mtime <= max_age and total <= self.max_bytes:
+                    break
+                f.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            return removed
+        finally:
+            self._lock.release()
+
+
+spool = Spool(OUTPUT_DIR / "spool")
+
+
 class OutputManager:
     """AstrBot 插件输出管理器"""
     
-    def __init__(self):
-        self.output_dir = "output"
+    def __init__(self, plugin_root: Optional[Path] = None):
+        self.spool = spool if plugin_root is None else Spool(plugin_root / "output" / "spool")
+        self.output_dir = str(self.spool.directory)
         os.makedirs(self.output_dir, exist_ok=True)
     
+    async def encode(self, image: Union[Image.Image, bytes], kind: str = "default") -> bytes:
+        """
+        在绘图执行器中编码图片，已编码的字节原样返回。编码后图片归还画布池，调用方不可再使用
+        
+        Args:
+            image: PIL图片对象，或已编码的图片字节
+            kind: 图片类型，决定编码格式，见 `encode_profiles`
+        Returns:
+            bytes: 编码后的图片
+        """
+        if isinstance(image, bytes):
+            return image
+        data = await renderer.run(encode_image, image, kind)
+        canvas_pool.release(image)
+        return data
+    
+    async def image_component(self, image: Union[Image.Image, bytes], kind: str = "default") -> Comp.Image:
+        """
+        生成图片消息组件，图片以字节直接放入消息链，不经过磁盘
+        
+        Args:
+            image: PIL图片对象，或已编码的图片字节
+            kind: 图片类型，决定编码格式，见 `encode_profiles`
+        Returns:
+            Comp.Image: 图片消息组件
+        """
+        return Comp.Image.fromBytes(await self.encode(image, kind))
+    
+    async def image_result(self, event, image: Union[Image.Image, bytes, str, Path], kind: str = "default"):
+        """
+        生成图片消息结果，供指令处理器 `yield`
+        
+        Args:
+            event: AstrBot 事件对象
+            image: PIL图片对象、已编码的图片字节或图片路径
+            kind: 图片类型，决定编码格式，见 `encode_profiles`
+        Returns:
+            MessageEventResult: 消息结果
+        """
+        if isinstance(image, (str, Path)):
+            return event.image_result(str(image))
+        return event.chain_result([await self.image_component(image, kind)])
+    
     async def send_text(self, event, text: str) -> str:
         """
         发送文本消息
@@ -24,31 +177,70 @@ class OutputManager:
         # 在AstrBot中，直接返回文本即可
         return text
     
-    async def send_image(self, event, image: Image.Image, filename: str, description: str = "") -> str:
+    async def send_image(
+        self, 
+        event, 
+        image: Union[Image.Image, bytes], 
+        filename: str, 
+        description: str = "", 
+        kind: str = "default"
+    ) -> str:
         """
-        发送图片消息
+        发送图片消息，图片以字节直接放入消息链；没有事件对象时写入暂存目录
         
         Args:
-            event: AstrBot 事件对象
-            image: PIL图片对象
-            filename: 文件名
+            event: AstrBot 事件对象，为 `None` 时只写入暂存目录
+            image: PIL图片对象，或已编码的图片字节
+            filename: 文件名，去掉后缀后作为暂存文件名前缀
             description: 图片描述
+            kind: 图片类型，决定编码格式，见 `encode_profiles`
         Returns:
             str: 发送的消息内容
         """
         try:
-            # 保存图片到输出目录
-            filepath = os.path.join(self.output_dir, filename)
-            image.save(filepath)
+            if event is not None:
+                # 图片以字节直接放入消息链发送，不经过磁盘
+                await event.send(MessageChain([await self.image_component(image, kind)]))
+                return f"[图片] {description or filename}"
             
-            # 在AstrBot中，返回图片路径和描述
-            if description:
-                return f"[图片] {description}\n文件路径: {filepath}"
-            else:
-                return f"[图片] {filename}\n文件路径: {filepath}"
+            # 没有事件对象时才需要文件，写入按内容寻址的暂存目录，并发请求不会互相覆盖
+            filepath = await self.spool.save_async(image, os.path.splitext(filename)[0], kind)
+            return f"[图片] {description or filename}\n文件路径: {filepath}"
         except Exception as e:
             return f"图片发送失败: {str(e)}"
     
+    async def send_images(
+        self,
+        event,
+        pages: AsyncIterable[Union[Image.Image, bytes, str]],
+        filename: str,
+        description: str = "",
+        kind: str = "default"
+    ) -> str:
+        """
+        逐页发送分页绘制的图片，每页取到后立即发送，再取下一页
+        
+        Args:
+            event: AstrBot 事件对象
+            pages: 逐页产出图片的异步迭代器，产出文本时原样发送
+            filename: 文件名，第二页起追加页码
+            description: 图片描述
+            kind: 图片类型，决定编码格式，见 `encode_profiles`
+        Returns:
+            str: 发送的消息内容
+        """
+        stem, suffix = os.path.splitext(filename)
+        messages = []
+        n = 0
+        async for page in pages:
+            n += 1
+            if isinstance(page, str):
+                messages.append(page)
+                continue
+            name = filename if n == 1 else f"{stem}_{n}{suffix}"
+            messages.append(await self.send_image(event, page, name, description, kind))
+        return "\n".join(messages)
+    
     async def send_file(self, event, filepath: str, description: str = "") -> str:
         """
         发送文件消息
@@ -68,19 +260,17 @@ class OutputManager:
         else:
             return f"文件不存在: {filepath}"
     
-    def save_image(self, image: Image.Image, filename: str) -> str:
+    def save_image(self, image: Union[Image.Image, bytes], filename: str) -> str:
         """
-        保存图片到输出目录
+        保存图片到暂存目录
         
         Args:
-            image: PIL图片对象
-            filename: 文件名
+            image: PIL图片对象，或已编码的图片字节
+            filename: 文件名，去掉后缀后作为暂存文件名前缀
         Returns:
             str: 保存的文件路径
         """
-        filepath = os.path.join(self.output_dir, filename)
-        image.save(filepath)
-        return filepath
+        return str(self.spool.save(image, os.path.splitext(filename)[0]))
     
     def get_output_path(self, filename: str) -> str:
         """
@@ -91,4 +281,15 @@ class OutputManager:
         Returns:
             str: 完整的文件路径
         """
-        return os.path.join(self.output_dir, filename) 
\ No newline at end of file
+        return os.path.join(self.output_dir, filename)
+    
+    def cleanup_temp_files(self, max_age: Optional[int] = None) -> int:
+        """
+        清理暂存目录中的过期文件
+        
+        Args:
+            max_age: 文件保留时间（秒），为 `None` 时使用默认值
+        Returns:
+            int: 删除的文件数量
+        """
+        return self.spool.cleanup(max_age)
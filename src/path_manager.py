@@ -33,6 +33,9 @@ MAIMAI_DIR = STATIC_DIR / 'mai' / 'pic'
 COVER_DIR = STATIC_DIR / 'mai' / 'cover'
 RATING_DIR = STATIC_DIR / 'mai' / 'rating'
 PLATE_DIR = STATIC_DIR / 'mai' / 'plate'
+SPRITE_PACK_FILE = STATIC_DIR / 'mai' / 'sprites.pack'
+COVER_ARCHIVE_FILE = STATIC_DIR / 'mai' / 'covers.pack'
+RECORD_DIR = STATIC_DIR / 'records'
 
 # 字体路径
 SIYUAN_FONT = STATIC_DIR / 'ResourceHanRoundedCN-Bold.ttf'
@@ -48,7 +51,6 @@ MUSIC_FILE = STATIC_DIR / 'music_data.json'
 CHART_FILE = STATIC_DIR / 'music_chart.json'
 GUESS_FILE = STATIC_DIR / 'group_guess_switch.json'
 GROUP_ALIAS_FILE = STATIC_DIR / 'group_alias_switch.json'
-PIE_HTML_FILE = STATIC_DIR / 'temp_pie.html'
 
 # 帮助图片
 HELP_IMAGE = PLUGIN_ROOT / 'maimaidxhelp.png'
@@ -73,4 +75,5 @@ ensure_path_exists(STATIC_DIR)
 ensure_path_exists(MAIMAI_DIR)
 ensure_path_exists(COVER_DIR)
 ensure_path_exists(RATING_DIR)
-ensure_path_exists(PLATE_DIR) 
\ No newline at end of file
+ensure_path_exists(PLATE_DIR)
+ensure_path_exists(RECORD_DIR) 
\ No newline at end of file
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+测试脚本 - 验证本地成绩生成的 B50 布局
+"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+# 添加当前目录到Python路径
+current_dir = Path(__file__).parent.resolve()
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+from src.libraries import maimai_best_50
+from src.libraries.maimai_best_50 import ScoreBaseImage, best50_from_records
+from src.libraries.maimaidx_model import PlayInfoDev, UserInfoDev
+
+
+class _Canvas:
+    """只记录粘贴位置的画布"""
+
+    def __init__(self):
+        self.positions = []
+
+    def alpha_composite(self, im, dest=(0, 0)):
+        self.positions.append(dest)
+
+
+def _record(song_id, achievements=100.5):
+    return PlayInfoDev(
+        achievements=achievements,
+        level='13',
+        level_index=3,
+        level_label='Master',
+        title=f'song{song_id}',
+        type='DX',
+        ds=13.0,
+        song_id=song_id
+    )
+
+
+def _layout(data, best):
+    image = object.__new__(ScoreBaseImage)
+    image._im = _Canvas()
+    image.whiledraw(data, best)
+    return image._im.positions
+
+
+def test_local_b50_layout(monkeypatch):
+    """本地成绩生成的 B35 从 235 开始，B15 从 1085 开始"""
+    new_ids = set(range(100, 115))
+    chart = SimpleNamespace(notes=[100, 100, 100, 100])
+    monkeypatch.setattr(maimai_best_50, 'new_song_ids', lambda: new_ids)
+    monkeypatch.setattr(
+        maimai_best_50.mai, 'total_list',
+        SimpleNamespace(by_id=lambda _: SimpleNamespace(charts=[chart] * 5)),
+        raising=False
+    )
+    monkeypatch.setattr(ScoreBaseImage, '_score_tile', classmethod(lambda cls, info, dxscore: None))
+
+    records = [_record(i) for i in range(1, 36)] + [_record(i) for i in new_ids]
+    userinfo = best50_from_records(
+        UserInfoDev(additional_rating=0, nickname='test', rating=0, username='test', records=records)
+    )
+
+    sd = _layout(userinfo.charts.sd, True)
+    dx = _layout(userinfo.charts.dx, False)
+    assert len(sd) == 35 and len(dx) == 15
+    assert sd[0] == (16, 235)
+    assert sd[-1] == (16 + 276 * 4, 235 + 114 * 6)
+    assert dx[0] == (16, 1085)
+    assert dx[-1] == (16 + 276 * 4, 1085 + 114 * 2)
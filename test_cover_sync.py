@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+测试脚本 - 使用本地桩服务器验证曲绘同步
+"""
+import asyncio
+import sys
+from io import BytesIO
+from pathlib import Path
+
+# 添加当前目录到Python路径
+current_dir = Path(__file__).parent.resolve()
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from PIL import Image
+
+from src.libraries import cover_sync as cover_sync_module
+from src.libraries import image as image_module
+from src.libraries.cover_sync import CoverSync
+from src.libraries.image import cover_exists
+
+
+class _EmptyArchive:
+    """不含任何曲绘的归档"""
+
+    def exists(self):
+        return False
+
+    def __contains__(self, music_id):
+        return False
+
+    def get(self, music_id):
+        return None
+
+    def stamp(self, music_id):
+        return 0
+
+
+def _png() -> bytes:
+    buf = BytesIO()
+    Image.new('RGBA', (4, 4), (255, 0, 0, 255)).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def _corrupt(data: bytes) -> bytes:
+    """改动 IDAT 块中的一个字节，文件头完好但块校验和不符"""
+    pos = data.index(b'IDAT') + 4
+    return data[:pos] + bytes([data[pos] ^ 0xFF]) + data[pos + 1:]
+
+
+PNG = _png()
+CORRUPT = _corrupt(PNG)
+
+
+async def _sync(directory: Path, ids):
+    """启动桩服务器，按曲绘 ID 返回不同的响应，返回同步结果和每个地址的请求次数"""
+    hits = {}
+    # 每个曲绘依次返回的 (状态码, 内容)，取完后重复最后一项
+    plans = {
+        '00101.png': [(200, PNG)],
+        '00102.png': [(404, b'')],
+        '00103.png': [(500, b''), (200, PNG)],
+        '00104.png': [(200, CORRUPT)],
+    }
+
+    async def handler(request: web.Request) -> web.Response:
+        name = request.match_info['name']
+        n = hits.get(name, 0)
+        hits[name] = n + 1
+        plan = plans.get(name, [(404, b'')])
+        status, body = plan[min(n, len(plan) - 1)]
+        return web.Response(status=status, body=body)
+
+    app = web.Application()
+    app.router.add_get('/{name}', handler)
+    server = TestServer(app)
+    await server.start_server()
+    try:
+        sync = CoverSync(base_url=str(server.make_url('/')), directory=directory, retries=2, backoff=0, timeout=5)
+        done, failed = await sync.sync(ids)
+        return sync, done, failed, hits
+    finally:
+        await server.close()
+
+
+def test_cover_sync(tmp_path, monkeypatch):
+    """200 原子写入，404 不重试，500 后重试成功，损坏的图片被拒绝，同步后缺失列表随之更新"""
+    monkeypatch.setattr(image_module, 'coverdir', tmp_path)
+    monkeypatch.setattr(image_module, 'cover_archive', _EmptyArchive())
+    monkeypatch.setattr(cover_sync_module, 'cover_archive', _EmptyArchive())
+
+    ids = [101, 102, 103, 104]
+    assert not any(cover_exists(_id) for _id in ids)
+
+    sync, done, failed, hits = asyncio.run(_sync(tmp_path, ids))
+
+    assert sorted(done) == [101, 103]
+    assert sorted(failed) == [102, 104]
+
+    # 200：写入完整文件，不留临时文件
+    assert (tmp_path / '101.png').read_bytes() == PNG
+    assert not list(tmp_path.glob('.*.tmp'))
+    # 404：不重试
+    assert hits['00102.png'] == 1
+    # 500 后 200：重试一次后成功
+    assert hits['00103.png'] == 2
+    assert (tmp_path / '103.png').read_bytes() == PNG
+    # 损坏的图片：每次都被 `verify()` 拒绝，重试用尽后失败且不写入
+    assert hits['00104.png'] == sync.retries + 1
+    assert not (tmp_path / '104.png').exists()
+
+    assert cover_exists(101) and cover_exists(103)
+    assert not cover_exists(102) and not cover_exists(104)
+    assert sync.missing(ids) == [102, 104]
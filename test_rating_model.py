@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+测试脚本 - 对照逐项重算验证 Rating 模型的假设成绩
+"""
+import random
+import sys
+from pathlib import Path
+
+# 添加当前目录到Python路径
+current_dir = Path(__file__).parent.resolve()
+if str(current_dir) not in sys.path:
+    sys.path.insert(0, str(current_dir))
+
+from src.libraries.maimai_best_50 import computeRa
+from src.libraries.maimaidx_model import ChartInfo
+from src.libraries.rating_model import RatingModel
+
+NEW_IDS = set(range(60, 90))
+
+
+def _record(song_id, level_index, ds, achievements):
+    return ChartInfo(
+        achievements=achievements,
+        level=str(int(ds)),
+        level_index=level_index,
+        level_label='',
+        title=f'song{song_id}',
+        type='DX',
+        ds=ds,
+        song_id=song_id
+    )
+
+
+def _brute_force(records, hypotheses):
+    """合并全部成绩后重新选出 B35 和 B15"""
+    best = {}
+    for song_id, level_index, ds, achievement in records + hypotheses:
+        key = (song_id, level_index)
+        value = (computeRa(ds, achievement), achievement)
+        if key not in best or value > best[key]:
+            best[key] = value
+    old = sorted((v for k, v in best.items() if k[0] not in NEW_IDS), reverse=True)[:35]
+    new = sorted((v for k, v in best.items() if k[0] in NEW_IDS), reverse=True)[:15]
+    return sum(ra for ra, _ in old) + sum(ra for ra, _ in new)
+
+
+def _snapshot(model):
+    return (
+        model.rating,
+        dict(model.best),
+        dict(model.b35.members), list(model.b35._sorted),
+        dict(model.b15.members), list(model.b15._sorted),
+    )
+
+
+def _check(records, hypotheses):
+    model = RatingModel([_record(*r) for r in records], NEW_IDS)
+    before = _snapshot(model)
+    assert model.rating == _brute_force(records, [])
+
+    rating, deltas = model.what_if(hypotheses)
+    assert rating == _brute_force(records, hypotheses)
+    assert len(deltas) == len(hypotheses)
+    assert sum(deltas) == rating - model.rating
+    # 假设成绩不修改当前模型
+    assert _snapshot(model) == before
+    return model, rating, deltas
+
+
+def _random_chart(rng):
+    return rng.randint(1, 89), rng.randint(0, 4), round(rng.uniform(10, 15), 1)
+
+
+def _random_achievement(rng):
+    if rng.random() < 0.2:
+        return rng.choice([80.0, 97.0, 99.0, 99.5, 100.0, 100.5, 101.0])
+    return round(rng.uniform(80, 101), 4)
+
+
+def test_what_if_matches_brute_force():
+    """随机成绩和随机假设成绩，总 Rating 与逐项重算一致"""
+    rng = random.Random(20261019)
+    for _ in range(3000):
+        records = [(*_random_chart(rng), _random_achievement(rng)) for _ in range(rng.randint(0, 80))]
+        hypotheses = []
+        for _ in range(rng.randint(1, 8)):
+            roll = rng.random()
+            if roll < 0.3 and records:
+                # 已有成绩的谱面
+                song_id, level_index, ds, _ = rng.choice(records)
+            elif roll < 0.5 and hypotheses:
+                # 同一谱面的多个假设成绩
+                song_id, level_index, ds, _ = rng.choice(hypotheses)
+            else:
+                song_id, level_index, ds = _random_chart(rng)
+            hypotheses.append((song_id, level_index, ds, _random_achievement(rng)))
+        _check(records, hypotheses)
+
+
+def test_what_if_replaces_base_member():
+    """假设成绩提高已入选谱面的成绩，只计入底分差值"""
+    records = [(i, 3, 13.0, 99.0) for i in range(1, 41)] + [(i, 3, 13.0, 99.0) for i in range(60, 76)]
+    model, rating, deltas = _check(records, [(1, 3, 13.0, 100.5), (60, 3, 13.0, 100.5)])
+    member = model.b35.members[(1, 3)]
+    assert deltas[0] == computeRa(13.0, 100.5) - member[0] > 0
+    assert deltas[1] == computeRa(13.0, 100.5) - model.b15.members[(60, 3)][0] > 0
+
+
+def test_what_if_duplicate_hypotheses():
+    """同一谱面的多个假设成绩，只有更高的成绩产生变化"""
+    records = [(i, 3, 13.0, 99.0) for i in range(1, 41)]
+    _, _, deltas = _check(records, [(50, 3, 14.0, 100.0), (50, 3, 14.0, 99.0), (50, 3, 14.0, 100.5)])
+    assert deltas[0] > 0
+    assert deltas[1] == 0
+    assert deltas[2] == computeRa(14.0, 100.5) - computeRa(14.0, 100.0)
+    # 先提高已入选谱面，再提交更低的成绩
+    _, _, deltas = _check(records, [(1, 3, 13.0, 100.5), (1, 3, 13.0, 100.0)])
+    assert deltas[0] > 0 and deltas[1] == 0